@@ -0,0 +1,151 @@
+import numpy as np
+import os
+from concurrent.futures import ThreadPoolExecutor
+from scipy.spatial import cKDTree
+from typing import Callable, Dict, Optional, Tuple
+
+
+# Pontos de consulta processados por bloco (limita memória dos sistemas de krigagem)
+CHUNK_SIZE = 4096
+
+
+def spherical(h: np.ndarray, sill: float, range_: float, nugget: float) -> np.ndarray:
+    """Modelo esférico de semivariograma"""
+    r = np.minimum(h / range_, 1.0)
+    return np.where(h > 0, nugget + (sill - nugget) * (1.5 * r - 0.5 * r ** 3), 0.0)
+
+
+def exponential(h: np.ndarray, sill: float, range_: float, nugget: float) -> np.ndarray:
+    """Modelo exponencial de semivariograma (alcance prático = range_)"""
+    return np.where(h > 0, nugget + (sill - nugget) * (1 - np.exp(-3 * h / range_)), 0.0)
+
+
+def gaussian(h: np.ndarray, sill: float, range_: float, nugget: float) -> np.ndarray:
+    """Modelo gaussiano de semivariograma (alcance prático = range_)"""
+    return np.where(h > 0, nugget + (sill - nugget) * (1 - np.exp(-3 * (h / range_) ** 2)), 0.0)
+
+
+VARIOGRAM_MODELS: Dict[str, Callable[..., np.ndarray]] = {
+    'spherical': spherical,
+    'exponential': exponential,
+    'gaussian': gaussian,
+}
+
+
+def _parallel_chunks(n: int, func: Callable[[slice], Tuple[np.ndarray, ...]]) -> Tuple[np.ndarray, ...]:
+    """Executa func em blocos de pontos de consulta usando todos os núcleos"""
+    chunks = [slice(start, min(start + CHUNK_SIZE, n)) for start in range(0, n, CHUNK_SIZE)]
+    if len(chunks) <= 1:
+        return func(slice(0, n))
+
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as pool:
+        parts = list(pool.map(func, chunks))
+    return tuple(np.concatenate(arrays) for arrays in zip(*parts))
+
+
+def _neighbors(
+    tree: cKDTree,
+    points: np.ndarray,
+    k: int,
+    max_distance: Optional[float]
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """k vizinhos mais próximos (opcionalmente limitados por distância) e máscara de validade"""
+    k = min(k, tree.n)
+    distances, indices = tree.query(
+        points,
+        k=k,
+        distance_upper_bound=max_distance if max_distance else np.inf
+    )
+    distances = distances.reshape(len(points), k)
+    indices = indices.reshape(len(points), k)
+    valid = np.isfinite(distances)
+    return distances, np.where(valid, indices, 0), valid
+
+
+def idw(
+    tree: cKDTree,
+    values: np.ndarray,
+    points: np.ndarray,
+    k: int = 12,
+    max_distance: Optional[float] = None,
+    power: float = 2.0
+) -> np.ndarray:
+    """Interpolação pelo inverso da distância ponderada (IDW) com vizinhança KD-tree"""
+
+    def run(chunk: slice) -> Tuple[np.ndarray]:
+        distances, indices, valid = _neighbors(tree, points[chunk], k, max_distance)
+        neighbor_values = values[indices]
+
+        with np.errstate(divide='ignore'):
+            weights = np.where(valid, 1.0 / np.maximum(distances, 1e-12) ** power, 0.0)
+
+        # Ponto coincidente com observação: usar o valor observado
+        exact = valid & (distances < 1e-9)
+        weights = np.where(exact.any(axis=1, keepdims=True), exact.astype(float), weights)
+
+        total = weights.sum(axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            estimate = np.where(total > 0, (weights * neighbor_values).sum(axis=1) / total, np.nan)
+        return (estimate,)
+
+    return _parallel_chunks(len(points), run)[0]
+
+
+def ordinary_kriging(
+    tree: cKDTree,
+    values: np.ndarray,
+    points: np.ndarray,
+    model: str = 'spherical',
+    sill: float = 1.0,
+    range_: float = 1000.0,
+    nugget: float = 0.0,
+    k: int = 12,
+    max_distance: Optional[float] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Krigagem ordinária local (vizinhança KD-tree); retorna estimativas e variâncias"""
+    gamma = VARIOGRAM_MODELS[model]
+    coords = tree.data
+
+    def run(chunk: slice) -> Tuple[np.ndarray, np.ndarray]:
+        distances, indices, valid = _neighbors(tree, points[chunk], k, max_distance)
+        m, kk = indices.shape
+
+        # Sistema [Γ 1; 1ᵀ 0] [w; μ] = [γ0; 1] montado em lote para todos os pontos
+        neighbor_coords = coords[indices]
+        pair_dist = np.linalg.norm(neighbor_coords[:, :, None, :] - neighbor_coords[:, None, :, :], axis=-1)
+
+        A = np.ones((m, kk + 1, kk + 1))
+        A[:, :kk, :kk] = gamma(pair_dist, sill, range_, nugget)
+        A[:, kk, kk] = 0.0
+
+        # Regularização leve da diagonal (observações coincidentes)
+        diag = np.arange(kk)
+        A[:, diag, diag] -= 1e-9 * max(sill, 1e-12)
+
+        b = np.ones((m, kk + 1))
+        b[:, :kk] = gamma(np.where(valid, distances, 0.0), sill, range_, nugget)
+
+        # Vizinhos ausentes (além de max_distance) recebem peso zero
+        invalid = ~valid
+        A[:, :kk, :kk][np.broadcast_to(invalid[:, :, None], (m, kk, kk))] = 0.0
+        A[:, :kk, :kk][np.broadcast_to(invalid[:, None, :], (m, kk, kk))] = 0.0
+        A[:, :kk, kk][invalid] = 0.0
+        A[:, kk, :kk][invalid] = 0.0
+        A[:, diag, diag] = np.where(invalid, 1.0, A[:, diag, diag])
+        b[:, :kk][invalid] = 0.0
+
+        # Pontos sem nenhum vizinho: sistema trivial, resultado descartado abaixo
+        no_data = ~valid.any(axis=1)
+        A[no_data, kk, kk] = 1.0
+
+        solution = np.linalg.solve(A, b[..., None])[..., 0]
+        weights = solution[:, :kk]
+
+        estimate = (weights * values[indices]).sum(axis=1)
+        variance = (weights * b[:, :kk]).sum(axis=1) + solution[:, kk]
+
+        estimate[no_data] = np.nan
+        variance[no_data] = np.nan
+        return estimate, np.maximum(variance, 0.0)
+
+    return _parallel_chunks(len(points), run)
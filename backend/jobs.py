@@ -0,0 +1,229 @@
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import metrics
+
+
+# Workers do pool de ingestão dos uploads (cargas no mesmo dataset são serializadas)
+UPLOAD_WORKERS = int(os.environ.get('UPLOAD_WORKERS', '2'))
+
+# Estado dos jobs em disco (volume /data do docker-compose, visível a todos os workers)
+JOBS_PATH = os.environ.get('JOBS_PATH', '/data/jobs')
+
+# Jobs mantidos para consulta (os mais antigos são removidos)
+JOBS_MAX_ENTRIES = 200
+
+# Identificadores gerados por uuid4().hex
+JOB_ID = re.compile(r'^[0-9a-f]{32}$')
+
+# Mensagem do resultado por camada
+LAYER_MESSAGES = {'lotes': 'Lotes carregados com sucesso', 'imoveis': 'Imóveis carregados com sucesso'}
+
+
+class Job:
+    """Upload em processamento: estado, fase (etapa do motor), linhas, vazão e erro"""
+
+    def __init__(self, layer: str, dataset: str, filename: str, size_bytes: int):
+        self.id = uuid.uuid4().hex
+        self.layer = layer
+        self.dataset = dataset
+        self.filename = filename
+        self.size_bytes = size_bytes
+        self.status = 'na_fila'
+        self.phase: Optional[str] = None
+        self.rows: Optional[int] = None
+        self.rows_processed = 0
+        self.timings: List[Tuple[str, float]] = []
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.created_at = datetime.now(timezone.utc)
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self._begin: Optional[float] = None
+        self._seconds: Optional[float] = None
+
+    def start(self):
+        """Marca o início do processamento"""
+        self.status = 'executando'
+        self.started_at = datetime.now(timezone.utc)
+        self._begin = time.perf_counter()
+
+    def finish(self, error: Optional[str] = None):
+        """Marca o fim do processamento, com ou sem erro"""
+        self._seconds = time.perf_counter() - self._begin
+        self.status = 'erro' if error else 'concluido'
+        self.error = error
+        self.phase = None
+        self.finished_at = datetime.now(timezone.utc)
+
+    def describe(self) -> Dict[str, Any]:
+        """Estado para /jobs/{id}"""
+        seconds = self._seconds
+        if seconds is None and self._begin is not None:
+            seconds = time.perf_counter() - self._begin
+        # Durante a carga, vazão das linhas já lidas pelo tempo decorrido
+        rate = seconds if self.rows_processed and seconds else None
+        stages: Dict[str, float] = {}
+        for name, stage_seconds in list(self.timings):
+            stages[name] = stages.get(name, 0.0) + stage_seconds
+        return {
+            'id': self.id,
+            'camada': self.layer,
+            'dataset': self.dataset,
+            'arquivo': self.filename,
+            'estado': self.status,
+            'fase': self.phase,
+            'linhas': self.rows,
+            'linhas_processadas': self.rows_processed,
+            'bytes': self.size_bytes,
+            'linhas_por_segundo': self.rows_processed / rate if rate else None,
+            'mb_por_segundo': self.size_bytes / 1e6 / rate if rate else None,
+            'etapas_s': stages,
+            'resultado': self.result,
+            'erro': self.error,
+            'criado_em': self.created_at.isoformat(),
+            'iniciado_em': self.started_at.isoformat() if self.started_at else None,
+            'concluido_em': self.finished_at.isoformat() if self.finished_at else None,
+            'duracao_s': seconds
+        }
+
+
+class UploadJobs:
+    """
+    Uploads de lotes e imóveis processados num pool em segundo plano
+
+    O job carrega o arquivo numa cópia do motor do dataset e a troca pelo
+    motor em uso ao final (DatasetRegistry.ingest), então as consultas seguem
+    nos dados anteriores durante a carga. O estado de cada job também é
+    gravado em `path`, para ser consultado por qualquer worker do gunicorn.
+    """
+
+    def __init__(self, registry, workers: int = UPLOAD_WORKERS, path: str = JOBS_PATH):
+        self.registry = registry
+        self.path = path
+        self._jobs: 'OrderedDict[str, Job]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='upload')
+
+    def submit(self, layer: str, dataset: str, file_path: str, filename: str) -> Job:
+        """Enfileira a carga de `file_path` (removido ao final); retorna o job"""
+        job = Job(layer, dataset, filename, os.path.getsize(file_path))
+        with self._lock:
+            self._jobs[job.id] = job
+            while len(self._jobs) > JOBS_MAX_ENTRIES:
+                self._jobs.popitem(last=False)
+        self._save(job)
+        self._pool.submit(self._run, job, file_path)
+        return job
+
+    def _phase(self, job: Job, name: str):
+        """Etapa do motor em andamento"""
+        job.phase = name
+        # As etapas seguintes são vetorizadas sobre o arquivo inteiro: lido, todas as linhas estão em processamento
+        if not job.rows_processed and any(stage == 'read_parquet' for stage, _ in job.timings):
+            job.rows_processed = job.rows or 0
+        self._save(job)
+
+    def _run(self, job: Job, file_path: str):
+        """Lê, carrega, troca o motor e registra o resultado ou o erro"""
+        job.start()
+        self._save(job)
+        error = None
+        try:
+            import pyarrow.parquet as pq
+
+            # Linhas e colunas pelo rodapé do arquivo, sem lê-lo duas vezes
+            metadata = pq.read_metadata(file_path)
+            job.rows = metadata.num_rows
+            columns = [name for name in metadata.schema.to_arrow_schema().names if not name.startswith('__index_level_')]
+
+            # Etapas concluídas aparecem em /jobs/{id} durante a carga
+            with metrics.collect(lambda name: self._phase(job, name)) as timings:
+                job.timings = timings
+                engine = self.registry.ingest(job.dataset, job.layer, file_path)
+
+            gdf = engine.lotes_gdf if job.layer == 'lotes' else engine.imoveis_gdf
+            job.rows_processed = len(gdf)
+            job.result = {
+                'message': LAYER_MESSAGES[job.layer],
+                'records_count': len(gdf),
+                'file_type': job.layer,
+                'columns': columns,
+                'geocoding': (engine.geocode_summary or None) if job.layer == 'imoveis' else None
+            }
+        except Exception as e:
+            error = str(e) or type(e).__name__
+        finally:
+            job.finish(error)
+            self._save(job)
+            try:
+                os.unlink(file_path)
+            except OSError:
+                pass
+
+    def _save(self, job: Job):
+        """Grava o estado do job em disco (sem disco gravável, fica só neste processo)"""
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            staging = os.path.join(self.path, f'{job.id}.json.tmp')
+            with open(staging, 'w', encoding='utf-8') as f:
+                json.dump(job.describe(), f, ensure_ascii=False)
+            os.replace(staging, os.path.join(self.path, f'{job.id}.json'))
+            if job.status == 'na_fila':
+                self._prune()
+        except OSError:
+            pass
+
+    def _prune(self):
+        """Remove do disco os jobs mais antigos além de JOBS_MAX_ENTRIES"""
+        entries = sorted(
+            (entry for entry in os.scandir(self.path) if entry.name.endswith('.json')),
+            key=lambda entry: entry.stat().st_mtime
+        )
+        for entry in entries[:-JOBS_MAX_ENTRIES]:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+    def get(self, job_id: str) -> Dict[str, Any]:
+        """
+        Estado do job, deste processo ou gravado por outro worker
+
+        Ids inválidos ou jobs inexistentes geram KeyError.
+        """
+        if not JOB_ID.match(job_id):
+            raise KeyError(job_id)
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None:
+            return job.describe()
+        try:
+            with open(os.path.join(self.path, f'{job_id}.json'), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            raise KeyError(job_id)
+
+    def list_jobs(self) -> List[Dict[str, Any]]:
+        """Jobs conhecidos, do mais recente ao mais antigo"""
+        jobs = {}
+        if os.path.isdir(self.path):
+            for entry in os.scandir(self.path):
+                if entry.name.endswith('.json'):
+                    try:
+                        with open(entry.path, encoding='utf-8') as f:
+                            job = json.load(f)
+                    except (OSError, ValueError):
+                        continue
+                    jobs[job['id']] = job
+        with self._lock:
+            jobs.update({job.id: job.describe() for job in self._jobs.values()})
+        return sorted(jobs.values(), key=lambda job: job['criado_em'], reverse=True)
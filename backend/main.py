@@ -1,19 +1,45 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Query
+from __future__ import annotations
+
+from fastapi import FastAPI, UploadFile, File, HTTPException, Query, Request, Depends, Header
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-import pandas as pd
+from fastapi.responses import JSONResponse, Response, StreamingResponse, FileResponse
+import asyncio
 import tempfile
 import os
+import json
+import shutil
+import threading
+import time
 from datetime import datetime
-from typing import Optional
+from typing import TYPE_CHECKING, Optional
 
 from models import (
     AnalysisRequest,
     AnalysisResponse,
-    UploadResponse,
+    PolygonAnalysisRequest,
+    PolygonAnalysisResponse,
+    RingsAnalysisRequest,
+    PartitionedAnalysisRequest,
+    NearestRequest,
+    NearestBatchRequest,
+    InterpolationRequest,
+    VariogramRequest,
+    MarkovRequest,
+    AutocorrelationRequest,
+    CubeRequest,
     HealthResponse
 )
-from spatial_engine import SpatialEngine
+import metrics
+import profiling
+from datasets import DatasetRegistry, DEFAULT_DATASET
+from jobs import UploadJobs
+from warmup import WarmStart
+
+# geopandas, shapely e scipy são importados pelo aquecimento, depois que o servidor já aceita conexões
+if TYPE_CHECKING:
+    from spatial_engine import SpatialEngine
 
 # Inicializar FastAPI
 app = FastAPI(
@@ -31,8 +57,87 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Motor de análise espacial (singleton)
-spatial_engine = SpatialEngine()
+# Datasets nomeados, cada um com seu motor de análise espacial
+datasets = DatasetRegistry()
+
+# Carga inicial em segundo plano (snapshots e Parquet do volume /data)
+warm_start = WarmStart(datasets)
+
+# Uploads processados em segundo plano, acompanhados em /jobs/{id}
+uploads = UploadJobs(datasets)
+
+
+@app.on_event("startup")
+def start_warm_start():
+    """Inicia o aquecimento sem atrasar a subida do servidor"""
+    warm_start.start(_warm_caches)
+
+
+@app.middleware("http")
+async def server_timing(request: Request, call_next):
+    """Tempo total e etapas da requisição no header Server-Timing e nas métricas de /metrics"""
+    timings = metrics.begin_request()
+    begin = time.perf_counter()
+    response = await call_next(request)
+    elapsed = time.perf_counter() - begin
+
+    # Rota como template (ex.: /upload/partitioned/{layer}) para não multiplicar as séries
+    route = request.scope.get("route")
+    metrics.observe_request(request.method, getattr(route, "path", "desconhecida"), response.status_code, elapsed)
+    if "content-length" in response.headers:
+        metrics.observe_size("response_bytes", int(response.headers["content-length"]))
+
+    response.headers["Server-Timing"] = metrics.server_timing(timings, elapsed)
+    response.headers["Timing-Allow-Origin"] = "*"
+    return response
+
+
+@app.middleware("http")
+async def profile_request(request: Request, call_next):
+    """Captura opcional do perfil da requisição (X-Profile ou ?profile=1, com X-Profile-Token)"""
+    if not profiling.requested(request.headers.get("x-profile") or request.query_params.get("profile")):
+        return await call_next(request)
+    if not profiling.authorized(request.headers.get("x-profile-token")):
+        return JSONResponse(status_code=403, content={"detail": "Captura de perfil não autorizada"})
+
+    capture = profiling.start()
+    if capture is None:
+        return JSONResponse(status_code=409, content={"detail": "Outra captura de perfil em andamento"})
+    try:
+        response = await call_next(request)
+    finally:
+        capture.stop()
+
+    try:
+        profile_id = await run_in_threadpool(capture.save, {
+            "metodo": request.method,
+            "caminho": request.url.path,
+            "query": str(request.query_params),
+            "status": response.status_code
+        })
+    except OSError as e:
+        response.headers["X-Profile-Error"] = str(e)
+    else:
+        response.headers["X-Profile-Id"] = profile_id
+        response.headers["X-Profile-Url"] = f"/debug/profiles/{profile_id}"
+    return response
+
+
+def _resolve_engine(dataset: str, create: bool) -> SpatialEngine:
+    """Motor do dataset ou HTTPException (400 nome inválido, 404 inexistente)"""
+    try:
+        return datasets.get(dataset, create=create)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Dataset '{dataset}' não encontrado")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def get_engine(
+    dataset: str = Query(DEFAULT_DATASET, description="Nome do dataset")
+) -> SpatialEngine:
+    """Motor do dataset da requisição"""
+    return _resolve_engine(dataset, create=False)
 
 
 @app.get("/", response_model=HealthResponse)
@@ -46,17 +151,101 @@ async def root():
 
 
 @app.get("/health", response_model=HealthResponse)
-async def health():
-    """Health check detalhado"""
+async def health(response: Response):
+    """Prontidão: 'loading' (503) durante o aquecimento, com o progresso, e 'ready' depois"""
+    warmup = warm_start.describe()
+    if warmup["status"] != "ready":
+        response.status_code = 503
     return HealthResponse(
-        status="online",
+        status=warmup["status"],
         timestamp=datetime.now().isoformat(),
-        version="1.0.0"
+        version="1.0.0",
+        warmup=warmup
     )
 
 
-@app.post("/upload/lotes", response_model=UploadResponse)
-async def upload_lotes(file: UploadFile = File(...)):
+@app.get("/metrics")
+async def get_metrics():
+    """Métricas no formato do Prometheus: tempos por etapa, tamanhos de resultado e requisições"""
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
+def require_profile_token(x_profile_token: Optional[str] = Header(None)):
+    """Exige o token de captura de perfis (PROFILE_TOKEN)"""
+    if not profiling.authorized(x_profile_token):
+        raise HTTPException(status_code=403, detail="Captura de perfil não autorizada")
+
+
+@app.get("/debug/profiles", dependencies=[Depends(require_profile_token)])
+async def get_profiles():
+    """Perfis capturados, do mais recente ao mais antigo"""
+    return {"perfis": profiling.list_profiles()}
+
+
+@app.get("/debug/profiles/{profile_id}", dependencies=[Depends(require_profile_token)])
+async def get_profile(
+    profile_id: str,
+    format: str = Query("json", description="json (resumo), pstats ou collapsed (flamegraph)")
+):
+    """Perfil capturado: resumo das funções mais custosas, arquivo pstats ou pilhas collapsed"""
+    if format not in ("json", "pstats", "collapsed"):
+        raise HTTPException(status_code=400, detail="format deve ser 'json', 'pstats' ou 'collapsed'")
+    try:
+        if format == "json":
+            return profiling.load(profile_id)
+        media_type = "application/octet-stream" if format == "pstats" else "text/plain; charset=utf-8"
+        return FileResponse(
+            profiling.profile_file(profile_id, format), media_type=media_type, filename=f"{profile_id}.{format}"
+        )
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Perfil '{profile_id}' não encontrado")
+
+
+@app.get("/debug/memory")
+async def get_memory():
+    """Memória por coluna, geometria, índice espacial e cache de cada dataset, RSS e alertas de orçamento"""
+    try:
+        return JSONResponse(content=datasets.memory_report())
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao medir memória: {str(e)}")
+
+
+@app.get("/datasets")
+async def get_datasets():
+    """Datasets nomeados: estado (memória ou disco), memória por camada e orçamento"""
+    try:
+        return JSONResponse(content=datasets.describe())
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao listar datasets: {str(e)}")
+
+
+async def _submit_upload(layer: str, file: UploadFile, dataset: str) -> JSONResponse:
+    """Grava o arquivo e enfileira a carga; 202 com o job, acompanhado em /jobs/{id}"""
+    if not file.filename.endswith('.parquet'):
+        raise HTTPException(status_code=400, detail="Arquivo deve ser .parquet")
+    _resolve_engine(dataset, create=True)
+
+    try:
+        # Salvar temporariamente (removido pelo job ao final)
+        with tempfile.NamedTemporaryFile(delete=False, suffix='.parquet') as tmp:
+            # Em blocos, sem o arquivo inteiro na memória
+            await run_in_threadpool(shutil.copyfileobj, file.file, tmp)
+            tmp_path = tmp.name
+
+        job = uploads.submit(layer, dataset, tmp_path, file.filename)
+        return JSONResponse(status_code=202, content=job.describe(), headers={"Location": f"/jobs/{job.id}"})
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao processar arquivo: {str(e)}")
+
+
+@app.post("/upload/lotes", status_code=202)
+async def upload_lotes(
+    file: UploadFile = File(...),
+    dataset: str = Query(DEFAULT_DATASET, description="Nome do dataset (criado se não existir)")
+):
     """
     Upload de arquivo Parquet com dados de lotes de Vitória
 
@@ -64,120 +253,329 @@ async def upload_lotes(file: UploadFile = File(...)):
     area_terreno, ca, to, limite_altura, afast_frontal, limite_embasamento,
     gabarito, altura, geometry, inscricaoImobiliaria, tipoConstrucao,
     numeroPavimentos, ocupacao
+
+    A carga roda em segundo plano; o resultado (UploadResponse) fica em
+    /jobs/{id} e as consultas usam os dados anteriores até ela terminar.
     """
-    if not file.filename.endswith('.parquet'):
-        raise HTTPException(status_code=400, detail="Arquivo deve ser .parquet")
+    return await _submit_upload("lotes", file, dataset)
+
+
+@app.post("/upload/imoveis", status_code=202)
+async def upload_imoveis(
+    file: UploadFile = File(...),
+    dataset: str = Query(DEFAULT_DATASET, description="Nome do dataset (criado se não existir)")
+):
+    """
+    Upload de arquivo Parquet com dados de imóveis
+
+    Colunas esperadas: Incorporador, Empreendimento, Bairro, Endereco, Cidade,
+    Dormitorios, Metragem Privativa, Vagas, Preco Total, Status,
+    Unidades Total, Unidades Vendidas, Estoque Atual
+
+    A carga roda em segundo plano; o resultado (UploadResponse) fica em
+    /jobs/{id} e as consultas usam os dados anteriores até ela terminar.
+    """
+    return await _submit_upload("imoveis", file, dataset)
+
+
+@app.get("/jobs")
+async def get_jobs():
+    """Jobs de upload, do mais recente ao mais antigo"""
+    return JSONResponse(content={"jobs": uploads.list_jobs()})
+
 
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Estado do upload: fase, linhas, vazão, tempo por etapa, resultado ou erro"""
     try:
-        # Salvar temporariamente
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.parquet') as tmp:
-            content = await file.read()
-            tmp.write(content)
-            tmp_path = tmp.name
+        return JSONResponse(content=uploads.get(job_id))
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' não encontrado")
+
+
+@app.post("/analyze", response_model=AnalysisResponse)
+async def analyze_area(request: AnalysisRequest, engine: SpatialEngine = Depends(get_engine)):
+    """
+    Analisa uma área circular ao redor de um ponto
+
+    Retorna lotes e imóveis dentro do raio especificado
+    """
+    try:
+        result = engine.analyze_radius(
+            lat=request.latitude,
+            lon=request.longitude,
+            radius_meters=request.radius_meters,
+            filters=request.filters,
+            approximate=request.approximate,
+            refine=request.refine
+        )
+
+        with metrics.stage("validate"):
+            response = AnalysisResponse(**result)
+        with metrics.stage("encode"):
+            return JSONResponse(jsonable_encoder(response))
+
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro na análise: {str(e)}")
+
+
+def _sse(event: str, data: dict) -> str:
+    """Formata um evento Server-Sent Events"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.get("/analyze/stream")
+async def analyze_stream(
+    request: Request,
+    latitude: float = Query(..., description="Latitude do ponto central"),
+    longitude: float = Query(..., description="Longitude do ponto central"),
+    radius_meters: float = Query(1000, description="Raio em metros"),
+    filters: Optional[str] = Query(None, description="Filtros em JSON, ex.: {\"bairro\": \"Centro\"}"),
+    chunk_size: int = Query(200, description="Features por evento"),
+    engine: SpatialEngine = Depends(get_engine)
+):
+    """
+    Análise circular progressiva via Server-Sent Events
 
-        # Carregar no motor espacial
-        count = spatial_engine.load_parquet_lotes(tmp_path)
+    Emite `stats` imediatamente, depois `features` em blocos do mais próximo ao
+    mais distante e `done`; fechar a conexão interrompe a serialização
+    """
+    cancel = threading.Event()
+    try:
+        events = engine.analyze_radius_stream(
+            lat=latitude,
+            lon=longitude,
+            radius_meters=radius_meters,
+            filters=json.loads(filters) if filters else None,
+            chunk_size=chunk_size,
+            cancel=cancel
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    def close(pending: asyncio.Future):
+        """Fecha o gerador depois que o next() em andamento na thread retornar"""
+        if not pending.cancelled():
+            pending.exception()
+        events.close()
+
+    async def generate():
+        pending = None
+        try:
+            while not await request.is_disconnected():
+                # Blindado: o cancelamento da requisição não abandona o bloco em serialização
+                pending = asyncio.ensure_future(run_in_threadpool(next, events, None))
+                event = await asyncio.shield(pending)
+                pending = None
+                if event is None:
+                    break
+                yield _sse(*event)
+        except Exception as e:
+            yield _sse('error', {'detail': f"Erro na análise: {str(e)}"})
+        finally:
+            # O gerador para antes do próximo bloco; close() durante o next() falharia
+            cancel.set()
+            if pending is None:
+                events.close()
+            else:
+                pending.add_done_callback(close)
+
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
-        # Ler colunas do arquivo
-        df = pd.read_parquet(tmp_path)
-        columns = df.columns.tolist()
 
-        # Limpar arquivo temporário
-        os.unlink(tmp_path)
+@app.post("/analyze/polygon", response_model=PolygonAnalysisResponse)
+async def analyze_polygon(request: PolygonAnalysisRequest, engine: SpatialEngine = Depends(get_engine)):
+    """
+    Analisa uma área poligonal (perímetros de zoneamento, bairros, áreas desenhadas)
 
-        return UploadResponse(
-            message=f"Lotes carregados com sucesso",
-            records_count=count,
-            file_type="lotes",
-            columns=columns
+    Retorna lotes e imóveis conforme o modo de match: intersects, within ou centroid
+    """
+    try:
+        result = engine.analyze_polygon(
+            geometry=request.geometry,
+            filters=request.filters,
+            match=request.match
         )
 
+        return PolygonAnalysisResponse(**result)
+
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Erro ao processar arquivo: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Erro na análise: {str(e)}")
 
+@app.post("/analyze/rings")
+async def analyze_rings(request: RingsAnalysisRequest, engine: SpatialEngine = Depends(get_engine)):
+    """
+    Analisa anéis concêntricos ao redor de um ponto em uma única passada
 
-@app.post("/upload/imoveis", response_model=UploadResponse)
-async def upload_imoveis(file: UploadFile = File(...)):
+    Retorna estatísticas por anel e acumuladas até cada raio
     """
-    Upload de arquivo Parquet com dados de imóveis
+    try:
+        result = engine.analyze_rings(
+            lat=request.latitude,
+            lon=request.longitude,
+            radii=request.radii,
+            filters=request.filters,
+            include_features=request.include_features
+        )
 
-    Colunas esperadas: Incorporador, Empreendimento, Bairro, Endereco, Cidade,
-    Dormitorios, Metragem Privativa, Vagas, Preco Total, Status,
-    Unidades Total, Unidades Vendidas, Estoque Atual
+        return JSONResponse(content=result)
+
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro na análise: {str(e)}")
+
+@app.post("/nearest")
+async def nearest(request: NearestRequest, engine: SpatialEngine = Depends(get_engine)):
+    """
+    Retorna os k lotes e imóveis mais próximos de um ponto
+
+    Busca em KD-tree sobre pontos projetados (centróides no caso de lotes),
+    com distâncias métricas em `distancia_metros`, em ordem crescente
+    """
+    try:
+        result = engine.nearest(
+            lat=request.latitude,
+            lon=request.longitude,
+            k=request.k,
+            filters=request.filters,
+            layer=request.layer,
+            max_distance=request.max_distance
+        )
+        return JSONResponse(content=result)
+
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro na busca de vizinhos: {str(e)}")
+
+
+@app.post("/upload/partitioned/{layer}")
+async def upload_partitioned(layer: str, file: UploadFile = File(...), engine: SpatialEngine = Depends(get_engine)):
+    """
+    Grava um Parquet de lotes ou imóveis no armazenamento particionado
+
+    O arquivo é copiado em blocos para o disco e lido em lotes, sem carregar
+    tudo na memória; os dados em memória não são alterados.
     """
     if not file.filename.endswith('.parquet'):
         raise HTTPException(status_code=400, detail="Arquivo deve ser .parquet")
 
     try:
-        # Salvar temporariamente
         with tempfile.NamedTemporaryFile(delete=False, suffix='.parquet') as tmp:
-            content = await file.read()
-            tmp.write(content)
+            shutil.copyfileobj(file.file, tmp)
             tmp_path = tmp.name
 
-        # Carregar no motor espacial
-        count = spatial_engine.load_parquet_imoveis(tmp_path)
-
-        # Ler colunas do arquivo
-        df = pd.read_parquet(tmp_path)
-        columns = df.columns.tolist()
+        try:
+            result = await run_in_threadpool(engine.ingest_partitioned, layer, tmp_path)
+        finally:
+            os.unlink(tmp_path)
 
-        # Limpar arquivo temporário
-        os.unlink(tmp_path)
-
-        return UploadResponse(
-            message=f"Imóveis carregados com sucesso",
-            records_count=count,
-            file_type="imoveis",
-            columns=columns
-        )
+        return JSONResponse(content=result)
 
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao processar arquivo: {str(e)}")
 
 
-@app.post("/analyze", response_model=AnalysisResponse)
-async def analyze_area(request: AnalysisRequest):
+@app.post("/analyze/partitioned")
+async def analyze_partitioned(request: PartitionedAnalysisRequest, engine: SpatialEngine = Depends(get_engine)):
     """
-    Analisa uma área circular ao redor de um ponto
+    Analisa uma área circular lendo só as partições e row groups que ela toca
 
-    Retorna lotes e imóveis dentro do raio especificado
+    Usa o armazenamento particionado (fora da memória) em vez dos dados carregados
     """
     try:
-        result = spatial_engine.analyze_radius(
+        result = engine.analyze_partitioned(
             lat=request.latitude,
             lon=request.longitude,
             radius_meters=request.radius_meters,
-            filters=request.filters
+            filters=request.filters,
+            include_features=request.include_features
         )
 
-        return AnalysisResponse(**result)
+        return JSONResponse(content=result)
 
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro na análise: {str(e)}")
 
 
+@app.get("/partitioned")
+async def get_partitioned_status(engine: SpatialEngine = Depends(get_engine)):
+    """Partições, arquivos, linhas e cache do armazenamento particionado"""
+    try:
+        return JSONResponse(content=engine.partitioned_status())
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao consultar partições: {str(e)}")
+
+
+@app.post("/nearest/batch")
+async def nearest_batch(request: NearestBatchRequest, engine: SpatialEngine = Depends(get_engine)):
+    """Retorna os k lotes e imóveis mais próximos de cada ponto informado"""
+    try:
+        results = engine.nearest_batch(
+            points=request.points,
+            k=request.k,
+            filters=request.filters,
+            layer=request.layer,
+            max_distance=request.max_distance
+        )
+        return JSONResponse(content={"results": results})
+
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro na busca de vizinhos: {str(e)}")
+
+def _conditional_json(engine: SpatialEngine, request: Request, key: tuple, builder) -> Response:
+    """JSON com ETag/Last-Modified da versão dos dados; 304 se o cliente já tem essa versão"""
+    etag = engine.etag(*key)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": engine.last_modified(),
+        "Cache-Control": "no-cache"
+    }
+    if engine.not_modified(
+        etag,
+        request.headers.get("if-none-match"),
+        request.headers.get("if-modified-since")
+    ):
+        return Response(status_code=304, headers=headers)
+
+    return Response(
+        content=engine.serialized(key, builder),
+        media_type="application/json",
+        headers=headers
+    )
+
+
 @app.get("/lotes/geojson")
 async def get_lotes_geojson(
+    request: Request,
     bairro: Optional[str] = Query(None, description="Filtrar por bairro"),
-    limit: Optional[int] = Query(1000, description="Limite de resultados")
+    limit: Optional[int] = Query(1000, description="Limite de resultados"),
+    engine: SpatialEngine = Depends(get_engine)
 ):
     """Retorna todos os lotes em formato GeoJSON"""
     try:
-        geojson = spatial_engine.get_all_lotes_geojson()
-
-        # Aplicar filtros se necessário
-        if bairro:
-            geojson['features'] = [
-                f for f in geojson['features']
-                if f['properties'].get('bairro') == bairro
-            ]
-
-        # Limitar resultados
-        if limit:
-            geojson['features'] = geojson['features'][:limit]
-
-        return JSONResponse(content=geojson)
+        return _conditional_json(
+            engine,
+            request,
+            ("lotes/geojson", bairro, limit),
+            lambda: engine.get_all_lotes_geojson(bairro=bairro, limit=limit)
+        )
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao buscar lotes: {str(e)}")
@@ -185,81 +583,227 @@ async def get_lotes_geojson(
 
 @app.get("/imoveis/geojson")
 async def get_imoveis_geojson(
+    request: Request,
     bairro: Optional[str] = Query(None, description="Filtrar por bairro"),
-    limit: Optional[int] = Query(1000, description="Limite de resultados")
+    limit: Optional[int] = Query(1000, description="Limite de resultados"),
+    engine: SpatialEngine = Depends(get_engine)
 ):
     """Retorna todos os imóveis em formato GeoJSON"""
     try:
-        geojson = spatial_engine.get_all_imoveis_geojson()
+        return _conditional_json(
+            engine,
+            request,
+            ("imoveis/geojson", bairro, limit),
+            lambda: engine.get_all_imoveis_geojson(bairro=bairro, limit=limit)
+        )
 
-        # Aplicar filtros se necessário
-        if bairro:
-            geojson['features'] = [
-                f for f in geojson['features']
-                if f['properties'].get('bairro') == bairro
-            ]
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao buscar imóveis: {str(e)}")
 
-        # Limitar resultados
-        if limit:
-            geojson['features'] = geojson['features'][:limit]
 
-        return JSONResponse(content=geojson)
+@app.get("/imoveis/clusters")
+async def get_imoveis_clusters(
+    bbox: str = Query(..., description="Área visível: minx,miny,maxx,maxy"),
+    zoom: float = Query(..., description="Nível de zoom do mapa"),
+    engine: SpatialEngine = Depends(get_engine)
+):
+    """Clusters de imóveis por zoom (features reais em zoom alto)"""
+    try:
+        result = engine.imovel_clusters(
+            bbox=tuple(float(value) for value in bbox.split(',')),
+            zoom=zoom
+        )
+        return JSONResponse(content=result)
 
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Erro ao buscar imóveis: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Erro ao buscar clusters: {str(e)}")
+
+
+def _bounds_body(engine: SpatialEngine) -> dict:
+    """Corpo da resposta de /bounds"""
+    bounds = engine.get_bounds()
+
+    if bounds is None:
+        return {
+            "message": "Nenhum dado carregado ainda",
+            "bounds": None
+        }
+
+    return {
+        "bounds": {
+            "minLng": bounds[0],
+            "minLat": bounds[1],
+            "maxLng": bounds[2],
+            "maxLat": bounds[3]
+        }
+    }
+
+
+def _stats_body(engine: SpatialEngine) -> dict:
+    """Corpo da resposta de /stats"""
+    stats = {
+        "lotes": {
+            "total": len(engine.lotes_gdf) if engine.lotes_gdf is not None else 0,
+            "com_geometria": len(engine.lotes_gdf[engine.lotes_gdf.geometry.notna()]) if engine.lotes_gdf is not None else 0
+        },
+        "imoveis": {
+            "total": len(engine.imoveis_gdf) if engine.imoveis_gdf is not None else 0,
+            "com_geometria": len(engine.imoveis_gdf[engine.imoveis_gdf.geometry.notna()]) if engine.imoveis_gdf is not None else 0
+        }
+    }
+
+    # Adicionar bairros únicos
+    if engine.lotes_gdf is not None and len(engine.lotes_gdf) > 0:
+        stats['lotes']['bairros_unicos'] = engine.lotes_gdf['bairro'].nunique() if 'bairro' in engine.lotes_gdf.columns else 0
+
+    if engine.imoveis_gdf is not None and len(engine.imoveis_gdf) > 0:
+        stats['imoveis']['bairros_unicos'] = engine.imoveis_gdf['bairro'].nunique() if 'bairro' in engine.imoveis_gdf.columns else 0
+
+    return stats
+
+
+def _warm_caches(engine: SpatialEngine):
+    """Corpos de /bounds, /stats e da primeira página de /lotes e /imoveis (mesmas chaves das rotas)"""
+    engine.serialized(("bounds",), lambda: _bounds_body(engine))
+    engine.serialized(("stats",), lambda: _stats_body(engine))
+    engine.serialized(("lotes/geojson", None, 1000), lambda: engine.get_all_lotes_geojson(bairro=None, limit=1000))
+    engine.serialized(("imoveis/geojson", None, 1000), lambda: engine.get_all_imoveis_geojson(bairro=None, limit=1000))
 
 
 @app.get("/bounds")
-async def get_bounds():
+async def get_bounds(request: Request, engine: SpatialEngine = Depends(get_engine)):
     """Retorna os limites geográficos dos dados carregados"""
     try:
-        bounds = spatial_engine.get_bounds()
-
-        if bounds is None:
-            return JSONResponse(content={
-                "message": "Nenhum dado carregado ainda",
-                "bounds": None
-            })
-
-        return JSONResponse(content={
-            "bounds": {
-                "minLng": bounds[0],
-                "minLat": bounds[1],
-                "maxLng": bounds[2],
-                "maxLat": bounds[3]
-            }
-        })
+        return _conditional_json(engine, request, ("bounds",), lambda: _bounds_body(engine))
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao buscar limites: {str(e)}")
 
 
 @app.get("/stats")
-async def get_statistics():
+async def get_statistics(request: Request, engine: SpatialEngine = Depends(get_engine)):
     """Retorna estatísticas gerais dos dados carregados"""
     try:
-        stats = {
-            "lotes": {
-                "total": len(spatial_engine.lotes_gdf) if spatial_engine.lotes_gdf is not None else 0,
-                "com_geometria": len(spatial_engine.lotes_gdf[spatial_engine.lotes_gdf.geometry.notna()]) if spatial_engine.lotes_gdf is not None else 0
-            },
-            "imoveis": {
-                "total": len(spatial_engine.imoveis_gdf) if spatial_engine.imoveis_gdf is not None else 0,
-                "com_geometria": len(spatial_engine.imoveis_gdf[spatial_engine.imoveis_gdf.geometry.notna()]) if spatial_engine.imoveis_gdf is not None else 0
-            }
-        }
+        return _conditional_json(engine, request, ("stats",), lambda: _stats_body(engine))
 
-        # Adicionar bairros únicos
-        if spatial_engine.lotes_gdf is not None and len(spatial_engine.lotes_gdf) > 0:
-            stats['lotes']['bairros_unicos'] = spatial_engine.lotes_gdf['bairro'].nunique() if 'bairro' in spatial_engine.lotes_gdf.columns else 0
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao calcular estatísticas: {str(e)}")
 
-        if spatial_engine.imoveis_gdf is not None and len(spatial_engine.imoveis_gdf) > 0:
-            stats['imoveis']['bairros_unicos'] = spatial_engine.imoveis_gdf['bairro'].nunique() if 'bairro' in spatial_engine.imoveis_gdf.columns else 0
 
-        return JSONResponse(content=stats)
+@app.get("/aggregate/grid")
+async def aggregate_grid(
+    cell_size: float = Query(500, description="Tamanho da célula em metros (lado do quadrado ou do hexágono)"),
+    grid_type: str = Query("square", description="Tipo de grade: square ou hex"),
+    engine: SpatialEngine = Depends(get_engine)
+):
+    """Agrega lotes e imóveis em células para mapas de calor"""
+    try:
+        result = engine.aggregate_grid(cell_size=cell_size, grid_type=grid_type)
+        return JSONResponse(content=result)
 
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Erro ao calcular estatísticas: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Erro na agregação: {str(e)}")
+
+
+@app.post("/interpolate")
+async def interpolate(request: InterpolationRequest, engine: SpatialEngine = Depends(get_engine)):
+    """
+    Estima preço por m² (ou outro atributo) por IDW ou krigagem ordinária
+
+    Sem `points`, retorna uma superfície em grade regular (em cache por versão
+    dos dados e parâmetros); com `points`, retorna estimativas nesses pontos
+    """
+    try:
+        result = engine.interpolate(**request.model_dump())
+        return JSONResponse(content=result)
+
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro na interpolação: {str(e)}")
+
+
+@app.post("/variogram")
+async def variogram(request: VariogramRequest, engine: SpatialEngine = Depends(get_engine)):
+    """
+    Semivariograma empírico de preço por m² (ou outro atributo)
+
+    Pares acumulados em blocos via KD-tree até max_lag, dentro de um orçamento
+    fixo de memória, com ajuste opcional de modelo esférico, exponencial ou gaussiano
+    """
+    try:
+        result = engine.variogram(**request.model_dump())
+        return JSONResponse(content=result)
+
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro no variograma: {str(e)}")
+
+
+@app.post("/markov")
+async def markov(request: MarkovRequest, engine: SpatialEngine = Depends(get_engine)):
+    """
+    Análise de Markov espacial de classes de preço ou valor
+
+    Retorna a matriz de transição global, as matrizes condicionadas à classe
+    da defasagem espacial e as distribuições estacionárias
+    """
+    try:
+        result = engine.markov(**request.model_dump())
+        return JSONResponse(content=result)
+
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro na análise de Markov: {str(e)}")
+
+
+@app.post("/autocorrelation")
+async def autocorrelation(request: AutocorrelationRequest, engine: SpatialEngine = Depends(get_engine)):
+    """
+    I de Moran global e LISA (clusters HH/LL e outliers HL/LH)
+
+    Retorna a camada LISA em GeoJSON ou como stream Arrow (`format: "arrow"`)
+    """
+    try:
+        params = request.model_dump()
+        output = params.pop('format')
+
+        if output == 'arrow':
+            content = engine.autocorrelation_arrow(**params)
+            return Response(content=content, media_type="application/vnd.apache.arrow.stream")
+        if output != 'geojson':
+            raise ValueError("format deve ser 'geojson' ou 'arrow'")
+
+        return JSONResponse(content=engine.autocorrelation_geojson(**params))
+
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro na autocorrelação: {str(e)}")
+
+
+@app.post("/cube")
+async def cube(request: CubeRequest, engine: SpatialEngine = Depends(get_engine)):
+    """
+    Consulta ao cubo de imóveis por bairro, dormitórios, status e incorporador
+
+    Retorna imóveis, unidades, vendidas, estoque e preço médio por m² de cada
+    combinação das dimensões pedidas, a partir dos agregados materializados
+    """
+    try:
+        result = engine.cube(dimensions=request.dimensions, filters=request.filters)
+        return JSONResponse(content=result)
+
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro no cubo: {str(e)}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,148 @@
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+
+# Content-Type do formato texto do Prometheus
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Limites dos buckets de tempo (segundos)
+SECONDS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Limites dos buckets de tamanho de resultado (features, linhas ou bytes)
+SIZE_BUCKETS = (0, 1, 10, 100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000, 100_000_000)
+
+# Etapas medidas na requisição em andamento (para o header Server-Timing)
+_request_timings: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar('request_timings', default=None)
+
+# Avisado no início de cada etapa (jobs de upload acompanham a fase por ele)
+_stage_observer: ContextVar[Optional[Callable[[str], None]]] = ContextVar('stage_observer', default=None)
+
+
+def _escape(value: str) -> str:
+    """Valor de rótulo escapado para o formato texto do Prometheus"""
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Histogram:
+    """Histograma acumulado por combinação de rótulos, exportado no formato do Prometheus"""
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...], buckets: Tuple[float, ...]):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = buckets
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_values: Tuple[str, ...], value: float):
+        """Registra uma observação (bucket, soma e contagem)"""
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        """Linhas HELP, TYPE, _bucket, _sum e _count de todas as séries"""
+        with self._lock:
+            snapshot = {key: (list(counts), total, count) for key, (counts, total, count) in self._series.items()}
+
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        for label_values, (counts, total, count) in sorted(snapshot.items()):
+            labels = ','.join(f'{key}="{_escape(value)}"' for key, value in zip(self.labels, label_values))
+            cumulative = 0
+            for bound, n in zip((*self.buckets, math.inf), counts):
+                cumulative += n
+                le = '+Inf' if bound == math.inf else repr(float(bound))
+                lines.append(f'{self.name}_bucket{{{labels},le="{le}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{labels}}} {total!r}')
+            lines.append(f'{self.name}_count{{{labels}}} {count}')
+        return lines
+
+
+STAGE_SECONDS = Histogram(
+    'geo_stage_seconds', 'Tempo por etapa do processamento', ('stage',), SECONDS_BUCKETS
+)
+RESULT_SIZE = Histogram(
+    'geo_result_size', 'Tamanho dos resultados (features, linhas ou bytes)', ('result',), SIZE_BUCKETS
+)
+REQUEST_SECONDS = Histogram(
+    'geo_http_request_duration_seconds', 'Tempo total das requisições HTTP', ('method', 'route', 'status'),
+    SECONDS_BUCKETS
+)
+
+
+def record_stage(name: str, seconds: float):
+    """Registra a duração de uma etapa no histograma e na requisição em andamento"""
+    STAGE_SECONDS.observe((name,), seconds)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((name, seconds))
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Mede o bloco como uma etapa (nomes sem espaços, usados também no Server-Timing)"""
+    observer = _stage_observer.get()
+    if observer is not None:
+        observer(name)
+    begin = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - begin)
+
+
+def observe_size(name: str, value: float):
+    """Registra o tamanho de um resultado"""
+    RESULT_SIZE.observe((name,), value)
+
+
+def begin_request() -> List[Tuple[str, float]]:
+    """Inicia a coleta das etapas da requisição atual"""
+    timings: List[Tuple[str, float]] = []
+    _request_timings.set(timings)
+    return timings
+
+
+@contextmanager
+def collect(observer: Optional[Callable[[str], None]] = None) -> Iterator[List[Tuple[str, float]]]:
+    """Coleta as etapas do bloco fora de uma requisição HTTP, avisando `observer` do início de cada uma"""
+    timings: List[Tuple[str, float]] = []
+    timings_token = _request_timings.set(timings)
+    observer_token = _stage_observer.set(observer)
+    try:
+        yield timings
+    finally:
+        _stage_observer.reset(observer_token)
+        _request_timings.reset(timings_token)
+
+
+def observe_request(method: str, route: str, status: int, seconds: float):
+    """Registra o tempo total de uma requisição (rota como template, ex.: /upload/partitioned/{layer})"""
+    REQUEST_SECONDS.observe((method, route, str(status)), seconds)
+
+
+def server_timing(timings: List[Tuple[str, float]], total: float) -> str:
+    """Header Server-Timing com as etapas (somadas por nome) e o total, em ms"""
+    durations: Dict[str, float] = {}
+    for name, seconds in timings:
+        durations[name] = durations.get(name, 0.0) + seconds
+    durations['total'] = total
+    return ', '.join(f'{name};dur={seconds * 1000:.2f}' for name, seconds in durations.items())
+
+
+def render() -> str:
+    """Todas as métricas no formato texto do Prometheus"""
+    lines = []
+    for histogram in (STAGE_SECONDS, RESULT_SIZE, REQUEST_SECONDS):
+        lines.extend(histogram.render())
+    return '\n'.join(lines) + '\n'
@@ -52,6 +52,8 @@ class AnalysisRequest(BaseModel):
     longitude: float
     radius_meters: float = 1000
     filters: Optional[Dict[str, Any]] = None
+    approximate: bool = False  # estatísticas pela pirâmide de agregados, sem features
+    refine: bool = True  # refina exatamente as células de borda no modo aproximado
 
 
 class AnalysisResponse(BaseModel):
@@ -63,14 +65,138 @@ class AnalysisResponse(BaseModel):
     estatisticas: Dict[str, Any]
     lotes: List[Dict[str, Any]]
     imoveis: List[Dict[str, Any]]
+    aproximacao: Optional[Dict[str, Any]] = None
+
+
+class PolygonAnalysisRequest(BaseModel):
+    """Requisição para análise em polígono arbitrário"""
+    geometry: Dict[str, Any]  # GeoJSON Polygon ou MultiPolygon
+    filters: Optional[Dict[str, Any]] = None
+    match: str = "intersects"  # intersects, within ou centroid
+
+
+class PolygonAnalysisResponse(BaseModel):
+    """Resposta da análise em polígono"""
+    geometry: Dict[str, Any]
+    match: str
+    area_m2: float
+    lotes_encontrados: int
+    imoveis_encontrados: int
+    estatisticas: Dict[str, Any]
+    lotes: List[Dict[str, Any]]
+    imoveis: List[Dict[str, Any]]
+
+
+class RingsAnalysisRequest(BaseModel):
+    """Requisição para análise em anéis concêntricos"""
+    latitude: float
+    longitude: float
+    radii: List[float]  # raios em metros, ex.: [250, 500, 1000, 2000]
+    filters: Optional[Dict[str, Any]] = None
+    include_features: bool = False
+
+
+class PartitionedAnalysisRequest(BaseModel):
+    """Requisição para análise de raio sobre o armazenamento particionado"""
+    latitude: float
+    longitude: float
+    radius_meters: float = 1000
+    filters: Optional[Dict[str, Any]] = None
+    include_features: bool = False
+
+
+class NearestRequest(BaseModel):
+    """Requisição para os k vizinhos mais próximos de um ponto"""
+    latitude: float
+    longitude: float
+    k: int = 10
+    filters: Optional[Dict[str, Any]] = None
+    layer: str = "all"  # all, lotes ou imoveis
+    max_distance: Optional[float] = None  # metros
+
+
+class NearestBatchRequest(BaseModel):
+    """Requisição para os k vizinhos mais próximos de vários pontos"""
+    points: List[Dict[str, float]]  # [{latitude, longitude}]
+    k: int = 10
+    filters: Optional[Dict[str, Any]] = None
+    layer: str = "all"
+    max_distance: Optional[float] = None
+
+
+class LatLon(BaseModel):
+    """Ponto em WGS84"""
+    latitude: float
+    longitude: float
+
+
+class InterpolationRequest(BaseModel):
+    """Requisição para interpolação de superfície (IDW ou krigagem)"""
+    method: str = "idw"  # idw ou kriging
+    attribute: str = "preco_m2"
+    cell_size: float = 250
+    points: Optional[List[LatLon]] = None  # ausente = grade
+    k: int = 12
+    max_distance: Optional[float] = None
+    power: float = 2.0  # IDW
+    model: str = "spherical"  # krigagem: spherical, exponential ou gaussian
+    sill: Optional[float] = None
+    range_meters: Optional[float] = None
+    nugget: Optional[float] = None
+
+
+class VariogramRequest(BaseModel):
+    """Requisição para semivariograma empírico"""
+    attribute: str = "preco_m2"
+    max_lag: Optional[float] = None  # metros; padrão = 1/3 da diagonal dos dados
+    n_lags: int = 15
+    directions: Optional[List[float]] = None  # azimutes em graus (0 = norte)
+    tolerance: float = 22.5
+    sample_fraction: float = 1.0  # fração de pares sorteados
+    max_points: Optional[int] = 10000
+    model: Optional[str] = "auto"  # auto, spherical, exponential, gaussian ou null
+    memory_budget_mb: float = 64
+    seed: int = 0
+
+
+class MarkovRequest(BaseModel):
+    """Requisição para análise de Markov espacial"""
+    layer: str = "imoveis"  # imoveis ou lotes
+    attribute: str = "preco_m2"
+    n_classes: int = 5
+    weights: str = "knn"  # knn ou distance
+    k: int = 8
+    threshold: Optional[float] = None  # metros, para weights=distance
+    period_column: Optional[str] = None
+    id_column: Optional[str] = None
+
+
+class AutocorrelationRequest(BaseModel):
+    """Requisição para I de Moran global e LISA"""
+    layer: str = "imoveis"  # imoveis ou lotes
+    attribute: str = "preco_m2"
+    weights: str = "knn"  # knn ou distance
+    k: int = 8
+    threshold: Optional[float] = None  # metros, para weights=distance
+    permutations: int = 999
+    significance: float = 0.05
+    seed: int = 0
+    format: str = "geojson"  # geojson ou arrow
+
+
+class CubeRequest(BaseModel):
+    """Requisição ao cubo de imóveis (bairro × dormitórios × status × incorporador)"""
+    dimensions: List[str] = ["bairro"]
+    filters: Optional[Dict[str, Any]] = None  # valor ou lista de valores por dimensão
 
 
 class UploadResponse(BaseModel):
-    """Resposta do upload de arquivo"""
+    """Resultado do upload de arquivo (campo `resultado` de /jobs/{id})"""
     message: str
     records_count: int
     file_type: str
     columns: List[str]
+    geocoding: Optional[Dict[str, int]] = None  # resumo da geocodificação por endereço
 
 
 class HealthResponse(BaseModel):
@@ -78,3 +204,4 @@ class HealthResponse(BaseModel):
     status: str
     timestamp: str
     version: str
+    warmup: Optional[Dict[str, Any]] = None
@@ -0,0 +1,346 @@
+import geopandas as gpd
+import json
+import numpy as np
+import os
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+import shapely
+import shutil
+import threading
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+from clustering import mercator
+
+
+# Diretório do armazenamento particionado (volume /data do docker-compose)
+PARTITIONED_DATA_PATH = os.environ.get('PARTITIONED_DATA_PATH', '/data/partitioned')
+
+# Nível do quadkey das partições (zoom 13: tiles de ~4,6 km de lado em Vitória)
+PARTITION_ZOOM = 13
+
+# Níveis extras do quadkey usados para ordenar as linhas dentro da partição
+SORT_ZOOM_OFFSET = 6
+
+# Linhas por grupo de linhas (row group) nos arquivos de cada partição
+ROW_GROUP_SIZE = 4096
+
+# Orçamento do cache LRU de grupos de linhas já lidos (bytes)
+PARTITION_CACHE_BYTES = 256 * 1024 * 1024
+
+# Colunas com o retângulo envolvente de cada linha (estatísticas min/max por row group)
+BBOX_COLUMNS = ('bbox_xmin', 'bbox_ymin', 'bbox_xmax', 'bbox_ymax')
+
+
+def quadkeys(lon: np.ndarray, lat: np.ndarray, zoom: int) -> np.ndarray:
+    """Quadkey (Bing Maps) do tile Web Mercator de cada ponto no zoom dado"""
+    x, y = mercator(lon, lat)
+    n = 2 ** zoom
+    tx = np.clip(np.floor(x * n), 0, n - 1).astype(np.int64)
+    ty = np.clip(np.floor(y * n), 0, n - 1).astype(np.int64)
+    bits = np.arange(zoom - 1, -1, -1)
+    digits = ((tx[:, None] >> bits) & 1) + 2 * ((ty[:, None] >> bits) & 1)
+    chars = np.ascontiguousarray((digits + ord('0')).astype(np.uint8))
+    return chars.view(f'S{zoom}').ravel().astype(str)
+
+
+def _intersects(boxes: np.ndarray, bbox: Tuple[float, float, float, float]) -> np.ndarray:
+    """Máscara dos retângulos (n x 4: xmin, ymin, xmax, ymax) que tocam o bbox"""
+    boxes = np.asarray(boxes, dtype=float).reshape(-1, 4)
+    return (
+        (boxes[:, 0] <= bbox[2]) & (boxes[:, 2] >= bbox[0]) &
+        (boxes[:, 1] <= bbox[3]) & (boxes[:, 3] >= bbox[1])
+    )
+
+
+def _row_group_boxes(metadata: pq.FileMetaData) -> np.ndarray:
+    """Retângulo de cada row group a partir das estatísticas min/max das colunas de bbox"""
+    names = metadata.schema.to_arrow_schema().names
+    columns = [names.index(name) for name in BBOX_COLUMNS]
+    boxes = np.empty((metadata.num_row_groups, 4))
+    for rg in range(metadata.num_row_groups):
+        group = metadata.row_group(rg)
+        for k, column in enumerate(columns):
+            stats = group.column(column).statistics
+            if stats is None or not stats.has_min_max:
+                # Sem estatísticas o row group nunca é descartado
+                boxes[rg, k] = -np.inf if k < 2 else np.inf
+            else:
+                boxes[rg, k] = stats.min if k < 2 else stats.max
+    return boxes
+
+
+class PartitionedStore:
+    """
+    Camadas em GeoParquet particionado por quadkey, lidas apenas onde a consulta toca
+
+    Cada escrita grava, por partição (<raiz>/<camada>/quadkey=<qk>/), um arquivo
+    com linhas ordenadas por um quadkey mais fino e colunas de bbox por linha,
+    cujas estatísticas por row group permitem descartar grupos sem lê-los. O
+    catálogo (bbox de partições, arquivos e row groups) vem só dos rodapés dos
+    arquivos; os row groups lidos ficam num cache LRU limitado em bytes.
+
+    Uma carga substitui a camada inteira (replace): os arquivos são gravados
+    num diretório de staging, renomeado no lugar do atual ao final.
+    """
+
+    def __init__(
+        self,
+        root: str = PARTITIONED_DATA_PATH,
+        zoom: int = PARTITION_ZOOM,
+        cache_bytes: int = PARTITION_CACHE_BYTES
+    ):
+        self.root = root
+        self.zoom = zoom
+        self.cache_bytes = cache_bytes
+        # Camada -> (inode e ctime do diretório, catálogo); mudam quando a camada é substituída
+        self._catalogs: Dict[str, Tuple[Any, Dict[str, Dict[str, Any]]]] = {}
+        self._cache: 'OrderedDict[Tuple[str, int], pa.Table]' = OrderedDict()
+        self._cache_used = 0
+        self._hits = 0
+        self._misses = 0
+        self._lock = threading.Lock()
+
+    def _layer_path(self, layer: str) -> str:
+        """Diretório das partições da camada"""
+        return os.path.join(self.root, layer)
+
+    def _catalog(self, layer: str) -> Dict[str, Dict[str, Any]]:
+        """
+        Catálogo da camada (partição -> bbox e arquivos), lido dos rodapés
+
+        Relido quando o diretório da camada foi substituído, inclusive por
+        outro worker do gunicorn.
+        """
+        path = self._layer_path(layer)
+        try:
+            info = os.stat(path)
+            # Inodes são reaproveitados após a remoção; o rename também altera o ctime
+            stamp = (info.st_ino, info.st_ctime_ns)
+        except FileNotFoundError:
+            stamp = None
+        cached = self._catalogs.get(layer)
+        if cached is None or cached[0] != stamp:
+            catalog: Dict[str, Dict[str, Any]] = {}
+            if stamp is not None:
+                for directory in sorted(os.listdir(path)):
+                    if not directory.startswith('quadkey='):
+                        continue
+                    for name in sorted(os.listdir(os.path.join(path, directory))):
+                        if name.endswith('.parquet'):
+                            self._register(catalog, directory[len('quadkey='):], os.path.join(path, directory, name))
+            cached = self._catalogs[layer] = (stamp, catalog)
+        return cached[1]
+
+    @staticmethod
+    def _register(catalog: Dict[str, Dict[str, Any]], key: str, path: str):
+        """Adiciona um arquivo ao catálogo a partir do seu rodapé"""
+        metadata = pq.read_metadata(path)
+        boxes = _row_group_boxes(metadata)
+        entry = {
+            'path': path,
+            'rows': metadata.num_rows,
+            'bytes': os.path.getsize(path),
+            'bbox': [boxes[:, 0].min(), boxes[:, 1].min(), boxes[:, 2].max(), boxes[:, 3].max()],
+            'row_groups': boxes
+        }
+        partition = catalog.setdefault(key, {'bbox': entry['bbox'], 'files': []})
+        partition['bbox'] = [
+            min(partition['bbox'][0], entry['bbox'][0]), min(partition['bbox'][1], entry['bbox'][1]),
+            max(partition['bbox'][2], entry['bbox'][2]), max(partition['bbox'][3], entry['bbox'][3])
+        ]
+        partition['files'].append(entry)
+
+    @contextmanager
+    def replace(self, layer: str) -> Iterator[Callable[[gpd.GeoDataFrame], int]]:
+        """
+        Substitui a camada pelos dados gravados no bloco
+
+        Fornece uma função que grava um GeoDataFrame (chamada a cada lote do
+        arquivo) no staging; ao sair do bloco sem erro, o staging toma o lugar
+        da camada. Com erro, a camada anterior permanece intacta.
+        """
+        staging = os.path.join(self.root, f'.{layer}.staging-{uuid.uuid4().hex}')
+        try:
+            yield lambda gdf: self._write(staging, gdf)
+            self._swap(layer, staging)
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+
+    def _swap(self, layer: str, staging: str):
+        """Troca o diretório da camada pelo staging e descarta catálogo e cache da anterior"""
+        path = self._layer_path(layer)
+        previous = os.path.join(self.root, f'.{layer}.old-{uuid.uuid4().hex}')
+        os.makedirs(staging, exist_ok=True)
+        with self._lock:
+            if os.path.isdir(path):
+                os.rename(path, previous)
+            os.rename(staging, path)
+            self._catalogs.pop(layer, None)
+            for key in [key for key in self._cache if key[0].startswith(path + os.sep)]:
+                self._cache_used -= self._cache.pop(key).nbytes
+        shutil.rmtree(previous, ignore_errors=True)
+
+    def _write(self, root: str, gdf: gpd.GeoDataFrame) -> int:
+        """Grava as linhas com geometria sob `root`, um arquivo novo por partição tocada; retorna as gravadas"""
+        geometry = np.asarray(gdf.geometry.values, dtype=object)
+        valid = ~(shapely.is_missing(geometry) | shapely.is_empty(geometry))
+        if not valid.any():
+            return 0
+        gdf, geometry = gdf[valid], geometry[valid]
+
+        bounds = shapely.bounds(geometry)
+        lon = (bounds[:, 0] + bounds[:, 2]) / 2
+        lat = (bounds[:, 1] + bounds[:, 3]) / 2
+        fine = quadkeys(lon, lat, self.zoom + SORT_ZOOM_OFFSET)
+        order = np.argsort(fine, kind='stable')
+
+        data = pd.DataFrame(gdf.drop(columns=gdf.geometry.name)).iloc[order].reset_index(drop=True)
+        for k, name in enumerate(BBOX_COLUMNS):
+            data[name] = bounds[order, k]
+        data['geometry'] = shapely.to_wkb(geometry[order])
+        keys = pd.Series(fine[order]).str[:self.zoom].to_numpy()
+
+        # Valores mistos em colunas texto (ex.: número 105 e '105A') viram texto
+        for column in data.columns[data.dtypes == object]:
+            if column != 'geometry':
+                data[column] = data[column].map(lambda value: None if pd.isna(value) else str(value))
+
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+        for start, stop in zip(starts, np.r_[starts[1:], len(keys)]):
+            key = keys[start]
+            directory = os.path.join(root, f'quadkey={key}')
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, f'part-{uuid.uuid4().hex}.parquet')
+
+            part = data.iloc[start:stop]
+            table = pa.Table.from_pandas(part, preserve_index=False)
+            geo = {
+                'version': '1.0.0',
+                'primary_column': 'geometry',
+                'columns': {'geometry': {
+                    'encoding': 'WKB',
+                    'geometry_types': [],
+                    'crs': None,
+                    'bbox': [
+                        float(part['bbox_xmin'].min()), float(part['bbox_ymin'].min()),
+                        float(part['bbox_xmax'].max()), float(part['bbox_ymax'].max())
+                    ]
+                }}
+            }
+            table = table.replace_schema_metadata({
+                **(table.schema.metadata or {}),
+                b'geo': json.dumps(geo).encode('utf-8')
+            })
+            pq.write_table(table, path, row_group_size=ROW_GROUP_SIZE)
+
+        return int(valid.sum())
+
+    def _row_group(self, path: str, rg: int) -> Tuple[pa.Table, bool]:
+        """Row group do cache LRU ou lido do disco; retorna a tabela e se veio do cache"""
+        key = (path, rg)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self._hits += 1
+                return self._cache[key], True
+
+        table = pq.ParquetFile(path).read_row_group(rg)
+        with self._lock:
+            self._misses += 1
+            if key not in self._cache and table.nbytes <= self.cache_bytes:
+                self._cache[key] = table
+                self._cache_used += table.nbytes
+                while self._cache_used > self.cache_bytes:
+                    _, evicted = self._cache.popitem(last=False)
+                    self._cache_used -= evicted.nbytes
+        return table, False
+
+    def query(
+        self,
+        layer: str,
+        bbox: Tuple[float, float, float, float]
+    ) -> Tuple[gpd.GeoDataFrame, Dict[str, int]]:
+        """
+        Linhas cujo retângulo toca o bbox (lon/lat) e as contagens de E/S
+
+        Partições e arquivos são descartados pelo bbox do catálogo e row groups
+        pelas estatísticas das colunas de bbox; nas linhas dos grupos lidos o
+        filtro é aplicado pelo pyarrow antes da conversão para pandas.
+        """
+        io = {
+            'particoes': 0, 'particoes_ignoradas': 0, 'arquivos': 0,
+            'row_groups_lidos': 0, 'row_groups_ignorados': 0, 'row_groups_cache': 0, 'linhas_lidas': 0
+        }
+        frames: List[pd.DataFrame] = []
+
+        for partition in list(self._catalog(layer).values()):
+            if not _intersects(partition['bbox'], bbox)[0]:
+                io['particoes_ignoradas'] += 1
+                continue
+            io['particoes'] += 1
+
+            for entry in list(partition['files']):
+                hits = np.flatnonzero(_intersects(entry['row_groups'], bbox))
+                io['row_groups_ignorados'] += len(entry['row_groups']) - len(hits)
+                if not len(hits):
+                    continue
+                io['arquivos'] += 1
+
+                for rg in hits:
+                    table, cached = self._row_group(entry['path'], int(rg))
+                    io['row_groups_lidos'] += 1
+                    io['row_groups_cache'] += int(cached)
+                    io['linhas_lidas'] += table.num_rows
+                    mask = pc.and_(
+                        pc.and_(pc.less_equal(table['bbox_xmin'], bbox[2]), pc.greater_equal(table['bbox_xmax'], bbox[0])),
+                        pc.and_(pc.less_equal(table['bbox_ymin'], bbox[3]), pc.greater_equal(table['bbox_ymax'], bbox[1]))
+                    )
+                    selected = table.filter(mask)
+                    if selected.num_rows:
+                        frames.append(selected.to_pandas())
+
+        if not frames:
+            return gpd.GeoDataFrame({'geometry': []}, geometry='geometry', crs='EPSG:4326'), io
+
+        data = pd.concat(frames, ignore_index=True).drop(columns=list(BBOX_COLUMNS))
+        data['geometry'] = shapely.from_wkb(data['geometry'].to_numpy())
+        return gpd.GeoDataFrame(data, geometry='geometry', crs='EPSG:4326'), io
+
+    def describe(self) -> Dict[str, Any]:
+        """Partições, arquivos, row groups, linhas e bytes por camada, e uso do cache"""
+        layers = {}
+        if os.path.isdir(self.root):
+            for layer in sorted(os.listdir(self.root)):
+                # Diretórios de staging e de camadas substituídas começam com '.'
+                if layer.startswith('.') or not os.path.isdir(self._layer_path(layer)):
+                    continue
+                catalog = self._catalog(layer)
+                files = [entry for partition in catalog.values() for entry in partition['files']]
+                layers[layer] = {
+                    'particoes': len(catalog),
+                    'arquivos': len(files),
+                    'row_groups': int(sum(len(entry['row_groups']) for entry in files)),
+                    'linhas': int(sum(entry['rows'] for entry in files)),
+                    'bytes_disco': int(sum(entry['bytes'] for entry in files)),
+                    'bbox': [float(v) for v in np.r_[
+                        min(p['bbox'][0] for p in catalog.values()), min(p['bbox'][1] for p in catalog.values()),
+                        max(p['bbox'][2] for p in catalog.values()), max(p['bbox'][3] for p in catalog.values())
+                    ]] if catalog else None
+                }
+        return {
+            'root': self.root,
+            'zoom': self.zoom,
+            'camadas': layers,
+            'cache': {
+                'row_groups': len(self._cache),
+                'bytes': self._cache_used,
+                'limite_bytes': self.cache_bytes,
+                'hits': self._hits,
+                'misses': self._misses
+            }
+        }
@@ -0,0 +1,201 @@
+import cProfile
+import hmac
+import json
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+
+# Token exigido no header X-Profile-Token; vazio desabilita a captura de perfis
+PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN', '')
+
+# Diretório dos perfis capturados (volume /data do docker-compose, visível a todos os workers)
+PROFILE_PATH = os.environ.get('PROFILE_PATH', '/data/profiles')
+
+# Perfis mantidos em disco (os mais antigos são removidos)
+PROFILE_MAX_ENTRIES = 50
+
+# Intervalo entre amostras de pilha (segundos)
+SAMPLE_INTERVAL_SECONDS = 0.001
+
+# Funções listadas no resumo do perfil (maior tempo acumulado)
+PROFILE_TOP_FUNCTIONS = 30
+
+# Identificadores gerados por uuid4().hex
+PROFILE_ID = re.compile(r'^[0-9a-f]{32}$')
+
+# Uma captura por processo (cProfile não admite perfis simultâneos)
+_capture_lock = threading.Lock()
+
+
+def requested(flag: Optional[str]) -> bool:
+    """Se o header X-Profile ou o parâmetro `profile` pede a captura"""
+    return bool(flag) and flag.lower() not in ('0', 'false', 'no')
+
+
+def authorized(token: Optional[str]) -> bool:
+    """Se a captura está habilitada e o token confere"""
+    return bool(PROFILE_TOKEN) and hmac.compare_digest((token or '').encode(), PROFILE_TOKEN.encode())
+
+
+def _frame_name(frame) -> str:
+    """Nome da função com arquivo e linha de definição, como nos flamegraphs"""
+    code = frame.f_code
+    return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+
+class Capture:
+    """
+    Perfil de uma requisição: cProfile (pstats) e amostras de pilha (flamegraph)
+
+    As duas medições cobrem a thread que atende a requisição; no FastAPI é o
+    loop de eventos, então requisições concorrentes no mesmo loop também
+    aparecem no perfil.
+    """
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL_SECONDS):
+        self.interval = interval
+        self.profiler = cProfile.Profile()
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._target = threading.get_ident()
+        self._stopped = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, name='profile-sampler', daemon=True)
+        self._begin = time.perf_counter()
+        self.seconds = 0.0
+
+    def _sample(self):
+        """Amostra a pilha da thread alvo até a captura terminar"""
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame))
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+                self.samples += 1
+
+    def start(self):
+        """Inicia a amostragem e o cProfile na thread atual"""
+        self._sampler.start()
+        self.profiler.enable()
+
+    def stop(self):
+        """Encerra a captura e libera o processo para a próxima (idempotente)"""
+        if self._stopped.is_set():
+            return
+        self.profiler.disable()
+        self._stopped.set()
+        self._sampler.join()
+        self.seconds = time.perf_counter() - self._begin
+        _capture_lock.release()
+
+    def collapsed(self) -> str:
+        """Pilhas no formato collapsed (flamegraph.pl, speedscope)"""
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+    def top_functions(self) -> List[Dict[str, Any]]:
+        """Funções com maior tempo acumulado no cProfile"""
+        stats = pstats.Stats(self.profiler)
+        rows = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:PROFILE_TOP_FUNCTIONS]
+        return [
+            {
+                'funcao': f'{name} ({os.path.basename(filename)}:{line})',
+                'chamadas': calls,
+                'tempo_proprio_s': own,
+                'tempo_acumulado_s': cumulative
+            }
+            for (filename, line, name), (_, calls, own, cumulative, _) in rows
+        ]
+
+    def save(self, request: Dict[str, Any], path: str = PROFILE_PATH) -> str:
+        """Grava pstats, pilhas e resumo em `path`; retorna o id do perfil"""
+        profile_id = uuid.uuid4().hex
+        os.makedirs(path, exist_ok=True)
+        self.profiler.dump_stats(os.path.join(path, f'{profile_id}.pstats'))
+        with open(os.path.join(path, f'{profile_id}.collapsed'), 'w', encoding='utf-8') as f:
+            f.write(self.collapsed())
+
+        summary = {
+            'id': profile_id,
+            'criado_em': datetime.now(timezone.utc).isoformat(),
+            'requisicao': request,
+            'duracao_ms': self.seconds * 1000,
+            'amostras': self.samples,
+            'intervalo_amostragem_ms': self.interval * 1000,
+            'funcoes': self.top_functions()
+        }
+        with open(os.path.join(path, f'{profile_id}.json'), 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False)
+
+        _prune(path)
+        return profile_id
+
+
+def start() -> Optional[Capture]:
+    """Inicia uma captura na thread atual, ou None se já houver outra em andamento"""
+    if not _capture_lock.acquire(blocking=False):
+        return None
+    capture = Capture()
+    capture.start()
+    return capture
+
+
+def _prune(path: str):
+    """Remove os perfis mais antigos além de PROFILE_MAX_ENTRIES"""
+    summaries = sorted(
+        (entry for entry in os.scandir(path) if entry.name.endswith('.json')),
+        key=lambda entry: entry.stat().st_mtime
+    )
+    for entry in summaries[:-PROFILE_MAX_ENTRIES]:
+        profile_id = entry.name[:-len('.json')]
+        for suffix in ('.json', '.pstats', '.collapsed'):
+            try:
+                os.remove(os.path.join(path, profile_id + suffix))
+            except FileNotFoundError:
+                pass
+
+
+def profile_file(profile_id: str, kind: str, path: str = PROFILE_PATH) -> str:
+    """
+    Caminho do arquivo do perfil ('json', 'pstats' ou 'collapsed')
+
+    Ids inválidos ou perfis inexistentes geram KeyError.
+    """
+    if not PROFILE_ID.match(profile_id):
+        raise KeyError(profile_id)
+    file_path = os.path.join(path, f'{profile_id}.{kind}')
+    if not os.path.exists(file_path):
+        raise KeyError(profile_id)
+    return file_path
+
+
+def load(profile_id: str, path: str = PROFILE_PATH) -> Dict[str, Any]:
+    """Resumo do perfil (requisição, duração e funções mais custosas)"""
+    with open(profile_file(profile_id, 'json', path), encoding='utf-8') as f:
+        return json.load(f)
+
+
+def list_profiles(path: str = PROFILE_PATH) -> List[Dict[str, Any]]:
+    """Perfis em disco, do mais recente ao mais antigo (sem a lista de funções)"""
+    if not os.path.isdir(path):
+        return []
+    profiles = []
+    for entry in os.scandir(path):
+        if entry.name.endswith('.json'):
+            try:
+                with open(entry.path, encoding='utf-8') as f:
+                    summary = json.load(f)
+            except (OSError, ValueError):
+                continue
+            summary.pop('funcoes', None)
+            profiles.append(summary)
+    return sorted(profiles, key=lambda summary: summary['criado_em'], reverse=True)
@@ -0,0 +1,235 @@
+import numpy as np
+import shapely
+from scipy import sparse
+from typing import Any, Dict, List, Optional, Sequence
+
+from grid import bin_square, square_polygons
+
+
+# Lados das células (metros) das resoluções pré-calculadas, da mais fina à mais grossa
+RESOLUTIONS = (250.0, 500.0, 1000.0, 2000.0)
+
+# Nível escolhido: maior célula com lado <= raio / CELLS_PER_RADIUS
+CELLS_PER_RADIUS = 4
+
+# Erro relativo máximo dos quantis obtidos dos sketches logarítmicos
+SKETCH_ACCURACY = 0.01
+
+
+def _gamma(accuracy: float) -> float:
+    """Razão entre limites consecutivos das faixas logarítmicas do sketch"""
+    return (1 + accuracy) / (1 - accuracy)
+
+
+def sketch_bins(values: np.ndarray, accuracy: float = SKETCH_ACCURACY) -> np.ndarray:
+    """Faixa logarítmica de cada valor positivo (faixa i cobre (γ^(i-1), γ^i])"""
+    return np.ceil(np.log(values) / np.log(_gamma(accuracy))).astype(np.int64)
+
+
+def sketch_quantiles(
+    counts: np.ndarray,
+    bin_offset: int,
+    quantiles: Sequence[float],
+    accuracy: float = SKETCH_ACCURACY
+) -> Optional[Dict[str, float]]:
+    """Quantis a partir das contagens por faixa (erro relativo <= accuracy)"""
+    total = counts.sum()
+    if total <= 0:
+        return None
+    gamma = _gamma(accuracy)
+    cumulative = np.cumsum(counts)
+    result = {}
+    for q in quantiles:
+        idx = int(np.searchsorted(cumulative, q * (total - 1), side='right'))
+        result[f'p{int(round(q * 100))}'] = float(2 * gamma ** (idx + bin_offset) / (gamma + 1))
+    return result
+
+
+def _build_level(
+    x: np.ndarray,
+    y: np.ndarray,
+    columns: Dict[str, np.ndarray],
+    sketched: Sequence[str],
+    size: float,
+    accuracy: float
+) -> Dict[str, Any]:
+    """Somas, contagens, extremos e sketches por célula quadrada de lado `size`"""
+    i, j = bin_square(x, y, size)
+    order = np.lexsort((j, i))
+    si, sj = i[order], j[order]
+    starts = np.flatnonzero(np.r_[True, (si[1:] != si[:-1]) | (sj[1:] != sj[:-1])])
+    offsets = np.r_[starts, len(order)]
+    n_cells = len(starts)
+
+    cell_of = np.empty(len(order), dtype=np.int64)
+    cell_of[order] = np.repeat(np.arange(n_cells), np.diff(offsets))
+
+    level = {
+        'size': size,
+        'i': si[starts],
+        'j': sj[starts],
+        'order': order,
+        'offsets': offsets,
+        'count': np.diff(offsets),
+        'columns': {}
+    }
+
+    for name, values in columns.items():
+        valid = np.isfinite(values) & (values != 0)
+        sorted_values = values[order]
+        sorted_valid = valid[order]
+        aggregate = {
+            'n': np.bincount(cell_of[valid], minlength=n_cells),
+            'sum': np.bincount(cell_of[valid], weights=values[valid], minlength=n_cells),
+            'min': np.minimum.reduceat(np.where(sorted_valid, sorted_values, np.inf), starts),
+            'max': np.maximum.reduceat(np.where(sorted_valid, sorted_values, -np.inf), starts)
+        }
+
+        if name in sketched:
+            positive = valid & (values > 0)
+            bins = sketch_bins(values[positive], accuracy)
+            offset = int(bins.min()) if len(bins) else 0
+            width = int(bins.max()) - offset + 1 if len(bins) else 1
+            aggregate['sketch'] = sparse.csr_matrix(
+                (np.ones(len(bins)), (cell_of[positive], bins - offset)),
+                shape=(n_cells, width)
+            )
+            aggregate['bin_offset'] = offset
+
+        level['columns'][name] = aggregate
+
+    return level
+
+
+def build_pyramid(
+    x: np.ndarray,
+    y: np.ndarray,
+    columns: Dict[str, np.ndarray],
+    sketched: Sequence[str] = (),
+    resolutions: Sequence[float] = RESOLUTIONS,
+    accuracy: float = SKETCH_ACCURACY
+) -> Dict[str, Any]:
+    """Pirâmide de agregados por célula em várias resoluções (coordenadas em metros)"""
+    return {
+        'x': x,
+        'y': y,
+        'columns': columns,
+        'accuracy': accuracy,
+        'levels': [_build_level(x, y, columns, sketched, size, accuracy) for size in sorted(resolutions)]
+    }
+
+
+def _select_level(levels: List[Dict[str, Any]], radius: float) -> Dict[str, Any]:
+    """Maior resolução cujas células cabem CELLS_PER_RADIUS vezes no raio"""
+    fitting = [level for level in levels if level['size'] <= radius / CELLS_PER_RADIUS]
+    return fitting[-1] if fitting else levels[0]
+
+
+def query_pyramid(
+    pyramid: Dict[str, Any],
+    cx: float,
+    cy: float,
+    radius: float,
+    refine: bool = True,
+    quantiles: Sequence[float] = (0.25, 0.5, 0.75)
+) -> Dict[str, Any]:
+    """
+    Agregados dos pontos dentro do círculo a partir da pirâmide
+
+    Células inteiramente dentro do círculo são somadas direto; as de borda
+    são refinadas ponto a ponto (refine=True, resultado exato exceto quantis)
+    ou ponderadas pela fração de área dentro do círculo, com limites de erro.
+    """
+    level = _select_level(pyramid['levels'], radius)
+    size = level['size']
+
+    # Distâncias mínima e máxima do centro a cada célula
+    x0, y0 = level['i'] * size, level['j'] * size
+    x1, y1 = x0 + size, y0 + size
+    dx_min = np.maximum.reduce([x0 - cx, np.zeros_like(x0, dtype=float), cx - x1])
+    dy_min = np.maximum.reduce([y0 - cy, np.zeros_like(y0, dtype=float), cy - y1])
+    dx_max = np.maximum(np.abs(cx - x0), np.abs(cx - x1))
+    dy_max = np.maximum(np.abs(cy - y0), np.abs(cy - y1))
+
+    inside = np.hypot(dx_max, dy_max) <= radius
+    boundary = ~inside & (np.hypot(dx_min, dy_min) <= radius)
+    boundary_cells = np.flatnonzero(boundary)
+
+    interior_count = int(level['count'][inside].sum())
+    boundary_count = int(level['count'][boundary].sum())
+    count = float(interior_count)
+
+    if refine:
+        offsets = level['offsets']
+        points = np.concatenate(
+            [level['order'][offsets[c]:offsets[c + 1]] for c in boundary_cells]
+        ) if len(boundary_cells) else np.empty(0, dtype=np.int64)
+        points = points[np.hypot(pyramid['x'][points] - cx, pyramid['y'][points] - cy) <= radius]
+        count += len(points)
+        weights = None
+    else:
+        boxes = shapely.polygons(square_polygons(level['i'][boundary_cells], level['j'][boundary_cells], size))
+        circle = shapely.Point(cx, cy).buffer(radius, quad_segs=32)
+        weights = shapely.area(shapely.intersection(boxes, circle)) / (size * size)
+        count += float((weights * level['count'][boundary_cells]).sum())
+
+    result = {
+        'level_meters': size,
+        'cells_interior': int(inside.sum()),
+        'cells_boundary': int(len(boundary_cells)),
+        'refined': refine,
+        'count': int(round(count)),
+        'count_bounds': [int(round(count))] * 2 if refine else [interior_count, interior_count + boundary_count],
+        'quantile_relative_error': pyramid['accuracy'],
+        'columns': {}
+    }
+
+    for name, aggregate in level['columns'].items():
+        n = float(aggregate['n'][inside].sum())
+        total = float(aggregate['sum'][inside].sum())
+        low = float(aggregate['min'][inside].min()) if inside.any() else np.inf
+        high = float(aggregate['max'][inside].max()) if inside.any() else -np.inf
+        histogram = np.asarray(aggregate['sketch'][inside].sum(axis=0)).ravel() if 'sketch' in aggregate else None
+        interior_mean = total / n if n else None
+
+        if refine:
+            values = pyramid['columns'][name][points]
+            values = values[np.isfinite(values) & (values != 0)]
+            n += len(values)
+            total += float(values.sum())
+            if len(values):
+                low, high = min(low, float(values.min())), max(high, float(values.max()))
+            if histogram is not None:
+                positive = values[values > 0]
+                bins = sketch_bins(positive, pyramid['accuracy']) - aggregate['bin_offset']
+                histogram = histogram + np.bincount(bins, minlength=len(histogram))
+        else:
+            n += float((weights * aggregate['n'][boundary_cells]).sum())
+            total += float((weights * aggregate['sum'][boundary_cells]).sum())
+            if histogram is not None and len(boundary_cells):
+                histogram = histogram + np.asarray(
+                    aggregate['sketch'][boundary_cells].multiply(weights[:, None]).sum(axis=0)
+                ).ravel()
+
+        mean = total / n if n else None
+        column = {'n': int(round(n)), 'sum': total, 'mean': mean}
+
+        if refine:
+            column['mean_bounds'] = [mean, mean]
+            if np.isfinite(low):
+                column['min'], column['max'] = low, high
+        else:
+            # Média real = combinação do interior com valores das células de borda
+            edge = aggregate['n'][boundary_cells] > 0
+            candidates = [interior_mean] if interior_mean is not None else []
+            if edge.any():
+                candidates += [float(aggregate['min'][boundary_cells][edge].min()),
+                               float(aggregate['max'][boundary_cells][edge].max())]
+            column['mean_bounds'] = [min(candidates), max(candidates)] if candidates else [None, None]
+
+        if histogram is not None:
+            column['quantiles'] = sketch_quantiles(histogram, aggregate['bin_offset'], quantiles, pyramid['accuracy'])
+
+        result['columns'][name] = column
+
+    return result
@@ -1,49 +1,517 @@
 import geopandas as gpd
 import pandas as pd
-from shapely.geometry import Point, shape
+from shapely.geometry import shape
 from shapely.ops import unary_union
 import numpy as np
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Optional, Tuple, Callable, Iterator
+from collections import OrderedDict
+import shapely
 import json
+import os
+import copy
+import shutil
+import hashlib
+import threading
+import uuid
+import pyarrow as pa
+import pyarrow.parquet as pq
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+from scipy import sparse
+from scipy.spatial import cKDTree
+
+from grid import bin_square, bin_hex, square_centers, hex_centers, square_polygons, hex_polygons
+from interpolation import idw, ordinary_kriging, VARIOGRAM_MODELS
+from variogram import empirical_variogram, fit_variogram, fit_best_variogram
+from weights import knn_weights, distance_band_weights
+from markov import quantile_breaks, classify, spatial_markov, neighbor_transitions
+from autocorrelation import moran, lisa, QUADRANT_LABELS
+from pyramid import build_pyramid, query_pyramid
+from clustering import MIN_ZOOM, MAX_ZOOM, mercator, build_cluster_index, query_clusters, cluster_features
+import geocoding
+import metrics
+from geocoding import build_address_index, geocode_address, split_address, normalize_text
+from partitioned import PartitionedStore, PARTITIONED_DATA_PATH
+
+
+# Metros por grau de latitude (aproximação esférica)
+METERS_PER_DEGREE = 111320.0
+
+# Orçamento do cache LRU de resultados (corpos JSON e análises) por versão dos dados
+CACHE_MAX_BYTES = int(os.environ.get('CACHE_MAX_MB', '256')) * 1024 * 1024
+
+# Limite de células por superfície interpolada
+MAX_GRID_CELLS = 1_000_000
+
+# Nomes aceitos para as colunas de imóveis (snake_case ou formato original da planilha)
+IMOVEL_COLUMNS = {
+    'preco_total': ('preco_total', 'Preco Total'),
+    'metragem_privativa': ('metragem_privativa', 'Metragem Privativa'),
+    'dormitorios': ('dormitorios', 'Dormitorios'),
+    'bairro': ('bairro', 'Bairro'),
+    'status': ('status', 'Status'),
+    'incorporador': ('incorporador', 'Incorporador'),
+    'endereco': ('endereco', 'Endereco'),
+    'unidades_total': ('unidades_total', 'Unidades Total'),
+    'unidades_vendidas': ('unidades_vendidas', 'Unidades Vendidas'),
+    'estoque_atual': ('estoque_atual', 'Estoque Atual'),
+}
+
+# Dimensões e medidas do cubo de imóveis (/cube)
+CUBE_DIMENSIONS = ('bairro', 'dormitorios', 'status', 'incorporador')
+CUBE_MEASURES = ('imoveis', 'unidades', 'vendidas', 'estoque', 'preco_m2_soma', 'preco_m2_n')
+
+# Features por evento na análise progressiva (/analyze/stream)
+STREAM_CHUNK_SIZE = 200
+
+# Linhas lidas por vez na ingestão particionada (memória limitada a um lote)
+INGEST_BATCH_ROWS = 100_000
+
+# Custo estimado por geometria (objeto GEOS + Python) e por coordenada (x, y), em bytes
+GEOMETRY_OVERHEAD_BYTES = 160
+COORDINATE_BYTES = 16
+
+# Custo estimado por item do STRtree do geopandas (envelope, ponteiro e nós internos), em bytes
+STRTREE_ITEM_BYTES = 56
+
+# Índices e arrays derivados mantidos fora do cache LRU; os primeiros são índices espaciais
+SPATIAL_INDEX_CACHE_KEYS = ('point_index', 'pyramid', 'cluster_index')
+DERIVED_CACHE_KEYS = SPATIAL_INDEX_CACHE_KEYS + (
+    'bounds', 'lote_points', 'imovel_points', 'lote_market', 'observations', 'layer_observations'
+)
+
+# Altura por pavimento usada para converter limite_altura em número de pavimentos (m)
+FLOOR_HEIGHT_METERS = 3.0
+
+# Colunas de capacidade urbanística derivadas na carga -> chave agregada nas estatísticas
+LOTE_CAPACITY_TOTALS = {
+    'area_construivel_max': 'area_construivel_total',
+    'area_projecao_max': 'area_projecao_total',
+    'area_construida_estimada': 'area_construida_estimada_total',
+    'potencial_remanescente': 'potencial_remanescente_total',
+}
+LOTE_CAPACITY_MEANS = {
+    'potencial_utilizado': 'potencial_utilizado_medio',
+    'pavimentos_permitidos': 'pavimentos_permitidos_medio',
+}
+
+
+def project_to_meters(lon: np.ndarray, lat: np.ndarray, ref_lat: float) -> Tuple[np.ndarray, np.ndarray]:
+    """Projeta lon/lat em metros (equiretangular local centrada em ref_lat)"""
+    scale_x = METERS_PER_DEGREE * np.cos(np.radians(ref_lat))
+    return np.asarray(lon, dtype=float) * scale_x, np.asarray(lat, dtype=float) * METERS_PER_DEGREE
+
+
+def _json_values(values: np.ndarray) -> list:
+    """Converte array numpy em lista JSON (NaN vira None)"""
+    values = np.asarray(values, dtype=float)
+    return np.where(np.isfinite(values), values, None).tolist()
+
+
+def _deep_bytes(value: Any) -> int:
+    """Bytes aproximados de um resultado em cache (arrays, tabelas, árvores e containers)"""
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    if isinstance(value, (bytes, bytearray, str)):
+        return len(value)
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        usage = value.memory_usage(deep=True)
+        return int(usage.sum() if isinstance(usage, pd.Series) else usage)
+    if isinstance(value, cKDTree):
+        return int(value.data.nbytes + value.indices.nbytes)
+    if sparse.issparse(value):
+        value = value.tocsr()
+        return int(value.data.nbytes + value.indices.nbytes + value.indptr.nbytes)
+    if isinstance(value, dict):
+        return sum(_deep_bytes(item) for item in value.values()) + 64 * len(value)
+    if isinstance(value, (list, tuple)):
+        return sum(_deep_bytes(item) for item in value) + 8 * len(value)
+    return 32
+
+
+def unproject_from_meters(x: np.ndarray, y: np.ndarray, ref_lat: float) -> Tuple[np.ndarray, np.ndarray]:
+    """Inverso de project_to_meters"""
+    scale_x = METERS_PER_DEGREE * np.cos(np.radians(ref_lat))
+    return np.asarray(x, dtype=float) / scale_x, np.asarray(y, dtype=float) / METERS_PER_DEGREE
 
 
 class SpatialEngine:
     """Motor de análise geoespacial para dados imobiliários"""
 
-    def __init__(self):
+    def __init__(self, store_path: str = PARTITIONED_DATA_PATH):
         self.lotes_gdf: Optional[gpd.GeoDataFrame] = None
         self.imoveis_gdf: Optional[gpd.GeoDataFrame] = None
         self.crs = "EPSG:4326"  # WGS84
 
+        # Versão dos dados: incrementada a cada carga, invalida o cache
+        self.version = 0
+        self.modified_at = datetime.now(timezone.utc)
+
+        # Índices e arrays derivados (um por camada/atributo, nunca descartados
+        # dentro da versão) e resultados dependentes dos parâmetros do cliente
+        # (LRU limitado em bytes)
+        self._derived: Dict[Tuple, Any] = {}
+        self._cache: 'OrderedDict[Tuple, Any]' = OrderedDict()
+        self._cache_used = 0
+        self._cache_lock = threading.Lock()
+
+        # Identificador do processo: ETags de execuções diferentes nunca coincidem
+        self._instance = uuid.uuid4().hex[:8]
+
+        # Posição do lote que contém cada imóvel (-1 se nenhum)
+        self.imovel_lote_idx: np.ndarray = np.empty(0, dtype=np.int64)
+
+        # Cubo de agregados de imóveis (mantido entre versões e atualizado em cada adição)
+        self._imoveis_cube: Optional[pd.DataFrame] = None
+
+        # Geocodificação por endereço: índice dos lotes e cache, ambos por assinatura dos lotes
+        self._address_index: Optional[Tuple[str, Dict[str, Any]]] = None
+        self._geocode_cache: Optional[Tuple[str, Dict[str, Tuple[float, float, str]]]] = None
+        self.geocode_summary: Dict[str, int] = {}
+
+        # Memória medida por versão (camadas) e por entrada do cache e dos derivados
+        self._layer_usage: Optional[Tuple[int, Dict[str, Dict[str, int]]]] = None
+        self._cache_usage: Dict[Tuple, int] = {}
+        self._derived_usage: Dict[Tuple, int] = {}
+
+        # Armazenamento fora da memória (GeoParquet particionado por quadkey)
+        self.store = PartitionedStore(store_path)
+
+    def _touch(self):
+        """Marca os dados como alterados, descarta o cache e reconstrói índices e agregados"""
+        self.version += 1
+        self.modified_at = datetime.now(timezone.utc)
+        with self._cache_lock:
+            self._cache.clear()
+            self._cache_usage = {}
+            self._cache_used = 0
+        self._derived = {}
+        self._derived_usage = {}
+
+        self._point_index('lotes')
+        self._point_index('imoveis')
+        self._pyramid('lotes')
+        self._pyramid('imoveis')
+        self._cluster_index()
+
+    def _cached(self, key: Tuple, builder: Callable[[], Any]) -> Any:
+        """
+        Retorna o resultado em cache para a versão atual ou o constrói
+
+        Índices e arrays derivados (DERIVED_CACHE_KEYS) ficam até a próxima
+        versão; os demais resultados entram no LRU limitado a CACHE_MAX_BYTES,
+        de modo que respostas com parâmetros variados não expulsam os índices
+        nem crescem sem limite.
+        """
+        key = (self.version,) + key
+        if key[1] in DERIVED_CACHE_KEYS:
+            derived = self._derived
+            if key not in derived:
+                derived[key] = builder()
+            return derived[key]
+
+        with self._cache_lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+
+        value = builder()
+        size = _deep_bytes(value)
+        with self._cache_lock:
+            if key not in self._cache and size <= CACHE_MAX_BYTES and key[0] == self.version:
+                self._cache[key] = value
+                self._cache_usage[key] = size
+                self._cache_used += size
+                while self._cache_used > CACHE_MAX_BYTES:
+                    evicted, _ = self._cache.popitem(last=False)
+                    self._cache_used -= self._cache_usage.pop(evicted)
+        return value
+
+    def serialized(self, key: Tuple, builder: Callable[[], Any]) -> bytes:
+        """Corpo JSON (UTF-8) em cache para a versão atual dos dados"""
+        def build():
+            value = builder()
+            with metrics.stage('encode'):
+                return json.dumps(value, ensure_ascii=False, allow_nan=False, separators=(',', ':')).encode('utf-8')
+
+        return self._cached(('body',) + key, build)
+
+    def etag(self, *key) -> str:
+        """ETag da representação `key` na versão atual dos dados"""
+        digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()[:12]
+        return f'"{self._instance}-{self.version}-{digest}"'
+
+    def last_modified(self) -> str:
+        """Data da última alteração dos dados no formato HTTP"""
+        return format_datetime(self.modified_at, usegmt=True)
+
+    def not_modified(self, etag: str, if_none_match: Optional[str], if_modified_since: Optional[str]) -> bool:
+        """
+        Se o cliente já tem a representação atual (requisição condicional)
+
+        If-None-Match tem precedência; If-Modified-Since só é considerado sem
+        ele, já que tem resolução de segundos e duas cargas podem cair no
+        mesmo segundo.
+        """
+        if if_none_match:
+            tags = [tag.strip() for tag in if_none_match.split(',')]
+            return '*' in tags or etag in tags or f'W/{etag}' in tags
+        if if_modified_since:
+            try:
+                since = parsedate_to_datetime(if_modified_since)
+            except (TypeError, ValueError):
+                return False
+            if since.tzinfo is None:
+                since = since.replace(tzinfo=timezone.utc)
+            return self.modified_at.replace(microsecond=0) <= since
+        return False
+
+    def _imovel_column(self, name: str, gdf: Optional[gpd.GeoDataFrame] = None) -> Optional[str]:
+        """Resolve o nome real de uma coluna de imóveis (ver IMOVEL_COLUMNS)"""
+        gdf = self.imoveis_gdf if gdf is None else gdf
+        if gdf is None:
+            return None
+        for candidate in IMOVEL_COLUMNS.get(name, (name,)):
+            if candidate in gdf.columns:
+                return candidate
+        return None
+
+    @staticmethod
+    def _numeric(gdf: Optional[gpd.GeoDataFrame], column: Optional[str]) -> np.ndarray:
+        """Coluna como array float (NaN quando ausente ou não numérica)"""
+        if gdf is None:
+            return np.empty(0)
+        if column is None or column not in gdf.columns:
+            return np.full(len(gdf), np.nan)
+        return pd.to_numeric(gdf[column], errors='coerce').to_numpy(dtype=float)
+
+    @classmethod
+    def _derive_lote_columns(cls, gdf: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
+        """
+        Colunas de capacidade urbanística calculadas de forma vetorizada
+
+        area_construivel_max = area_terreno * ca; area_projecao_max = area_terreno * to;
+        pavimentos_permitidos = min(ca / to, limite_altura / FLOOR_HEIGHT_METERS);
+        área construída estimada pela projeção máxima * numeroPavimentos, e o
+        potencial utilizado/remanescente em relação à área construível.
+        """
+        area = cls._numeric(gdf, 'area_terreno')
+        ca = cls._numeric(gdf, 'ca')
+        to = cls._numeric(gdf, 'to')
+        altura = cls._numeric(gdf, 'limite_altura')
+        pavimentos = cls._numeric(gdf, 'numeroPavimentos')
+
+        construivel = area * ca
+        projecao = area * to
+        construida = projecao * pavimentos
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            por_indice = np.where(to > 0, ca / to, np.nan)
+            por_altura = np.where(altura > 0, altura / FLOOR_HEIGHT_METERS, np.nan)
+            utilizado = np.where(construivel > 0, construida / construivel, np.nan)
+        permitidos = np.floor(np.fmin(por_indice, por_altura) + 1e-9)
+
+        gdf['area_construivel_max'] = construivel
+        gdf['area_projecao_max'] = projecao
+        gdf['pavimentos_permitidos'] = permitidos
+        gdf['area_construida_estimada'] = construida
+        gdf['potencial_utilizado'] = utilizado
+        gdf['potencial_remanescente'] = np.maximum(construivel - construida, 0.0)
+        return gdf
+
+    @staticmethod
+    def _capacity_statistics(values: Dict[str, np.ndarray]) -> Dict[str, float]:
+        """Totais e médias das colunas de capacidade dos lotes (ignorando valores ausentes)"""
+        stats = {}
+        for column, key in LOTE_CAPACITY_TOTALS.items():
+            column_values = values[column][np.isfinite(values[column])]
+            if len(column_values):
+                stats[key] = float(column_values.sum())
+        for column, key in LOTE_CAPACITY_MEANS.items():
+            column_values = values[column][np.isfinite(values[column])]
+            if len(column_values):
+                stats[key] = float(column_values.mean())
+        return stats
+
+    @staticmethod
+    def _points_lonlat(gdf: Optional[gpd.GeoDataFrame]) -> Tuple[np.ndarray, np.ndarray]:
+        """Coordenadas (lon, lat) dos centróides; NaN para geometrias ausentes"""
+        if gdf is None or len(gdf) == 0:
+            return np.empty(0), np.empty(0)
+        centroids = shapely.centroid(np.asarray(gdf.geometry.values, dtype=object))
+        return shapely.get_x(centroids), shapely.get_y(centroids)
+
+    def _ref_lat(self) -> Optional[float]:
+        """Latitude de referência para projeção métrica (centro dos dados)"""
+        bounds = self._cached(('bounds',), self.get_bounds)
+        if bounds is None:
+            return None
+        return (bounds[1] + bounds[3]) / 2
+
+    def _lote_points(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Centróides dos lotes (lon, lat), em cache por versão"""
+        return self._cached(('lote_points',), lambda: self._points_lonlat(self.lotes_gdf))
+
+    def _imovel_points(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Pontos dos imóveis (lon, lat), em cache por versão"""
+        return self._cached(('imovel_points',), lambda: self._points_lonlat(self.imoveis_gdf))
+
+    def _point_index(self, layer: str) -> Optional[Tuple[cKDTree, np.ndarray, float]]:
+        """KD-tree dos pontos projetados em metros (centróides no caso de lotes) e suas posições"""
+
+        def build():
+            ref_lat = self._ref_lat()
+            lon, lat = self._lote_points() if layer == 'lotes' else self._imovel_points()
+            valid = np.isfinite(lon) & np.isfinite(lat)
+            if ref_lat is None or not valid.any():
+                return None
+            x, y = project_to_meters(lon[valid], lat[valid], ref_lat)
+            return cKDTree(np.column_stack([x, y])), np.flatnonzero(valid), ref_lat
+
+        return self._cached(('point_index', layer), build)
+
+    @staticmethod
+    def _filter_mask(gdf: gpd.GeoDataFrame, filters: Optional[Dict[str, Any]]) -> np.ndarray:
+        """Máscara vetorizada de igualdade para os filtros cujas colunas existem"""
+        mask = np.ones(len(gdf), dtype=bool)
+        for key, value in (filters or {}).items():
+            if key in gdf.columns:
+                mask &= (gdf[key] == value).to_numpy()
+        return mask
+
+    def _preco_m2(self, gdf: Optional[gpd.GeoDataFrame] = None) -> np.ndarray:
+        """Preço por m² de cada imóvel (NaN quando não calculável)"""
+        gdf = self.imoveis_gdf if gdf is None else gdf
+        preco = self._numeric(gdf, self._imovel_column('preco_total', gdf))
+        metragem = self._numeric(gdf, self._imovel_column('metragem_privativa', gdf))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(metragem > 0, preco / metragem, np.nan)
+
+    @staticmethod
+    def _match_within(geometries: np.ndarray, lotes: Optional[gpd.GeoDataFrame]) -> np.ndarray:
+        """Posição do lote que contém cada geometria (-1 se nenhum), via índice espacial"""
+        result = np.full(len(geometries), -1, dtype=np.int64)
+        if lotes is None or len(lotes) == 0 or len(geometries) == 0:
+            return result
+
+        points = shapely.centroid(np.asarray(geometries, dtype=object))
+        point_idx, lote_idx = lotes.sindex.query(points, predicate='within')
+
+        # Lotes sobrepostos: fica o de menor posição
+        order = np.lexsort((lote_idx, point_idx))
+        point_idx, lote_idx = point_idx[order], lote_idx[order]
+        _, first = np.unique(point_idx, return_index=True)
+        result[point_idx[first]] = lote_idx[first]
+        return result
+
+    def _lote_market(self) -> Dict[str, np.ndarray]:
+        """Agregados de mercado por lote (a partir da junção lote↔imóvel), em cache por versão"""
+        return self._cached(('lote_market',), self._build_lote_market)
+
+    def _build_lote_market(self) -> Dict[str, np.ndarray]:
+        """Soma unidades/estoque e calcula preço médio por m² dos imóveis de cada lote"""
+        n = len(self.lotes_gdf)
+        matched = self.imovel_lote_idx >= 0
+        idx = self.imovel_lote_idx[matched]
+
+        def total(name: str) -> np.ndarray:
+            values = self._numeric(self.imoveis_gdf, self._imovel_column(name))[matched]
+            return np.bincount(idx, weights=np.nan_to_num(values), minlength=n)
+
+        preco_m2 = self._preco_m2()[matched]
+        preco_ok = np.isfinite(preco_m2)
+        preco_sum = np.bincount(idx[preco_ok], weights=preco_m2[preco_ok], minlength=n)
+        preco_n = np.bincount(idx[preco_ok], minlength=n)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            preco_medio = np.where(preco_n > 0, preco_sum / preco_n, np.nan)
+
+        return {
+            'mercado_imoveis': np.bincount(idx, minlength=n),
+            'mercado_unidades': total('unidades_total'),
+            'mercado_vendidas': total('unidades_vendidas'),
+            'mercado_estoque': total('estoque_atual'),
+            'mercado_preco_m2': preco_medio
+        }
+
+    def staging_copy(self, layer: str) -> 'SpatialEngine':
+        """
+        Cópia rasa para recarregar `layer` sem afetar as consultas em andamento
+
+        As camadas são compartilhadas com o motor original; o que a carga
+        altera no lugar (a junção e, ao recarregar lotes, a geometria dos
+        imóveis geocodificados) é copiado. A versão continua a do original, de
+        modo que a cópia, trocada no lugar dele ao final, tem os ETags seguintes.
+        """
+        staged = copy.copy(self)
+        staged._derived = {}
+        staged._derived_usage = {}
+        staged._cache = OrderedDict()
+        staged._cache_usage = {}
+        staged._cache_used = 0
+        staged._cache_lock = threading.Lock()
+        staged._layer_usage = None
+        staged.imovel_lote_idx = self.imovel_lote_idx.copy()
+        if layer == 'lotes' and self.imoveis_gdf is not None:
+            staged.imoveis_gdf = self.imoveis_gdf.copy()
+        return staged
+
     def load_parquet_lotes(self, file_path: str) -> int:
         """Carrega dados de lotes de arquivo Parquet"""
-        df = pd.read_parquet(file_path)
+        with metrics.stage('read_parquet'):
+            df = pd.read_parquet(file_path)
 
         # Converter coluna geometry se for string
-        if 'geometry' in df.columns and isinstance(df['geometry'].iloc[0], str):
-            df['geometry'] = df['geometry'].apply(lambda x: shape(json.loads(x)) if pd.notna(x) else None)
-        elif 'geometry' in df.columns and isinstance(df['geometry'].iloc[0], dict):
-            df['geometry'] = df['geometry'].apply(lambda x: shape(x) if pd.notna(x) else None)
+        with metrics.stage('parse_geometry'):
+            if 'geometry' in df.columns and isinstance(df['geometry'].iloc[0], str):
+                df['geometry'] = df['geometry'].apply(lambda x: shape(json.loads(x)) if pd.notna(x) else None)
+            elif 'geometry' in df.columns and isinstance(df['geometry'].iloc[0], dict):
+                df['geometry'] = df['geometry'].apply(lambda x: shape(x) if pd.notna(x) else None)
+
+        with metrics.stage('derive_columns'):
+            self.lotes_gdf = self._derive_lote_columns(
+                gpd.GeoDataFrame(df.reset_index(drop=True), geometry='geometry', crs=self.crs)
+            )
+
+        # Regeocodificar contra os novos lotes (pendentes e já geocodificados) e refazer a junção de todos
+        if self.imoveis_gdf is not None:
+            with metrics.stage('geocode'):
+                self._geocode_missing(self.imoveis_gdf, refresh=True)
+            with metrics.stage('join'):
+                self.imovel_lote_idx = self._match_within(self.imoveis_gdf.geometry.values, self.lotes_gdf)
 
-        self.lotes_gdf = gpd.GeoDataFrame(df, geometry='geometry', crs=self.crs)
+        with metrics.stage('build_indexes'):
+            self._touch()
+        metrics.observe_size('load_lotes_rows', len(self.lotes_gdf))
         return len(self.lotes_gdf)
 
     def load_parquet_imoveis(self, file_path: str) -> int:
         """Carrega dados de imóveis de arquivo Parquet"""
-        df = pd.read_parquet(file_path)
+        with metrics.stage('read_parquet'):
+            df = pd.read_parquet(file_path)
 
-        # Se não houver geometria, tentar geocodificar baseado em endereço
-        if 'geometry' not in df.columns:
-            # Por enquanto, criar geometria vazia
-            df['geometry'] = None
-        else:
-            # Converter coluna geometry se for string ou dict
-            if isinstance(df['geometry'].iloc[0], str):
-                df['geometry'] = df['geometry'].apply(lambda x: shape(json.loads(x)) if pd.notna(x) else None)
-            elif isinstance(df['geometry'].iloc[0], dict):
-                df['geometry'] = df['geometry'].apply(lambda x: shape(x) if pd.notna(x) else None)
+        # Se não houver geometria, geocodificar pelo endereço (abaixo, contra os lotes)
+        with metrics.stage('parse_geometry'):
+            if 'geometry' not in df.columns:
+                df['geometry'] = None
+            else:
+                # Converter coluna geometry se for string ou dict
+                if isinstance(df['geometry'].iloc[0], str):
+                    df['geometry'] = df['geometry'].apply(lambda x: shape(json.loads(x)) if pd.notna(x) else None)
+                elif isinstance(df['geometry'].iloc[0], dict):
+                    df['geometry'] = df['geometry'].apply(lambda x: shape(x) if pd.notna(x) else None)
 
-        self.imoveis_gdf = gpd.GeoDataFrame(df, geometry='geometry', crs=self.crs)
+        self.imoveis_gdf = gpd.GeoDataFrame(df.reset_index(drop=True), geometry='geometry', crs=self.crs)
+        with metrics.stage('geocode'):
+            self._geocode_missing(self.imoveis_gdf)
+        with metrics.stage('join'):
+            self.imovel_lote_idx = self._match_within(self.imoveis_gdf.geometry.values, self.lotes_gdf)
+        with metrics.stage('build_cube'):
+            self._imoveis_cube = self._build_cube(self.imoveis_gdf)
+        with metrics.stage('build_indexes'):
+            self._touch()
+        metrics.observe_size('load_imoveis_rows', len(self.imoveis_gdf))
         return len(self.imoveis_gdf)
 
     def add_lotes_from_dataframe(self, df: pd.DataFrame) -> int:
@@ -54,13 +522,30 @@ class SpatialEngine:
                     lambda x: shape(json.loads(x) if isinstance(x, str) else x) if pd.notna(x) else None
                 )
 
-        new_gdf = gpd.GeoDataFrame(df, geometry='geometry', crs=self.crs)
+        new_gdf = self._derive_lote_columns(
+            gpd.GeoDataFrame(df.reset_index(drop=True), geometry='geometry', crs=self.crs)
+        )
+        offset = 0 if self.lotes_gdf is None else len(self.lotes_gdf)
 
         if self.lotes_gdf is None:
             self.lotes_gdf = new_gdf
         else:
             self.lotes_gdf = pd.concat([self.lotes_gdf, new_gdf], ignore_index=True)
 
+        # Junção incremental: apenas imóveis ainda sem lote contra os lotes novos
+        if self.imoveis_gdf is not None:
+            unmatched = np.flatnonzero(self.imovel_lote_idx < 0)
+            matches = self._match_within(self.imoveis_gdf.geometry.values[unmatched], new_gdf)
+            found = matches >= 0
+            self.imovel_lote_idx[unmatched[found]] = matches[found] + offset
+
+            # Imóveis pendentes de geocodificação podem cair em qualquer lote
+            geocoded = self._geocode_missing(self.imoveis_gdf)
+            self.imovel_lote_idx[geocoded] = self._match_within(
+                self.imoveis_gdf.geometry.values[geocoded], self.lotes_gdf
+            )
+
+        self._touch()
         return len(new_gdf)
 
     def add_imoveis_from_dataframe(self, df: pd.DataFrame) -> int:
@@ -72,13 +557,22 @@ class SpatialEngine:
                 lambda x: shape(json.loads(x) if isinstance(x, str) else x) if pd.notna(x) else None
             )
 
-        new_gdf = gpd.GeoDataFrame(df, geometry='geometry', crs=self.crs)
+        new_gdf = gpd.GeoDataFrame(df.reset_index(drop=True), geometry='geometry', crs=self.crs)
+        self._geocode_missing(new_gdf)
 
         if self.imoveis_gdf is None:
             self.imoveis_gdf = new_gdf
         else:
             self.imoveis_gdf = pd.concat([self.imoveis_gdf, new_gdf], ignore_index=True)
 
+        # Junção incremental: apenas os imóveis novos
+        new_matches = self._match_within(new_gdf.geometry.values, self.lotes_gdf)
+        self.imovel_lote_idx = np.concatenate([self.imovel_lote_idx, new_matches])
+
+        # Cubo incremental: agregados dos imóveis novos somados aos existentes
+        self._imoveis_cube = self._merge_cube(self._imoveis_cube, self._build_cube(new_gdf))
+
+        self._touch()
         return len(new_gdf)
 
     def analyze_radius(
@@ -86,52 +580,244 @@ class SpatialEngine:
         lat: float,
         lon: float,
         radius_meters: float,
-        filters: Optional[Dict[str, Any]] = None
+        filters: Optional[Dict[str, Any]] = None,
+        approximate: bool = False,
+        refine: bool = True
     ) -> Dict[str, Any]:
-        """Analisa uma área circular ao redor de um ponto"""
+        """
+        Analisa uma área circular ao redor de um ponto
 
-        # Criar ponto central
-        point = Point(lon, lat)
+        Lotes entram pela distância métrica do centróide ao ponto e imóveis
+        pela do próprio ponto (`distancia_metros` em cada feature), como em
+        analyze_rings, analyze_radius_stream e no modo aproximado.
+        """
+        if approximate:
+            return self._approximate_radius(lat, lon, radius_meters, filters, refine)
+        if radius_meters <= 0:
+            raise ValueError("radius_meters deve ser positivo")
 
-        # Criar buffer (aproximação em graus)
-        # 1 grau ~ 111km, então convertemos metros para graus
-        radius_degrees = radius_meters / 111000
-        buffer = point.buffer(radius_degrees)
+        # Mesma seleção de /analyze/rings e /analyze/stream: distância métrica via KD-tree,
+        # lotes pelo centróide; features do mais próximo ao mais distante
+        found = {}
+        nearby: Dict[str, List[Dict[str, Any]]] = {'lotes': [], 'imoveis': []}
+        for layer in ('lotes', 'imoveis'):
+            with metrics.stage(f'{layer}_radius'):
+                positions, distances = found[layer] = self._radius_candidates(layer, lat, lon, radius_meters, filters)
+            if len(positions) == 0:
+                continue
+            subset = (self.lotes_gdf if layer == 'lotes' else self.imoveis_gdf).iloc[positions]
+            if layer == 'lotes':
+                with metrics.stage('lotes_market'):
+                    subset = self._with_lote_market(subset)
+            with metrics.stage(f'{layer}_serialize'):
+                nearby[layer] = self._geodataframe_to_geojson(subset)
+            for feature, distance in zip(nearby[layer], distances):
+                feature['properties']['distancia_metros'] = float(distance)
+        lotes_nearby, imoveis_nearby = nearby['lotes'], nearby['imoveis']
 
-        # Filtrar lotes dentro do raio
-        lotes_nearby = []
-        if self.lotes_gdf is not None and len(self.lotes_gdf) > 0:
-            lotes_mask = self.lotes_gdf.geometry.intersects(buffer)
-            lotes_filtered = self.lotes_gdf[lotes_mask].copy()
+        # Calcular estatísticas
+        with metrics.stage('stats'):
+            stats = self._summarize_positions(found['lotes'][0], found['imoveis'][0])
+        metrics.observe_size('analyze_lotes', len(lotes_nearby))
+        metrics.observe_size('analyze_imoveis', len(imoveis_nearby))
 
-            # Aplicar filtros adicionais
-            if filters:
-                for key, value in filters.items():
-                    if key in lotes_filtered.columns:
-                        lotes_filtered = lotes_filtered[lotes_filtered[key] == value]
+        return {
+            'point': {'latitude': lat, 'longitude': lon},
+            'radius_meters': radius_meters,
+            'lotes_encontrados': len(lotes_nearby),
+            'imoveis_encontrados': len(imoveis_nearby),
+            'estatisticas': stats,
+            'lotes': lotes_nearby,
+            'imoveis': imoveis_nearby
+        }
 
-            lotes_nearby = self._geodataframe_to_geojson(lotes_filtered)
+    def _pyramid(self, layer: str) -> Optional[Dict[str, Any]]:
+        """Pirâmide de agregados por célula (somas, contagens, extremos e sketches de quantis)"""
 
-        # Filtrar imóveis dentro do raio
-        imoveis_nearby = []
-        if self.imoveis_gdf is not None and len(self.imoveis_gdf) > 0:
-            imoveis_mask = self.imoveis_gdf.geometry.notna() & self.imoveis_gdf.geometry.intersects(buffer)
-            imoveis_filtered = self.imoveis_gdf[imoveis_mask].copy()
+        def build():
+            index = self._point_index(layer)
+            if index is None:
+                return None
+            tree, positions, _ = index
+            if layer == 'lotes':
+                columns = {
+                    name: self._numeric(self.lotes_gdf, name)[positions]
+                    for name in ('area_terreno', 'area_construivel_max', 'potencial_remanescente')
+                }
+                sketched = ('area_terreno',)
+            else:
+                columns = {
+                    name: self._numeric(self.imoveis_gdf, self._imovel_column(name))[positions]
+                    for name in ('preco_total', 'metragem_privativa')
+                }
+                columns['preco_m2'] = self._preco_m2()[positions]
+                sketched = ('preco_total', 'preco_m2')
+            return build_pyramid(tree.data[:, 0], tree.data[:, 1], columns, sketched)
 
-            # Aplicar filtros adicionais
-            if filters:
-                for key, value in filters.items():
-                    if key in imoveis_filtered.columns:
-                        imoveis_filtered = imoveis_filtered[imoveis_filtered[key] == value]
+        return self._cached(('pyramid', layer), build)
 
-            imoveis_nearby = self._geodataframe_to_geojson(imoveis_filtered)
+    def _approximate_radius(
+        self,
+        lat: float,
+        lon: float,
+        radius_meters: float,
+        filters: Optional[Dict[str, Any]],
+        refine: bool
+    ) -> Dict[str, Any]:
+        """
+        Estatísticas do raio a partir da pirâmide de agregados, sem features
 
-        # Calcular estatísticas
-        stats = self._calculate_statistics(lotes_nearby, imoveis_nearby)
+        Custo proporcional ao número de células, não de pontos. Lotes contam
+        pelo centróide; com refine=False as células de borda entram pela
+        fração de área e o resultado traz limites de erro.
+        """
+        if filters:
+            raise ValueError("O modo aproximado não suporta filters")
+        if radius_meters <= 0:
+            raise ValueError("radius_meters deve ser positivo")
+
+        stats: Dict[str, Any] = {'lotes': {}, 'imoveis': {}}
+        approximation: Dict[str, Any] = {}
+        counts = {'lotes': 0, 'imoveis': 0}
+
+        # Coluna -> (chave da média, prefixo de min/max/quantis), como no modo exato
+        keys = {
+            'lotes': {'area_terreno': ('area_media', 'area')},
+            'imoveis': {
+                'preco_total': ('preco_medio', 'preco'),
+                'metragem_privativa': ('metragem_media', None),
+                'preco_m2': ('preco_m2_medio', 'preco_m2')
+            }
+        }
+
+        for layer in ('lotes', 'imoveis'):
+            pyramid = self._pyramid(layer)
+            if pyramid is None:
+                continue
+            ref_lat = self._point_index(layer)[2]
+            cx, cy = project_to_meters(np.array([lon]), np.array([lat]), ref_lat)
+            with metrics.stage(f'{layer}_pyramid'):
+                result = query_pyramid(pyramid, float(cx[0]), float(cy[0]), radius_meters, refine)
+            counts[layer] = result['count']
+
+            bounds = {}
+            for column, (mean_key, prefix) in keys[layer].items():
+                summary = result['columns'][column]
+                if summary['mean'] is None:
+                    continue
+                stats[layer][mean_key] = summary['mean']
+                bounds[f'{column}_mean_bounds'] = summary['mean_bounds']
+                if prefix is None:
+                    continue
+                if 'min' in summary and column != 'preco_m2':
+                    stats[layer][f'{prefix}_min'] = summary['min']
+                    stats[layer][f'{prefix}_max'] = summary['max']
+                if summary.get('quantiles'):
+                    stats[layer][f'{prefix}_quantis'] = summary['quantiles']
+                if column == 'area_terreno':
+                    stats[layer]['area_total'] = summary['sum']
+
+            # Totais de potencial construtivo (somas por célula)
+            for column, key in LOTE_CAPACITY_TOTALS.items():
+                if column in result['columns'] and result['columns'][column]['n']:
+                    stats[layer][key] = result['columns'][column]['sum']
+
+            approximation[layer] = {
+                'level_meters': result['level_meters'],
+                'cells_interior': result['cells_interior'],
+                'cells_boundary': result['cells_boundary'],
+                'refined': result['refined'],
+                'count_bounds': result['count_bounds'],
+                'quantile_relative_error': result['quantile_relative_error'],
+                **bounds
+            }
 
         return {
             'point': {'latitude': lat, 'longitude': lon},
             'radius_meters': radius_meters,
+            'lotes_encontrados': counts['lotes'],
+            'imoveis_encontrados': counts['imoveis'],
+            'estatisticas': stats,
+            'lotes': [],
+            'imoveis': [],
+            'aproximacao': approximation
+        }
+
+    @staticmethod
+    def _apply_filters(gdf: gpd.GeoDataFrame, filters: Optional[Dict[str, Any]]) -> gpd.GeoDataFrame:
+        """Aplica filtros de igualdade nas colunas existentes"""
+        if filters:
+            for key, value in filters.items():
+                if key in gdf.columns:
+                    gdf = gdf[gdf[key] == value]
+        return gdf
+
+    def _with_lote_market(self, lotes: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
+        """Métricas de mercado por lote: consulta direta na junção pré-calculada"""
+        if self.imoveis_gdf is not None and len(lotes) > 0:
+            lotes = lotes.copy()
+            positions = lotes.index.to_numpy()
+            for column, values in self._lote_market().items():
+                lotes[column] = values[positions]
+        return lotes
+
+    def analyze_polygon(
+        self,
+        geometry: Dict[str, Any],
+        filters: Optional[Dict[str, Any]] = None,
+        match: str = 'intersects'
+    ) -> Dict[str, Any]:
+        """
+        Analisa uma área poligonal (Polygon ou MultiPolygon GeoJSON)
+
+        match: 'intersects' (toca o polígono), 'within' (inteiramente dentro)
+        ou 'centroid' (centróide dentro, mais barato para lotes densos)
+        """
+        if match not in ('intersects', 'within', 'centroid'):
+            raise ValueError("match deve ser 'intersects', 'within' ou 'centroid'")
+        if geometry.get('type') == 'Feature':
+            geometry = geometry.get('geometry') or {}
+        if geometry.get('type') not in ('Polygon', 'MultiPolygon'):
+            raise ValueError("geometry deve ser um Polygon ou MultiPolygon GeoJSON")
+
+        polygon = shape(geometry)
+        if not polygon.is_valid:
+            polygon = polygon.buffer(0)
+        shapely.prepare(polygon)
+
+        lotes_nearby = []
+        if self.lotes_gdf is not None and len(self.lotes_gdf) > 0:
+            with metrics.stage('lotes_intersect'):
+                positions = self._polygon_positions('lotes', polygon, match)
+            with metrics.stage('lotes_filter'):
+                lotes_filtered = self._apply_filters(self.lotes_gdf.iloc[positions], filters)
+            with metrics.stage('lotes_market'):
+                lotes_filtered = self._with_lote_market(lotes_filtered)
+            with metrics.stage('lotes_serialize'):
+                lotes_nearby = self._geodataframe_to_geojson(lotes_filtered)
+
+        imoveis_nearby = []
+        if self.imoveis_gdf is not None and len(self.imoveis_gdf) > 0:
+            with metrics.stage('imoveis_intersect'):
+                positions = self._polygon_positions('imoveis', polygon, match)
+            with metrics.stage('imoveis_filter'):
+                imoveis_filtered = self._apply_filters(self.imoveis_gdf.iloc[positions], filters)
+            with metrics.stage('imoveis_serialize'):
+                imoveis_nearby = self._geodataframe_to_geojson(imoveis_filtered)
+
+        with metrics.stage('stats'):
+            stats = self._calculate_statistics(lotes_nearby, imoveis_nearby)
+        metrics.observe_size('analyze_lotes', len(lotes_nearby))
+        metrics.observe_size('analyze_imoveis', len(imoveis_nearby))
+
+        # Área em m² pela projeção local centrada no polígono
+        ref_lat = polygon.centroid.y
+        area = shapely.transform(polygon, lambda c: np.column_stack(project_to_meters(c[:, 0], c[:, 1], ref_lat))).area
+
+        return {
+            'geometry': geometry,
+            'match': match,
+            'area_m2': float(area),
             'lotes_encontrados': len(lotes_nearby),
             'imoveis_encontrados': len(imoveis_nearby),
             'estatisticas': stats,
@@ -139,6 +825,21 @@ class SpatialEngine:
             'imoveis': imoveis_nearby
         }
 
+    def _polygon_positions(self, layer: str, polygon, match: str) -> np.ndarray:
+        """Posições das feições que atendem ao modo de match (pré-filtro por bbox)"""
+        if match == 'centroid':
+            lon, lat = self._lote_points() if layer == 'lotes' else self._imovel_points()
+            minx, miny, maxx, maxy = polygon.bounds
+            candidates = np.flatnonzero((lon >= minx) & (lon <= maxx) & (lat >= miny) & (lat <= maxy))
+            return candidates[shapely.contains_xy(polygon, lon[candidates], lat[candidates])]
+
+        gdf = self.lotes_gdf if layer == 'lotes' else self.imoveis_gdf
+        candidates = np.sort(gdf.sindex.query(polygon))
+        geoms = np.asarray(gdf.geometry.values, dtype=object)[candidates]
+        if match == 'within':
+            return candidates[shapely.contains(polygon, geoms)]
+        return candidates[shapely.intersects(polygon, geoms)]
+
     def _geodataframe_to_geojson(self, gdf: gpd.GeoDataFrame) -> List[Dict[str, Any]]:
         """Converte GeoDataFrame para lista de features GeoJSON"""
         features = []
@@ -180,7 +881,13 @@ class SpatialEngine:
             bairros = [l['properties'].get('bairro') for l in lotes if l['properties'].get('bairro')]
             if bairros:
                 stats['lotes']['bairros_unicos'] = len(set(bairros))
-                stats['lotes']['distribuicao_bairros'] = dict(pd.Series(bairros).value_counts())
+                stats['lotes']['distribuicao_bairros'] = {k: int(v) for k, v in pd.Series(bairros).value_counts().items()}
+
+            # Potencial construtivo (colunas derivadas na carga)
+            stats['lotes'].update(self._capacity_statistics({
+                column: np.array([l['properties'].get(column) for l in lotes], dtype=float)
+                for column in (*LOTE_CAPACITY_TOTALS, *LOTE_CAPACITY_MEANS)
+            }))
 
         # Estatísticas de imóveis
         if imoveis:
@@ -196,29 +903,42 @@ class SpatialEngine:
 
             dormitorios = [i['properties'].get('dormitorios') for i in imoveis if i['properties'].get('dormitorios')]
             if dormitorios:
-                stats['imoveis']['distribuicao_dormitorios'] = dict(pd.Series(dormitorios).value_counts())
+                stats['imoveis']['distribuicao_dormitorios'] = {k: int(v) for k, v in pd.Series(dormitorios).value_counts().items()}
 
         return stats
 
-    def get_all_lotes_geojson(self) -> Dict[str, Any]:
-        """Retorna todos os lotes em formato GeoJSON"""
+    def get_all_lotes_geojson(self, bairro: Optional[str] = None, limit: Optional[int] = None) -> Dict[str, Any]:
+        """Retorna os lotes em formato GeoJSON (filtrados por bairro e limitados antes da conversão)"""
         if self.lotes_gdf is None or len(self.lotes_gdf) == 0:
             return {'type': 'FeatureCollection', 'features': []}
 
-        return {
-            'type': 'FeatureCollection',
-            'features': self._geodataframe_to_geojson(self.lotes_gdf)
-        }
+        with metrics.stage('lotes_select'):
+            rows = self._select_rows(self.lotes_gdf, bairro, limit)
+        with metrics.stage('lotes_serialize'):
+            features = self._geodataframe_to_geojson(rows)
+        metrics.observe_size('lotes_geojson', len(features))
+        return {'type': 'FeatureCollection', 'features': features}
 
-    def get_all_imoveis_geojson(self) -> Dict[str, Any]:
-        """Retorna todos os imóveis em formato GeoJSON"""
+    def get_all_imoveis_geojson(self, bairro: Optional[str] = None, limit: Optional[int] = None) -> Dict[str, Any]:
+        """Retorna os imóveis em formato GeoJSON (filtrados por bairro e limitados antes da conversão)"""
         if self.imoveis_gdf is None or len(self.imoveis_gdf) == 0:
             return {'type': 'FeatureCollection', 'features': []}
 
-        return {
-            'type': 'FeatureCollection',
-            'features': self._geodataframe_to_geojson(self.imoveis_gdf)
-        }
+        with metrics.stage('imoveis_select'):
+            rows = self._select_rows(self.imoveis_gdf, bairro, limit)
+        with metrics.stage('imoveis_serialize'):
+            features = self._geodataframe_to_geojson(rows)
+        metrics.observe_size('imoveis_geojson', len(features))
+        return {'type': 'FeatureCollection', 'features': features}
+
+    @staticmethod
+    def _select_rows(gdf: gpd.GeoDataFrame, bairro: Optional[str], limit: Optional[int]) -> gpd.GeoDataFrame:
+        """Linhas com a propriedade 'bairro' igual à pedida, limitadas às primeiras `limit`"""
+        if bairro:
+            gdf = gdf[gdf['bairro'] == bairro] if 'bairro' in gdf.columns else gdf.iloc[:0]
+        if limit:
+            gdf = gdf.head(limit)
+        return gdf
 
     def get_bounds(self) -> Optional[Tuple[float, float, float, float]]:
         """Retorna os limites geográficos dos dados (minx, miny, maxx, maxy)"""
@@ -243,3 +963,1476 @@ class SpatialEngine:
             float(all_bounds[:, 2].max()),  # maxx
             float(all_bounds[:, 3].max())   # maxy
         )
+
+    def aggregate_grid(self, cell_size: float = 500, grid_type: str = 'square') -> Dict[str, Any]:
+        """Agrega lotes e imóveis em células quadradas ou hexagonais (heatmap)"""
+        if grid_type not in ('square', 'hex'):
+            raise ValueError("grid_type deve ser 'square' ou 'hex'")
+        if cell_size <= 0:
+            raise ValueError("cell_size deve ser positivo")
+
+        return self._cached(
+            ('grid', float(cell_size), grid_type),
+            lambda: self._build_grid(float(cell_size), grid_type)
+        )
+
+    def _build_grid(self, cell_size: float, grid_type: str) -> Dict[str, Any]:
+        """Calcula a agregação em grade com binning vetorizado"""
+        result = {
+            'type': 'FeatureCollection',
+            'cell_size': cell_size,
+            'grid_type': grid_type,
+            'version': self.version,
+            'features': []
+        }
+
+        ref_lat = self._ref_lat()
+        if ref_lat is None:
+            return result
+
+        bin_cells = bin_square if grid_type == 'square' else bin_hex
+
+        # Binning dos centróides de lotes
+        lon, lat = self._lote_points()
+        lotes_valid = np.isfinite(lon) & np.isfinite(lat)
+        x, y = project_to_meters(lon[lotes_valid], lat[lotes_valid], ref_lat)
+        lotes_i, lotes_j = bin_cells(x, y, cell_size)
+        area = self._numeric(self.lotes_gdf, 'area_terreno')[lotes_valid]
+        construivel = self._numeric(self.lotes_gdf, 'area_construivel_max')[lotes_valid]
+        remanescente = self._numeric(self.lotes_gdf, 'potencial_remanescente')[lotes_valid]
+
+        # Binning dos pontos de imóveis
+        lon, lat = self._imovel_points()
+        imoveis_valid = np.isfinite(lon) & np.isfinite(lat)
+        x, y = project_to_meters(lon[imoveis_valid], lat[imoveis_valid], ref_lat)
+        imoveis_i, imoveis_j = bin_cells(x, y, cell_size)
+        preco_m2 = self._preco_m2()[imoveis_valid]
+
+        all_i = np.concatenate([lotes_i, imoveis_i])
+        all_j = np.concatenate([lotes_j, imoveis_j])
+        if all_i.size == 0:
+            return result
+
+        # Chave única por célula e índice inverso para bincount
+        span = int(all_j.max() - all_j.min()) + 1
+        keys = (all_i - all_i.min()) * span + (all_j - all_j.min())
+        unique_keys, inverse = np.unique(keys, return_inverse=True)
+        n_cells = len(unique_keys)
+        lotes_inv = inverse[:len(lotes_i)]
+        imoveis_inv = inverse[len(lotes_i):]
+
+        cell_i = unique_keys // span + all_i.min()
+        cell_j = unique_keys % span + all_j.min()
+
+        lotes_count = np.bincount(lotes_inv, minlength=n_cells)
+        area_total = np.bincount(lotes_inv, weights=np.nan_to_num(area), minlength=n_cells)
+        construivel_total = np.bincount(lotes_inv, weights=np.nan_to_num(construivel), minlength=n_cells)
+        remanescente_total = np.bincount(lotes_inv, weights=np.nan_to_num(remanescente), minlength=n_cells)
+
+        imoveis_count = np.bincount(imoveis_inv, minlength=n_cells)
+        preco_ok = np.isfinite(preco_m2)
+        preco_sum = np.bincount(imoveis_inv[preco_ok], weights=preco_m2[preco_ok], minlength=n_cells)
+        preco_n = np.bincount(imoveis_inv[preco_ok], minlength=n_cells)
+
+        if grid_type == 'square':
+            cx, cy = square_centers(cell_i, cell_j, cell_size)
+            rings = square_polygons(cell_i, cell_j, cell_size)
+            cell_area = cell_size ** 2
+        else:
+            cx, cy = hex_centers(cell_i, cell_j, cell_size)
+            rings = hex_polygons(cell_i, cell_j, cell_size)
+            cell_area = 1.5 * np.sqrt(3.0) * cell_size ** 2
+
+        center_lon, center_lat = unproject_from_meters(cx, cy, ref_lat)
+        ring_lon, ring_lat = unproject_from_meters(rings[..., 0], rings[..., 1], ref_lat)
+        rings = np.stack([ring_lon, ring_lat], axis=-1).tolist()
+
+        for k in range(n_cells):
+            result['features'].append({
+                'type': 'Feature',
+                'properties': {
+                    'cell': [int(cell_i[k]), int(cell_j[k])],
+                    'center': [float(center_lon[k]), float(center_lat[k])],
+                    'lotes_count': int(lotes_count[k]),
+                    'area_terreno_total': float(area_total[k]),
+                    'area_construivel_total': float(construivel_total[k]),
+                    'potencial_remanescente_total': float(remanescente_total[k]),
+                    'imoveis_count': int(imoveis_count[k]),
+                    'imoveis_por_km2': float(imoveis_count[k] / cell_area * 1e6),
+                    'preco_m2_medio': float(preco_sum[k] / preco_n[k]) if preco_n[k] else None
+                },
+                'geometry': {'type': 'Polygon', 'coordinates': [rings[k]]}
+            })
+
+        return result
+
+    def _attribute_values(self, attribute: str) -> np.ndarray:
+        """Valores de um atributo de imóveis ('preco_m2' ou coluna numérica)"""
+        if attribute == 'preco_m2':
+            return self._preco_m2()
+        column = self._imovel_column(attribute)
+        if column is None:
+            raise ValueError(f"Atributo desconhecido: {attribute}")
+        return self._numeric(self.imoveis_gdf, column)
+
+    def _observations(self, attribute: str) -> Optional[Tuple[cKDTree, np.ndarray, float]]:
+        """KD-tree das observações válidas de um atributo (metros), em cache por versão"""
+
+        def build():
+            ref_lat = self._ref_lat()
+            if ref_lat is None or self.imoveis_gdf is None:
+                return None
+            lon, lat = self._imovel_points()
+            values = self._attribute_values(attribute)
+            valid = np.isfinite(lon) & np.isfinite(lat) & np.isfinite(values)
+            if not valid.any():
+                return None
+            x, y = project_to_meters(lon[valid], lat[valid], ref_lat)
+            return cKDTree(np.column_stack([x, y])), values[valid], ref_lat
+
+        return self._cached(('observations', attribute), build)
+
+    def interpolate(
+        self,
+        method: str = 'idw',
+        attribute: str = 'preco_m2',
+        cell_size: float = 250,
+        points: Optional[List[Dict[str, float]]] = None,
+        k: int = 12,
+        max_distance: Optional[float] = None,
+        power: float = 2.0,
+        model: str = 'spherical',
+        sill: Optional[float] = None,
+        range_meters: Optional[float] = None,
+        nugget: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """Estima um atributo dos imóveis em uma grade regular ou em pontos arbitrários"""
+        if method not in ('idw', 'kriging'):
+            raise ValueError("method deve ser 'idw' ou 'kriging'")
+        if model not in VARIOGRAM_MODELS:
+            raise ValueError(f"model deve ser um de: {', '.join(VARIOGRAM_MODELS)}")
+        if k < 1:
+            raise ValueError("k deve ser positivo")
+
+        params = (method, attribute, k, max_distance, power, model, sill, range_meters, nugget)
+
+        if points is not None:
+            return self._interpolate(params, None, points)
+
+        if cell_size <= 0:
+            raise ValueError("cell_size deve ser positivo")
+        return self._cached(
+            ('interpolate',) + params + (float(cell_size),),
+            lambda: self._interpolate(params, float(cell_size), None)
+        )
+
+    def _interpolate(
+        self,
+        params: Tuple,
+        cell_size: Optional[float],
+        points: Optional[List[Dict[str, float]]]
+    ) -> Dict[str, Any]:
+        """Avalia IDW ou krigagem sobre a grade ou sobre os pontos informados"""
+        method, attribute, k, max_distance, power, model, sill, range_meters, nugget = params
+        result: Dict[str, Any] = {'method': method, 'attribute': attribute, 'version': self.version}
+
+        observations = self._observations(attribute)
+        if observations is None:
+            result.update({'points': []} if points is not None else {'grid': None})
+            return result
+        tree, values, ref_lat = observations
+
+        if points is not None:
+            lon = np.array([p['longitude'] for p in points], dtype=float)
+            lat = np.array([p['latitude'] for p in points], dtype=float)
+            qx, qy = project_to_meters(lon, lat, ref_lat)
+        else:
+            # Grade regular sobre a extensão das observações (centros das células)
+            (minx, miny), (maxx, maxy) = tree.mins, tree.maxes
+            xs = np.arange(minx + cell_size / 2, maxx + cell_size, cell_size)
+            ys = np.arange(miny + cell_size / 2, maxy + cell_size, cell_size)
+            if len(xs) * len(ys) > MAX_GRID_CELLS:
+                raise ValueError(f"Grade muito grande ({len(xs) * len(ys)} células); aumente cell_size")
+            gx, gy = np.meshgrid(xs, ys)
+            qx, qy = gx.ravel(), gy.ravel()
+
+        query = np.column_stack([qx, qy])
+        variance = None
+        if method == 'idw':
+            estimate = idw(tree, values, query, k=k, max_distance=max_distance, power=power)
+        else:
+            # Parâmetros do variograma não informados: ajuste ao semivariograma empírico,
+            # ou estimativas simples a partir dos dados quando o ajuste falha
+            fitted: Dict[str, float] = {}
+            if sill is None or not range_meters or nugget is None:
+                extent = float(np.hypot(*(tree.maxes - tree.mins)))
+                fitted = self.variogram(attribute=attribute, model=model)['series'][0]['fit'] or {
+                    'sill': float(np.var(values)) or 1.0,
+                    'range_meters': max(extent / 3, 1.0),
+                    'nugget': 0.0
+                }
+            variogram = {
+                'model': model,
+                'sill': sill if sill is not None else fitted['sill'],
+                'range_meters': range_meters if range_meters else fitted['range_meters'],
+                'nugget': nugget if nugget is not None else fitted['nugget']
+            }
+            estimate, variance = ordinary_kriging(
+                tree, values, query,
+                model=model,
+                sill=variogram['sill'],
+                range_=variogram['range_meters'],
+                nugget=variogram['nugget'],
+                k=k,
+                max_distance=max_distance
+            )
+            result['variogram'] = variogram
+
+        if points is not None:
+            result['points'] = [
+                {
+                    'latitude': point['latitude'],
+                    'longitude': point['longitude'],
+                    'value': value,
+                    'variance': var
+                }
+                for point, value, var in zip(
+                    points,
+                    _json_values(estimate),
+                    _json_values(variance) if variance is not None else [None] * len(points)
+                )
+            ]
+            return result
+
+        rows, cols = len(ys), len(xs)
+        lon0, lat0 = unproject_from_meters(xs[0] - cell_size / 2, ys[0] - cell_size / 2, ref_lat)
+        lon1, lat1 = unproject_from_meters(xs[-1] + cell_size / 2, ys[-1] + cell_size / 2, ref_lat)
+        result['cell_size'] = cell_size
+        result['grid'] = {
+            'bounds': {'minLng': float(lon0), 'minLat': float(lat0), 'maxLng': float(lon1), 'maxLat': float(lat1)},
+            'shape': [rows, cols],
+            'values': _json_values(estimate.reshape(rows, cols)),
+            'variance': _json_values(variance.reshape(rows, cols)) if variance is not None else None
+        }
+        return result
+
+    def variogram(
+        self,
+        attribute: str = 'preco_m2',
+        max_lag: Optional[float] = None,
+        n_lags: int = 15,
+        directions: Optional[List[float]] = None,
+        tolerance: float = 22.5,
+        sample_fraction: float = 1.0,
+        max_points: Optional[int] = 10000,
+        model: Optional[str] = 'auto',
+        memory_budget_mb: float = 64,
+        seed: int = 0
+    ) -> Dict[str, Any]:
+        """Semivariograma empírico de um atributo dos imóveis, com ajuste de modelo opcional"""
+        if model is not None and model != 'auto' and model not in VARIOGRAM_MODELS:
+            raise ValueError(f"model deve ser 'auto' ou um de: {', '.join(VARIOGRAM_MODELS)}")
+        if n_lags < 1:
+            raise ValueError("n_lags deve ser positivo")
+        if not 0 < sample_fraction <= 1:
+            raise ValueError("sample_fraction deve estar em (0, 1]")
+
+        key = (
+            'variogram', attribute, max_lag, n_lags, tuple(directions or ()), tolerance,
+            sample_fraction, max_points, model, memory_budget_mb, seed
+        )
+        return self._cached(key, lambda: self._build_variogram(
+            attribute, max_lag, n_lags, directions, tolerance,
+            sample_fraction, max_points, model, memory_budget_mb, seed
+        ))
+
+    def _build_variogram(
+        self,
+        attribute: str,
+        max_lag: Optional[float],
+        n_lags: int,
+        directions: Optional[List[float]],
+        tolerance: float,
+        sample_fraction: float,
+        max_points: Optional[int],
+        model: Optional[str],
+        memory_budget_mb: float,
+        seed: int
+    ) -> Dict[str, Any]:
+        """Calcula o semivariograma em blocos sobre o KD-tree das observações"""
+        result: Dict[str, Any] = {'attribute': attribute, 'version': self.version, 'series': []}
+
+        observations = self._observations(attribute)
+        if observations is None or observations[0].n < 2:
+            result['series'].append({'direction': None, 'lags': [], 'gamma': [], 'counts': [], 'fit': None})
+            return result
+        tree, values, _ = observations
+
+        # Subamostragem de pontos para bases muito grandes
+        if max_points and tree.n > max_points:
+            sample = np.random.default_rng(seed).choice(tree.n, size=max_points, replace=False)
+            tree, values = cKDTree(tree.data[sample]), values[sample]
+            result['sampled_points'] = max_points
+
+        # Alcance padrão: um terço da diagonal da extensão dos dados
+        if not max_lag:
+            max_lag = max(float(np.hypot(*(tree.maxes - tree.mins))) / 3, 1.0)
+
+        empirical = empirical_variogram(
+            tree, values, max_lag,
+            n_lags=n_lags,
+            directions=directions,
+            tolerance=tolerance,
+            sample_fraction=sample_fraction,
+            memory_budget_mb=memory_budget_mb,
+            seed=seed
+        )
+
+        result.update({
+            'max_lag': empirical['max_lag'],
+            'n_lags': empirical['n_lags'],
+            'tolerance': empirical['tolerance'],
+            'variance': float(np.var(values))
+        })
+
+        for series in empirical['series']:
+            if model == 'auto':
+                fit = fit_best_variogram(series['lags'], series['gamma'], series['counts'])
+            elif model is not None:
+                fit = fit_variogram(series['lags'], series['gamma'], series['counts'], model)
+            else:
+                fit = None
+
+            result['series'].append({
+                'direction': series['direction'],
+                'lags': _json_values(series['lags']),
+                'gamma': _json_values(series['gamma']),
+                'counts': series['counts'].tolist(),
+                'fit': fit
+            })
+
+        return result
+
+    def _layer_values(self, layer: str, attribute: str) -> np.ndarray:
+        """Valores de um atributo de lotes (coluna numérica) ou de imóveis"""
+        if layer == 'imoveis':
+            return self._attribute_values(attribute)
+        if attribute not in self.lotes_gdf.columns:
+            raise ValueError(f"Atributo desconhecido: {attribute}")
+        return self._numeric(self.lotes_gdf, attribute)
+
+    def _layer_observations(self, layer: str, attribute: str) -> Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        """Coordenadas métricas (n, 2), valores e posições das observações válidas de uma camada"""
+        if layer not in ('imoveis', 'lotes'):
+            raise ValueError("layer deve ser 'imoveis' ou 'lotes'")
+
+        def build():
+            gdf = self.imoveis_gdf if layer == 'imoveis' else self.lotes_gdf
+            ref_lat = self._ref_lat()
+            if gdf is None or len(gdf) == 0 or ref_lat is None:
+                return None
+            lon, lat = self._imovel_points() if layer == 'imoveis' else self._lote_points()
+            values = self._layer_values(layer, attribute)
+            valid = np.isfinite(lon) & np.isfinite(lat) & np.isfinite(values)
+            x, y = project_to_meters(lon[valid], lat[valid], ref_lat)
+            return np.column_stack([x, y]), values[valid], np.flatnonzero(valid)
+
+        return self._cached(('layer_observations', layer, attribute), build)
+
+    @staticmethod
+    def _build_weights(coords: np.ndarray, kind: str, k: int, threshold: Optional[float]) -> sparse.csr_matrix:
+        """Matriz de pesos espaciais KNN ou por banda de distância"""
+        if kind == 'knn':
+            return knn_weights(coords, k)
+        if not threshold or threshold <= 0:
+            raise ValueError("threshold (metros) é obrigatório para pesos por banda de distância")
+        return distance_band_weights(coords, threshold)
+
+    def _spatial_weights(
+        self,
+        layer: str,
+        attribute: str,
+        kind: str = 'knn',
+        k: int = 8,
+        threshold: Optional[float] = None
+    ) -> Optional[sparse.csr_matrix]:
+        """Matriz de pesos espaciais (CSR) das observações válidas, em cache por versão"""
+        if kind not in ('knn', 'distance'):
+            raise ValueError("weights deve ser 'knn' ou 'distance'")
+
+        def build():
+            observations = self._layer_observations(layer, attribute)
+            if observations is None:
+                return None
+            return self._build_weights(observations[0], kind, k, threshold)
+
+        return self._cached(('weights', layer, attribute, kind, k, threshold), build)
+
+    def markov(
+        self,
+        layer: str = 'imoveis',
+        attribute: str = 'preco_m2',
+        n_classes: int = 5,
+        weights: str = 'knn',
+        k: int = 8,
+        threshold: Optional[float] = None,
+        period_column: Optional[str] = None,
+        id_column: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Análise de Markov espacial de classes de valor
+
+        Sem period_column, a cadeia é espacial: transições da classe de cada
+        unidade para a dos vizinhos, condicionadas à classe da defasagem espacial.
+        Com period_column e id_column, transições temporais de cada unidade entre
+        períodos consecutivos, condicionadas à defasagem no período de origem.
+        """
+        if n_classes < 2:
+            raise ValueError("n_classes deve ser pelo menos 2")
+        if (period_column is None) != (id_column is None):
+            raise ValueError("period_column e id_column devem ser informados juntos")
+
+        key = ('markov', layer, attribute, n_classes, weights, k, threshold, period_column, id_column)
+        return self._cached(key, lambda: self._build_markov(
+            layer, attribute, n_classes, weights, k, threshold, period_column, id_column
+        ))
+
+    def _build_markov(
+        self,
+        layer: str,
+        attribute: str,
+        n_classes: int,
+        weights: str,
+        k: int,
+        threshold: Optional[float],
+        period_column: Optional[str],
+        id_column: Optional[str]
+    ) -> Dict[str, Any]:
+        """Classifica os valores, calcula as defasagens (W @ y) e as matrizes de transição"""
+        result: Dict[str, Any] = {
+            'layer': layer,
+            'attribute': attribute,
+            'n_classes': n_classes,
+            'mode': 'spatial' if period_column is None else 'temporal',
+            'version': self.version
+        }
+
+        observations = self._layer_observations(layer, attribute)
+        if observations is None or len(observations[1]) <= n_classes:
+            result['transitions'] = None
+            return result
+        coords, values, positions = observations
+
+        breaks = quantile_breaks(values, n_classes)
+        classes = classify(values, breaks)
+        result['breaks'] = breaks.tolist()
+        result['n_observations'] = int(len(values))
+        result['class_counts'] = np.bincount(classes, minlength=n_classes).tolist()
+
+        if period_column is None:
+            W = self._spatial_weights(layer, attribute, weights, k, threshold)
+            lag = W @ values
+            lag_class = classify(lag, quantile_breaks(lag, n_classes))
+            result.update(neighbor_transitions(W, classes, lag_class, n_classes))
+            return result
+
+        gdf = self.imoveis_gdf if layer == 'imoveis' else self.lotes_gdf
+        for column in (period_column, id_column):
+            if column not in gdf.columns:
+                raise ValueError(f"Coluna não encontrada: {column}")
+        periods = gdf[period_column].to_numpy()[positions]
+        ids = gdf[id_column].to_numpy()[positions]
+
+        # Pares (t, t+1) por unidade, com a defasagem calculada entre as unidades do período t
+        frames = []
+        ordered = np.sort(pd.unique(periods))
+        for p0, p1 in zip(ordered[:-1], ordered[1:]):
+            m0, m1 = periods == p0, periods == p1
+            lag0 = self._build_weights(coords[m0], weights, k, threshold) @ values[m0]
+            start = pd.DataFrame({'id': ids[m0], 'y0': values[m0], 'lag': lag0}).drop_duplicates('id')
+            end = pd.DataFrame({'id': ids[m1], 'y1': values[m1]}).drop_duplicates('id')
+            frames.append(start.merge(end, on='id'))
+
+        pairs = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=['y0', 'y1', 'lag'])
+        result['periods'] = [str(p) for p in ordered]
+        result['n_transitions'] = int(len(pairs))
+        if len(pairs) == 0:
+            result['transitions'] = None
+            return result
+
+        lag = pairs['lag'].to_numpy(dtype=float)
+        result.update(spatial_markov(
+            classify(pairs['y0'].to_numpy(dtype=float), breaks),
+            classify(pairs['y1'].to_numpy(dtype=float), breaks),
+            classify(lag, quantile_breaks(lag, n_classes)),
+            n_classes
+        ))
+        return result
+
+    def autocorrelation(
+        self,
+        layer: str = 'imoveis',
+        attribute: str = 'preco_m2',
+        weights: str = 'knn',
+        k: int = 8,
+        threshold: Optional[float] = None,
+        permutations: int = 999,
+        significance: float = 0.05,
+        n_jobs: Optional[int] = None,
+        seed: int = 0
+    ) -> Dict[str, Any]:
+        """I de Moran global e LISA (clusters e outliers), em cache por versão e parâmetros"""
+        if permutations < 0:
+            raise ValueError("permutations não pode ser negativo")
+        if not 0 < significance < 1:
+            raise ValueError("significance deve estar em (0, 1)")
+
+        key = ('autocorrelation', layer, attribute, weights, k, threshold, permutations, significance, seed)
+        return self._cached(key, lambda: self._build_autocorrelation(
+            layer, attribute, weights, k, threshold, permutations, significance, n_jobs, seed
+        ))
+
+    def _build_autocorrelation(
+        self,
+        layer: str,
+        attribute: str,
+        weights: str,
+        k: int,
+        threshold: Optional[float],
+        permutations: int,
+        significance: float,
+        n_jobs: Optional[int],
+        seed: int
+    ) -> Dict[str, Any]:
+        """Calcula Moran global e a tabela LISA sobre a matriz de pesos em cache"""
+        result: Dict[str, Any] = {'layer': layer, 'attribute': attribute, 'version': self.version}
+
+        observations = self._layer_observations(layer, attribute)
+        if observations is None or len(observations[1]) < 3:
+            result.update({'moran': None, 'lisa': pd.DataFrame()})
+            return result
+        coords, values, positions = observations
+
+        W = self._spatial_weights(layer, attribute, weights, k, threshold)
+        global_stats = moran(values, W, permutations=permutations, n_jobs=n_jobs, seed=seed)
+        local_stats = lisa(values, W, permutations=permutations, significance=significance, n_jobs=n_jobs, seed=seed)
+
+        lon, lat = unproject_from_meters(coords[:, 0], coords[:, 1], self._ref_lat())
+        table = pd.DataFrame({
+            'position': positions,
+            'longitude': lon,
+            'latitude': lat,
+            'value': values,
+            'lag': local_stats['lag'],
+            'Ii': local_stats['Ii'],
+            'quadrant': local_stats['quadrant']
+        })
+        if 'p_sim' in local_stats:
+            table['p_sim'] = local_stats['p_sim']
+            labels = pd.Series(local_stats['quadrant']).map(QUADRANT_LABELS)
+            table['cluster'] = labels.where(local_stats['significant'], 'ns').to_numpy()
+
+        result['moran'] = global_stats
+        result['lisa'] = table
+        if 'cluster' in table.columns:
+            result['clusters'] = {key: int(value) for key, value in table['cluster'].value_counts().items()}
+        return result
+
+    def autocorrelation_geojson(self, **params) -> Dict[str, Any]:
+        """Resultado da autocorrelação com a camada LISA em GeoJSON (pontos)"""
+        result = self.autocorrelation(**params)
+        table = result['lisa']
+        properties = table.drop(columns=['longitude', 'latitude']).to_dict(orient='records')
+        features = [
+            {
+                'type': 'Feature',
+                'properties': props,
+                'geometry': {'type': 'Point', 'coordinates': [lon, lat]}
+            }
+            for props, lon, lat in zip(properties, table['longitude'].tolist(), table['latitude'].tolist())
+        ]
+
+        output = {key: value for key, value in result.items() if key != 'lisa'}
+        output.update({'type': 'FeatureCollection', 'features': features})
+        return output
+
+    def autocorrelation_arrow(self, **params) -> bytes:
+        """Camada LISA como stream Arrow IPC (Moran global nos metadados do schema)"""
+        result = self.autocorrelation(**params)
+        table = pa.Table.from_pandas(result['lisa'], preserve_index=False)
+        metadata = {key: json.dumps(value) for key, value in result.items() if key != 'lisa'}
+        table = table.replace_schema_metadata(metadata)
+
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes()
+
+    def _nearest_positions(
+        self,
+        layer: str,
+        lats: np.ndarray,
+        lons: np.ndarray,
+        k: int,
+        filters: Optional[Dict[str, Any]],
+        max_distance: Optional[float]
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Posições e distâncias (m) dos k vizinhos mais próximos de cada ponto, respeitando filtros"""
+        empty = np.zeros((len(lats), 0))
+        index = self._point_index(layer)
+        if index is None:
+            return empty.astype(np.int64), empty, empty.astype(bool)
+        tree, positions, ref_lat = index
+
+        gdf = self.lotes_gdf if layer == 'lotes' else self.imoveis_gdf
+        allowed = self._filter_mask(gdf, filters)[positions]
+        query = np.column_stack(project_to_meters(lons, lats, ref_lat))
+
+        # Com filtros, amplia a busca até encontrar k pontos aceitos (ou esgotar a árvore)
+        k_query = k
+        while True:
+            k_eff = min(k_query, tree.n)
+            distances, indices = tree.query(
+                query, k=k_eff,
+                distance_upper_bound=max_distance if max_distance else np.inf
+            )
+            distances = distances.reshape(len(query), k_eff)
+            indices = np.minimum(indices.reshape(len(query), k_eff), tree.n - 1)
+            ok = np.isfinite(distances) & allowed[indices]
+            exhausted = ~np.isfinite(distances[:, -1])
+            if k_eff == tree.n or ((ok.sum(axis=1) >= k) | exhausted).all():
+                break
+            k_query *= 4
+
+        # Primeiros k aceitos por linha, preservando a ordem por distância
+        order = np.argsort(~ok, axis=1, kind='stable')[:, :k]
+        rows = np.arange(len(query))[:, None]
+        return positions[indices[rows, order]], distances[rows, order], ok[rows, order]
+
+    def _nearest_features(self, layer: str, positions: np.ndarray, distances: np.ndarray, ok: np.ndarray) -> List[List[Dict[str, Any]]]:
+        """Features GeoJSON dos vizinhos de cada ponto, com a distância em metros"""
+        gdf = self.lotes_gdf if layer == 'lotes' else self.imoveis_gdf
+
+        # Cada feature é serializada uma única vez, mesmo se vizinha de vários pontos
+        unique, inverse = np.unique(positions[ok], return_inverse=True)
+        serialized = self._geodataframe_to_geojson(gdf.iloc[unique])
+
+        results = []
+        flat = iter(inverse)
+        for row_distances, row_ok in zip(distances, ok):
+            features = []
+            for distance in row_distances[row_ok]:
+                feature = serialized[next(flat)]
+                features.append({
+                    'type': 'Feature',
+                    'properties': {**feature['properties'], 'distancia_metros': float(distance)},
+                    'geometry': feature['geometry']
+                })
+            results.append(features)
+        return results
+
+    def nearest_batch(
+        self,
+        points: List[Dict[str, float]],
+        k: int = 10,
+        filters: Optional[Dict[str, Any]] = None,
+        layer: str = 'all',
+        max_distance: Optional[float] = None
+    ) -> List[Dict[str, Any]]:
+        """k lotes e/ou imóveis mais próximos de cada ponto, ordenados por distância métrica"""
+        if layer not in ('all', 'lotes', 'imoveis'):
+            raise ValueError("layer deve ser 'all', 'lotes' ou 'imoveis'")
+        if k < 1:
+            raise ValueError("k deve ser positivo")
+
+        lats = np.array([p['latitude'] for p in points], dtype=float)
+        lons = np.array([p['longitude'] for p in points], dtype=float)
+        results = [
+            {'point': {'latitude': float(lat), 'longitude': float(lon)}, 'k': k, 'lotes': [], 'imoveis': []}
+            for lat, lon in zip(lats, lons)
+        ]
+
+        for name in ('lotes', 'imoveis'):
+            if layer not in ('all', name):
+                continue
+            positions, distances, ok = self._nearest_positions(name, lats, lons, k, filters, max_distance)
+            for result, features in zip(results, self._nearest_features(name, positions, distances, ok)):
+                result[name] = features
+
+        return results
+
+    def nearest(
+        self,
+        lat: float,
+        lon: float,
+        k: int = 10,
+        filters: Optional[Dict[str, Any]] = None,
+        layer: str = 'all',
+        max_distance: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """k lotes e/ou imóveis mais próximos de um ponto (lotes pela distância ao centróide)"""
+        return self.nearest_batch([{'latitude': lat, 'longitude': lon}], k, filters, layer, max_distance)[0]
+
+    def _summarize_positions(
+        self,
+        lote_positions: np.ndarray,
+        imovel_positions: np.ndarray,
+        lotes: Optional[gpd.GeoDataFrame] = None,
+        imoveis: Optional[gpd.GeoDataFrame] = None
+    ) -> Dict[str, Any]:
+        """Estatísticas vetorizadas (mesmas chaves de _calculate_statistics) a partir de posições"""
+        lotes = self.lotes_gdf if lotes is None else lotes
+        imoveis = self.imoveis_gdf if imoveis is None else imoveis
+        stats: Dict[str, Any] = {'lotes': {}, 'imoveis': {}}
+
+        if len(lote_positions):
+            areas = self._numeric(lotes, 'area_terreno')[lote_positions]
+            areas = areas[np.isfinite(areas) & (areas != 0)]
+            if len(areas):
+                stats['lotes']['area_media'] = float(areas.mean())
+                stats['lotes']['area_total'] = float(areas.sum())
+                stats['lotes']['area_min'] = float(areas.min())
+                stats['lotes']['area_max'] = float(areas.max())
+
+            if 'bairro' in lotes.columns:
+                bairros = lotes['bairro'].iloc[lote_positions]
+                bairros = bairros[bairros.notna() & (bairros != '')]
+                if len(bairros):
+                    stats['lotes']['bairros_unicos'] = int(bairros.nunique())
+                    stats['lotes']['distribuicao_bairros'] = {k: int(v) for k, v in bairros.value_counts().items()}
+
+            stats['lotes'].update(self._capacity_statistics({
+                column: self._numeric(lotes, column)[lote_positions]
+                for column in (*LOTE_CAPACITY_TOTALS, *LOTE_CAPACITY_MEANS)
+            }))
+
+        if len(imovel_positions):
+            def valid(name: str) -> np.ndarray:
+                values = self._numeric(imoveis, self._imovel_column(name, imoveis))[imovel_positions]
+                return values[np.isfinite(values) & (values != 0)]
+
+            precos = valid('preco_total')
+            if len(precos):
+                stats['imoveis']['preco_medio'] = float(precos.mean())
+                stats['imoveis']['preco_min'] = float(precos.min())
+                stats['imoveis']['preco_max'] = float(precos.max())
+
+            metragens = valid('metragem_privativa')
+            if len(metragens):
+                stats['imoveis']['metragem_media'] = float(metragens.mean())
+
+            preco_m2 = self._preco_m2(imoveis)[imovel_positions]
+            preco_m2 = preco_m2[np.isfinite(preco_m2)]
+            if len(preco_m2):
+                stats['imoveis']['preco_m2_medio'] = float(preco_m2.mean())
+
+            dormitorios = valid('dormitorios')
+            if len(dormitorios):
+                counts = pd.Series(dormitorios.astype(np.int64)).value_counts()
+                stats['imoveis']['distribuicao_dormitorios'] = {k: int(v) for k, v in counts.items()}
+
+        return stats
+
+    def _radius_candidates(
+        self,
+        layer: str,
+        lat: float,
+        lon: float,
+        radius_meters: float,
+        filters: Optional[Dict[str, Any]]
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Posições e distâncias métricas (ordenadas) dos pontos dentro do raio, via KD-tree"""
+        index = self._point_index(layer)
+        if index is None:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        tree, positions, ref_lat = index
+
+        x, y = project_to_meters(np.array([lon]), np.array([lat]), ref_lat)
+        found = np.asarray(tree.query_ball_point([x[0], y[0]], radius_meters), dtype=np.int64)
+        distances = np.hypot(tree.data[found, 0] - x[0], tree.data[found, 1] - y[0])
+        found = positions[found]
+
+        gdf = self.lotes_gdf if layer == 'lotes' else self.imoveis_gdf
+        keep = self._filter_mask(gdf, filters)[found]
+        found, distances = found[keep], distances[keep]
+
+        order = np.argsort(distances, kind='stable')
+        return found[order], distances[order]
+
+    def analyze_rings(
+        self,
+        lat: float,
+        lon: float,
+        radii: List[float],
+        filters: Optional[Dict[str, Any]] = None,
+        include_features: bool = False
+    ) -> Dict[str, Any]:
+        """
+        Análise em anéis concêntricos em uma única passada
+
+        As distâncias métricas são calculadas uma vez para os candidatos do
+        maior raio (lotes pelo centróide) e distribuídas por anel; retorna
+        estatísticas por anel e acumuladas até cada raio.
+        """
+        radii = sorted(float(r) for r in radii)
+        if not radii or radii[0] <= 0:
+            raise ValueError("radii deve conter raios positivos")
+
+        layers = {}
+        for layer in ('lotes', 'imoveis'):
+            positions, distances = self._radius_candidates(layer, lat, lon, radii[-1], filters)
+            ring = np.searchsorted(radii, distances, side='left')
+            layers[layer] = (positions, distances, ring)
+
+        rings = []
+        cumulative = []
+        for i, radius in enumerate(radii):
+            inner = radii[i - 1] if i else 0.0
+            in_ring = {name: pos[ring == i] for name, (pos, _, ring) in layers.items()}
+            up_to = {name: pos[ring <= i] for name, (pos, _, ring) in layers.items()}
+
+            rings.append({
+                'radius_inner': inner,
+                'radius_outer': radius,
+                'lotes_encontrados': int(len(in_ring['lotes'])),
+                'imoveis_encontrados': int(len(in_ring['imoveis'])),
+                'estatisticas': self._summarize_positions(in_ring['lotes'], in_ring['imoveis'])
+            })
+            cumulative.append({
+                'radius_meters': radius,
+                'lotes_encontrados': int(len(up_to['lotes'])),
+                'imoveis_encontrados': int(len(up_to['imoveis'])),
+                'estatisticas': self._summarize_positions(up_to['lotes'], up_to['imoveis'])
+            })
+
+        result = {
+            'point': {'latitude': lat, 'longitude': lon},
+            'radii': radii,
+            'rings': rings,
+            'cumulative': cumulative
+        }
+
+        if include_features:
+            for name, (positions, distances, ring) in layers.items():
+                gdf = self.lotes_gdf if name == 'lotes' else self.imoveis_gdf
+                subset = gdf.iloc[positions]
+                if name == 'lotes':
+                    subset = self._with_lote_market(subset)
+                features = self._geodataframe_to_geojson(subset)
+                for feature, distance, r in zip(features, distances, ring):
+                    feature['properties']['distancia_metros'] = float(distance)
+                    feature['properties']['anel'] = int(r)
+                result[name] = features
+
+        return result
+
+    def _build_cube(self, gdf: gpd.GeoDataFrame) -> pd.DataFrame:
+        """Agregados por bairro × dormitórios × status × incorporador (groupby vetorizado)"""
+        frame = pd.DataFrame(index=pd.RangeIndex(len(gdf)))
+        for dimension in CUBE_DIMENSIONS:
+            column = self._imovel_column(dimension, gdf)
+            if dimension == 'dormitorios':
+                frame[dimension] = self._numeric(gdf, column)
+            else:
+                frame[dimension] = gdf[column].to_numpy(dtype=object) if column else None
+
+        preco = self._numeric(gdf, self._imovel_column('preco_total', gdf))
+        metragem = self._numeric(gdf, self._imovel_column('metragem_privativa', gdf))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            preco_m2 = np.where(metragem > 0, preco / metragem, np.nan)
+
+        frame['imoveis'] = 1
+        frame['unidades'] = np.nan_to_num(self._numeric(gdf, self._imovel_column('unidades_total', gdf)))
+        frame['vendidas'] = np.nan_to_num(self._numeric(gdf, self._imovel_column('unidades_vendidas', gdf)))
+        frame['estoque'] = np.nan_to_num(self._numeric(gdf, self._imovel_column('estoque_atual', gdf)))
+        frame['preco_m2_soma'] = np.nan_to_num(preco_m2)
+        frame['preco_m2_n'] = np.isfinite(preco_m2).astype(np.int64)
+
+        return frame.groupby(list(CUBE_DIMENSIONS), dropna=False, sort=False)[list(CUBE_MEASURES)].sum().reset_index()
+
+    @staticmethod
+    def _merge_cube(cube: Optional[pd.DataFrame], delta: pd.DataFrame) -> pd.DataFrame:
+        """Soma os agregados de um novo lote de imóveis ao cubo existente"""
+        if cube is None or len(cube) == 0:
+            return delta
+        merged = pd.concat([cube, delta], ignore_index=True)
+        return merged.groupby(list(CUBE_DIMENSIONS), dropna=False, sort=False)[list(CUBE_MEASURES)].sum().reset_index()
+
+    @staticmethod
+    def _cube_row(values: Dict[str, Any]) -> Dict[str, Any]:
+        """Linha do cubo em JSON: medidas derivadas e valores ausentes como None"""
+        row = {}
+        for key, value in values.items():
+            if key in ('preco_m2_soma', 'preco_m2_n'):
+                continue
+            if value is None or (isinstance(value, float) and np.isnan(value)):
+                row[key] = None
+            elif isinstance(value, (np.integer, np.floating, float)) and float(value).is_integer():
+                row[key] = int(value)
+            elif isinstance(value, (np.integer, np.floating)):
+                row[key] = float(value)
+            else:
+                row[key] = value
+
+        n = values['preco_m2_n']
+        row['preco_m2_medio'] = float(values['preco_m2_soma'] / n) if n else None
+        row['vendas_pct'] = float(values['vendidas'] / values['unidades'] * 100) if values['unidades'] else None
+        return row
+
+    def cube(
+        self,
+        dimensions: Optional[List[str]] = None,
+        filters: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """
+        Consulta ao cubo de imóveis (slice/dice e roll-up)
+
+        filters fixa valores (ou listas de valores) de dimensões; o resultado é
+        agrupado pelas dimensões pedidas a partir dos agregados materializados,
+        sem percorrer os imóveis.
+        """
+        dimensions = list(dimensions) if dimensions is not None else ['bairro']
+        unknown = [d for d in [*dimensions, *(filters or {})] if d not in CUBE_DIMENSIONS]
+        if unknown:
+            raise ValueError(f"Dimensões inválidas: {', '.join(unknown)}. Use: {', '.join(CUBE_DIMENSIONS)}")
+
+        cube = self._imoveis_cube
+        if cube is None:
+            cube = pd.DataFrame(columns=[*CUBE_DIMENSIONS, *CUBE_MEASURES])
+
+        mask = np.ones(len(cube), dtype=bool)
+        for dimension, value in (filters or {}).items():
+            values = value if isinstance(value, list) else [value]
+            mask &= cube[dimension].isin(values).to_numpy()
+        sliced = cube[mask]
+
+        rows = []
+        if dimensions and len(sliced):
+            grouped = sliced.groupby(dimensions, dropna=False, sort=False)[list(CUBE_MEASURES)].sum().reset_index()
+            grouped = grouped.sort_values('imoveis', ascending=False, kind='stable')
+            rows = [self._cube_row(values) for values in grouped.to_dict('records')]
+
+        total = {measure: sliced[measure].sum() for measure in CUBE_MEASURES}
+
+        return {
+            'version': self.version,
+            'dimensions': dimensions,
+            'filters': filters or {},
+            'total': self._cube_row(total),
+            'rows': rows
+        }
+
+    def _cluster_index(self) -> Optional[Dict[str, Any]]:
+        """Índice hierárquico de clusters de imóveis por zoom (pré-calculado na carga)"""
+
+        def build():
+            lon, lat = self._imovel_points()
+            valid = np.isfinite(lon) & np.isfinite(lat)
+            if not valid.any():
+                return None
+            x, y = mercator(lon[valid], lat[valid])
+            return {
+                'positions': np.flatnonzero(valid),
+                'lon': lon[valid],
+                'lat': lat[valid],
+                'levels': build_cluster_index(x, y, self._preco_m2()[valid])
+            }
+
+        return self._cached(('cluster_index',), build)
+
+    def imovel_clusters(self, bbox: Tuple[float, float, float, float], zoom: float) -> Dict[str, Any]:
+        """
+        Clusters de imóveis visíveis no bbox (minx, miny, maxx, maxy) para o zoom
+
+        Clusters trazem point_count, preco_m2_medio e expansion_zoom; clusters
+        de um único imóvel e zooms acima de MAX_ZOOM retornam as features reais.
+        """
+        if len(bbox) != 4 or bbox[0] > bbox[2] or bbox[1] > bbox[3]:
+            raise ValueError("bbox deve ser minx,miny,maxx,maxy")
+
+        zoom = max(int(np.floor(zoom)), MIN_ZOOM)
+        result = {'type': 'FeatureCollection', 'zoom': zoom, 'features': []}
+
+        index = self._cluster_index()
+        if index is None:
+            return result
+
+        if zoom > MAX_ZOOM:
+            inside = (
+                (index['lon'] >= bbox[0]) & (index['lon'] <= bbox[2]) &
+                (index['lat'] >= bbox[1]) & (index['lat'] <= bbox[3])
+            )
+            result['features'] = self._geodataframe_to_geojson(self.imoveis_gdf.iloc[index['positions'][inside]])
+            return result
+
+        level = index['levels'][zoom]
+        ids = query_clusters(level, bbox)
+        single = level['count'][ids] == 1
+
+        points = index['positions'][level['first'][ids[single]]]
+        result['features'] = (
+            cluster_features(level, ids[~single], zoom) +
+            self._geodataframe_to_geojson(self.imoveis_gdf.iloc[points])
+        )
+        return result
+
+    def analyze_radius_stream(
+        self,
+        lat: float,
+        lon: float,
+        radius_meters: float,
+        filters: Optional[Dict[str, Any]] = None,
+        chunk_size: int = STREAM_CHUNK_SIZE,
+        cancel: Optional[threading.Event] = None
+    ) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Análise circular progressiva: eventos (nome, dados) para streaming
+
+        Emite primeiro 'stats' (contagens e estatísticas vetorizadas, sem
+        serializar features), depois 'features' em blocos ordenados do mais
+        próximo ao mais distante (lotes pelo centróide) e por fim 'done'.
+        Parar a iteração cancela a serialização restante; quando o consumidor
+        está em outra thread, `cancel` sinalizado encerra o gerador antes do
+        próximo bloco.
+        """
+        if radius_meters <= 0:
+            raise ValueError("radius_meters deve ser positivo")
+        if chunk_size <= 0:
+            raise ValueError("chunk_size deve ser positivo")
+        # Filtros vêm da query string como JSON: um array ou número não é um filtro
+        if filters is not None and not isinstance(filters, dict):
+            raise ValueError("filters deve ser um objeto JSON")
+
+        candidates = {
+            layer: self._radius_candidates(layer, lat, lon, radius_meters, filters)
+            for layer in ('lotes', 'imoveis')
+        }
+
+        def events() -> Iterator[Tuple[str, Dict[str, Any]]]:
+            lotes, imoveis = candidates['lotes'][0], candidates['imoveis'][0]
+            yield 'stats', {
+                'point': {'latitude': lat, 'longitude': lon},
+                'radius_meters': radius_meters,
+                'lotes_encontrados': int(len(lotes)),
+                'imoveis_encontrados': int(len(imoveis)),
+                'estatisticas': self._summarize_positions(lotes, imoveis)
+            }
+
+            # Lotes e imóveis intercalados em uma única ordem de distância
+            layers = np.repeat([0, 1], [len(lotes), len(imoveis)])
+            positions = np.concatenate([lotes, imoveis])
+            distances = np.concatenate([candidates['lotes'][1], candidates['imoveis'][1]])
+            order = np.argsort(distances, kind='stable')
+
+            for start in range(0, len(order), chunk_size):
+                if cancel is not None and cancel.is_set():
+                    return
+                chunk = order[start:start + chunk_size]
+                event = {'offset': start, 'lotes': [], 'imoveis': []}
+                for code, layer in enumerate(('lotes', 'imoveis')):
+                    selected = chunk[layers[chunk] == code]
+                    if len(selected) == 0:
+                        continue
+                    gdf = self.lotes_gdf if layer == 'lotes' else self.imoveis_gdf
+                    subset = gdf.iloc[positions[selected]]
+                    if layer == 'lotes':
+                        subset = self._with_lote_market(subset)
+                    features = self._geodataframe_to_geojson(subset)
+                    for feature, distance in zip(features, distances[selected]):
+                        feature['properties']['distancia_metros'] = float(distance)
+                    event[layer] = features
+                yield 'features', event
+
+            yield 'done', {'lotes': int(len(lotes)), 'imoveis': int(len(imoveis))}
+
+        return events()
+
+    def _lotes_signature(self) -> str:
+        """Assinatura dos endereços dos lotes (invalida índice e cache de geocodificação)"""
+        columns = [c for c in ('logradouro', 'numero', 'bairro') if c in self.lotes_gdf.columns]
+        hashed = pd.util.hash_pandas_object(self.lotes_gdf[columns], index=False) if columns else pd.Series([], dtype='uint64')
+        return f"{len(self.lotes_gdf)}:{int(hashed.sum())}"
+
+    def _geocode_missing(self, gdf: gpd.GeoDataFrame, refresh: bool = False) -> np.ndarray:
+        """
+        Geocodifica em lote os imóveis sem geometria pelo endereço (sem rede)
+
+        Endereco/Bairro normalizados são casados com logradouro + numero +
+        bairro dos lotes (hash, com fallback por trigramas); o imóvel recebe o
+        centróide do lote (ponto interno para lotes côncavos). Endereços já
+        resolvidos vêm do cache persistente. Com `refresh` (lotes recarregados),
+        os imóveis geocodificados antes também são refeitos, e os que não
+        forem mais encontrados perdem a geometria. Retorna as posições
+        geocodificadas.
+        """
+        self.geocode_summary = {}
+        endereco = self._imovel_column('endereco', gdf)
+        missing = (gdf.geometry.isna() | gdf.geometry.is_empty).to_numpy()
+        # O ponto veio do centróide de um lote que pode ter mudado ou deixado de existir
+        previous = gdf['geocodificacao'].notna().to_numpy() if refresh and 'geocodificacao' in gdf.columns else np.zeros(len(gdf), dtype=bool)
+        pending = missing | previous
+        if endereco is None or not pending.any() or self.lotes_gdf is None or len(self.lotes_gdf) == 0:
+            return np.empty(0, dtype=np.int64)
+
+        rows = np.flatnonzero(pending)
+        street, number = split_address(gdf[endereco].iloc[rows])
+        bairro_column = self._imovel_column('bairro', gdf)
+        bairro = normalize_text(gdf[bairro_column].iloc[rows]) if bairro_column else pd.Series('', index=street.index)
+        keys = (street + '|' + number + '|' + bairro).to_numpy()
+
+        signature = self._lotes_signature()
+        if self._geocode_cache is None or self._geocode_cache[0] != signature:
+            self._geocode_cache = (signature, geocoding.load_cache(geocoding.GEOCODE_CACHE_PATH, signature))
+        cache = self._geocode_cache[1]
+
+        # Apenas endereços novos passam pelo índice
+        unique_keys, first = np.unique(keys, return_index=True)
+        new = np.array([key not in cache for key in unique_keys], dtype=bool)
+        if new.any():
+            if self._address_index is None or self._address_index[0] != signature:
+                lotes = self.lotes_gdf
+                empty = pd.Series('', index=lotes.index)
+                self._address_index = (signature, build_address_index(
+                    lotes.get('logradouro', empty), lotes.get('numero', empty), lotes.get('bairro', empty)
+                ))
+            index = self._address_index[1]
+
+            matches = [
+                geocode_address(index, street.iat[k], number.iat[k], bairro.iat[k])
+                for k in first[new]
+            ]
+            positions = np.array([position for position, _ in matches], dtype=np.int64)
+            found = positions >= 0
+
+            # Centróide dos lotes em bloco; ponto interno quando o centróide cai fora
+            geoms = self.lotes_gdf.geometry.values[positions[found]]
+            points = shapely.centroid(geoms)
+            outside = ~shapely.contains(geoms, points)
+            points[outside] = shapely.point_on_surface(geoms[outside])
+
+            lon = np.full(len(positions), np.nan)
+            lat = np.full(len(positions), np.nan)
+            lon[found] = shapely.get_x(points)
+            lat[found] = shapely.get_y(points)
+            for key, x, y, (_, kind) in zip(unique_keys[new], lon, lat, matches):
+                cache[key] = (float(x), float(y), kind)
+            geocoding.save_cache(geocoding.GEOCODE_CACHE_PATH, signature, cache)
+
+        # Atribuição das geometrias em bloco
+        results = [cache[key] for key in keys]
+        lon = np.array([r[0] for r in results], dtype=float)
+        lat = np.array([r[1] for r in results], dtype=float)
+        kinds = np.array([r[2] for r in results], dtype=object)
+        ok = np.isfinite(lon) & np.isfinite(lat)
+
+        geometry = gdf.geometry.values.copy()
+        geometry[rows[ok]] = shapely.points(lon[ok], lat[ok])
+        geometry[rows[~ok]] = None
+        gdf[gdf.geometry.name] = geometry
+        if 'geocodificacao' not in gdf.columns:
+            gdf['geocodificacao'] = None
+        gdf.loc[gdf.index[rows], 'geocodificacao'] = kinds
+
+        self.geocode_summary = {
+            'sem_geometria': int(missing.sum()),
+            'regeocodificados': int((previous & ~missing).sum()),
+            'enderecos_novos': int(new.sum()),
+            'geocodificados': int(ok.sum()),
+            **{kind: int((kinds == kind).sum()) for kind in ('exato', 'logradouro', 'fuzzy', 'aproximado', 'nao_encontrado')}
+        }
+        return rows[ok]
+
+    @staticmethod
+    def _parse_geometry(value: Any):
+        """Geometria a partir de WKB, GeoJSON (texto ou dict); None nos demais casos"""
+        if isinstance(value, bytes):
+            return shapely.from_wkb(value)
+        if isinstance(value, str):
+            return shape(json.loads(value))
+        if isinstance(value, dict):
+            return shape(value)
+        return None
+
+    def ingest_partitioned(self, layer: str, file_path: str) -> Dict[str, Any]:
+        """
+        Grava um Parquet de lotes ou imóveis no armazenamento particionado
+
+        O arquivo substitui a camada no armazenamento (não acumula sobre a
+        carga anterior) e é lido em lotes de INGEST_BATCH_ROWS linhas, sem
+        carregar tudo na memória nem alterar os dados em memória. Lotes recebem as
+        colunas derivadas; imóveis sem geometria são geocodificados contra
+        os lotes em memória, quando houver. Linhas sem geometria são ignoradas.
+        """
+        if layer not in ('lotes', 'imoveis'):
+            raise ValueError("Camada deve ser 'lotes' ou 'imoveis'")
+
+        rows = written = 0
+        geocoded: Dict[str, int] = {}
+        with self.store.replace(layer) as write:
+            for batch in pq.ParquetFile(file_path).iter_batches(batch_size=INGEST_BATCH_ROWS):
+                df = batch.to_pandas()
+                rows += len(df)
+                if 'geometry' not in df.columns:
+                    df['geometry'] = None
+                else:
+                    df['geometry'] = df['geometry'].apply(self._parse_geometry)
+                gdf = gpd.GeoDataFrame(df, geometry='geometry', crs=self.crs)
+
+                if layer == 'lotes':
+                    gdf = self._derive_lote_columns(gdf)
+                else:
+                    self._geocode_missing(gdf)
+                    for key, value in self.geocode_summary.items():
+                        geocoded[key] = geocoded.get(key, 0) + value
+
+                written += write(gdf)
+
+        return {
+            'layer': layer,
+            'linhas': rows,
+            'gravadas': written,
+            'sem_geometria': rows - written,
+            'geocodificacao': geocoded or None
+        }
+
+    def analyze_partitioned(
+        self,
+        lat: float,
+        lon: float,
+        radius_meters: float,
+        filters: Optional[Dict[str, Any]] = None,
+        include_features: bool = False
+    ) -> Dict[str, Any]:
+        """
+        Análise de raio sobre o armazenamento particionado (fora da memória)
+
+        Lê só as partições e row groups que tocam o bbox do círculo; os pontos
+        (centróides, no caso de lotes) são então filtrados pela distância
+        métrica, como em analyze_rings.
+        """
+        if radius_meters <= 0:
+            raise ValueError("radius_meters deve ser positivo")
+
+        dlat = radius_meters / METERS_PER_DEGREE
+        dlon = dlat / np.cos(np.radians(lat))
+        bbox = (lon - dlon, lat - dlat, lon + dlon, lat + dlat)
+        cx, cy = project_to_meters(np.array([lon]), np.array([lat]), lat)
+
+        frames, positions, distances, io = {}, {}, {}, {}
+        for layer in ('lotes', 'imoveis'):
+            gdf, io[layer] = self.store.query(layer, bbox)
+            x, y = project_to_meters(*self._points_lonlat(gdf), lat)
+            distance = np.hypot(x - cx[0], y - cy[0])
+            found = np.flatnonzero((distance <= radius_meters) & self._filter_mask(gdf, filters))
+            order = np.argsort(distance[found], kind='stable')
+            frames[layer], positions[layer], distances[layer] = gdf, found[order], distance[found][order]
+
+        result = {
+            'point': {'latitude': lat, 'longitude': lon},
+            'radius_meters': radius_meters,
+            'lotes_encontrados': int(len(positions['lotes'])),
+            'imoveis_encontrados': int(len(positions['imoveis'])),
+            'estatisticas': self._summarize_positions(
+                positions['lotes'], positions['imoveis'], lotes=frames['lotes'], imoveis=frames['imoveis']
+            ),
+            'particoes': io
+        }
+
+        if include_features:
+            for layer in ('lotes', 'imoveis'):
+                features = self._geodataframe_to_geojson(frames[layer].iloc[positions[layer]])
+                for feature, distance in zip(features, distances[layer]):
+                    feature['properties']['distancia_metros'] = float(distance)
+                result[layer] = features
+
+        return result
+
+    def partitioned_status(self) -> Dict[str, Any]:
+        """Partições, arquivos, linhas e uso do cache do armazenamento particionado"""
+        return self.store.describe()
+
+    @staticmethod
+    def _geometry_bytes(gdf: gpd.GeoDataFrame) -> Dict[str, int]:
+        """Geometrias presentes, coordenadas e bytes estimados da coluna de geometria"""
+        geometry = np.asarray(gdf.geometry.values, dtype=object)
+        coordinates = int(shapely.get_num_coordinates(geometry).sum())
+        present = int((~shapely.is_missing(geometry)).sum())
+        return {
+            'geometrias': present,
+            'coordenadas': coordinates,
+            'coordenadas_bytes': coordinates * COORDINATE_BYTES,
+            'total_bytes': present * GEOMETRY_OVERHEAD_BYTES + coordinates * COORDINATE_BYTES + 8 * len(geometry)
+        }
+
+    @classmethod
+    def _layer_bytes(cls, gdf: Optional[gpd.GeoDataFrame]) -> Dict[str, int]:
+        """Bytes das colunas (deep) e estimativa das geometrias de uma camada"""
+        if gdf is None:
+            return {'colunas': 0, 'geometrias': 0}
+        columns = int(gdf.drop(columns=gdf.geometry.name).memory_usage(deep=True, index=True).sum())
+        return {'colunas': columns, 'geometrias': cls._geometry_bytes(gdf)['total_bytes']}
+
+    @classmethod
+    def _layer_report(cls, gdf: Optional[gpd.GeoDataFrame]) -> Optional[Dict[str, Any]]:
+        """Bytes por coluna (deep, da maior para a menor), geometrias e STRtree de uma camada"""
+        if gdf is None:
+            return None
+        usage = gdf.drop(columns=gdf.geometry.name).memory_usage(deep=True, index=True)
+        columns = {str(name): int(size) for name, size in usage.sort_values(ascending=False).items()}
+        geometry = cls._geometry_bytes(gdf)
+        sindex = len(gdf) * STRTREE_ITEM_BYTES if gdf.has_sindex else 0
+        return {
+            'linhas': len(gdf),
+            'colunas': columns,
+            'geometria': geometry,
+            'sindex': {'construido': bool(gdf.has_sindex), 'bytes_estimados': sindex},
+            'total_bytes': sum(columns.values()) + geometry['total_bytes'] + sindex
+        }
+
+    def memory_usage(self) -> Dict[str, int]:
+        """
+        Bytes aproximados em memória: camadas, junção imóvel-lote, índices e
+        arrays derivados e cache de resultados
+
+        As camadas são medidas uma vez por versão dos dados e cada derivado uma
+        vez, já que não muda depois de construído; o cache mede as entradas ao
+        inseri-las.
+        """
+        if self._layer_usage is None or self._layer_usage[0] != self.version:
+            self._layer_usage = (self.version, {
+                'lotes': self._layer_bytes(self.lotes_gdf),
+                'imoveis': self._layer_bytes(self.imoveis_gdf)
+            })
+        layers = self._layer_usage[1]
+
+        self._measure_derived()
+        usage = {
+            'lotes': sum(layers['lotes'].values()),
+            'imoveis': sum(layers['imoveis'].values()),
+            'juncao': int(self.imovel_lote_idx.nbytes),
+            'derivados': int(sum(self._derived_usage.values())),
+            'cache': int(self._cache_used)
+        }
+        usage['total'] = sum(usage.values())
+        return usage
+
+    def _measure_derived(self):
+        """Mede os derivados ainda não medidos (cada um uma vez por versão)"""
+        for key, value in list(self._derived.items()):
+            if key not in self._derived_usage:
+                self._derived_usage[key] = _deep_bytes(value)
+
+    def memory_report(self) -> Dict[str, Any]:
+        """
+        Memória detalhada (/debug/memory): colunas, geometrias, índices espaciais,
+        estruturas auxiliares, derivados e cache agrupados pelo tipo de entrada
+
+        As camadas são medidas de novo a cada chamada, para acompanhar o
+        crescimento entre uploads.
+        """
+        layers = {'lotes': self._layer_report(self.lotes_gdf), 'imoveis': self._layer_report(self.imoveis_gdf)}
+
+        self._measure_derived()
+        derived: Dict[str, Dict[str, int]] = {}
+        for key, size in list(self._derived_usage.items()):
+            entry = derived.setdefault(str(key[1]), {'entradas': 0, 'bytes': 0})
+            entry['entradas'] += 1
+            entry['bytes'] += size
+
+        cache: Dict[str, Dict[str, int]] = {}
+        with self._cache_lock:
+            sizes = list(self._cache_usage.items())
+        for key, size in sizes:
+            entry = cache.setdefault(str(key[1]), {'entradas': 0, 'bytes': 0})
+            entry['entradas'] += 1
+            entry['bytes'] += size
+
+        auxiliary = {
+            'juncao': int(self.imovel_lote_idx.nbytes),
+            'cubo_imoveis': _deep_bytes(self._imoveis_cube) if self._imoveis_cube is not None else 0,
+            'indice_enderecos': _deep_bytes(self._address_index[1]) if self._address_index else 0,
+            'cache_geocodificacao': _deep_bytes(self._geocode_cache[1]) if self._geocode_cache else 0
+        }
+        spatial_indexes = {kind: derived.pop(kind)['bytes'] for kind in SPATIAL_INDEX_CACHE_KEYS if kind in derived}
+        spatial_indexes.update({
+            f'sindex_{layer}': report['sindex']['bytes_estimados'] for layer, report in layers.items() if report
+        })
+
+        return {
+            'versao': self.version,
+            'camadas': layers,
+            'indices_espaciais': spatial_indexes,
+            'auxiliares': auxiliary,
+            'derivados': derived,
+            'cache': cache,
+            'cache_limite_bytes': CACHE_MAX_BYTES,
+            'total_bytes': (
+                sum(report['total_bytes'] for report in layers.values() if report)
+                + sum(auxiliary.values())
+                + sum(size for kind, size in spatial_indexes.items() if not kind.startswith('sindex_'))
+                + sum(entry['bytes'] for entry in derived.values())
+                + sum(entry['bytes'] for entry in cache.values())
+            )
+        }
+
+    def save_snapshot(self, path: str):
+        """
+        Grava as camadas em Arrow IPC sem compressão (lidas sem descompressão na recarga)
+
+        Escreve num diretório temporário e o renomeia, de modo que um snapshot
+        incompleto nunca substitui o anterior.
+        """
+        staging = f'{path}.tmp'
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+
+        for layer, gdf in (('lotes', self.lotes_gdf), ('imoveis', self.imoveis_gdf)):
+            if gdf is None:
+                continue
+            gdf = gdf.copy()
+            # Colunas com tipos mistos (ex.: número 105 e '105A') são gravadas como texto
+            for column in gdf.columns[gdf.dtypes == object]:
+                if column != gdf.geometry.name and pd.api.types.infer_dtype(gdf[column], skipna=True).startswith('mixed'):
+                    gdf[column] = gdf[column].map(lambda value: None if pd.isna(value) else str(value))
+            gdf.to_feather(os.path.join(staging, f'{layer}.arrow'), compression='uncompressed')
+
+        np.save(os.path.join(staging, 'imovel_lote_idx.npy'), self.imovel_lote_idx)
+        with open(os.path.join(staging, 'snapshot.json'), 'w') as f:
+            json.dump({'version': self.version, 'modified_at': self.modified_at.isoformat(), 'instance': self._instance}, f)
+
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(staging, path)
+
+    def snapshot_matches(self, path: str) -> bool:
+        """Se o snapshot em `path` guarda esta mesma versão dos dados (regravá-lo é desnecessário)"""
+        try:
+            with open(os.path.join(path, 'snapshot.json')) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return False
+        return meta.get('version') == self.version and meta.get('instance') == self._instance
+
+    def load_snapshot(self, path: str):
+        """
+        Restaura as camadas de um snapshot e reconstrói índices e agregados
+
+        O arquivo é lido mapeado, mas colunas e geometrias são materializadas
+        em pandas e shapely: a recarga ocupa a mesma memória de antes do descarte.
+        """
+        with open(os.path.join(path, 'snapshot.json')) as f:
+            meta = json.load(f)
+
+        for layer in ('lotes', 'imoveis'):
+            file_path = os.path.join(path, f'{layer}.arrow')
+            if os.path.exists(file_path):
+                gdf = gpd.read_feather(file_path, memory_map=True)
+                setattr(self, f'{layer}_gdf', gdf.set_crs(self.crs, allow_override=True))
+
+        self.imovel_lote_idx = np.load(os.path.join(path, 'imovel_lote_idx.npy'))
+        self._imoveis_cube = self._build_cube(self.imoveis_gdf) if self.imoveis_gdf is not None else None
+
+        # Mesma versão, data de alteração e ETags de antes do descarte
+        self.version = meta['version'] - 1
+        self._touch()
+        self.modified_at = datetime.fromisoformat(meta['modified_at'])
+        self._instance = meta['instance']
@@ -0,0 +1,124 @@
+"""
+Testes do I de Moran global e do LISA
+
+As estatísticas são comparadas com referências densas (matriz W completa) e
+a inferência por permutação com propriedades conhecidas da distribuição.
+"""
+
+import numpy as np
+import pytest
+
+import autocorrelation
+from autocorrelation import moran, lisa
+from weights import knn_weights
+
+
+def _grid(size=10, seed=5):
+    """Grade regular size × size com um agrupamento de valores altos num canto"""
+    rng = np.random.default_rng(seed)
+    x, y = np.meshgrid(np.arange(size, dtype=float), np.arange(size, dtype=float))
+    coords = np.column_stack([x.ravel(), y.ravel()]) * 100
+    values = rng.normal(0, 1, size * size)
+    hot = (coords[:, 0] < 300) & (coords[:, 1] < 300)
+    values[hot] += 4
+    return coords, values, hot
+
+
+def _dense_moran(y, W):
+    """I de Moran e variância analítica pela matriz densa"""
+    W = W.toarray()
+    n = len(y)
+    z = y - y.mean()
+    s0 = W.sum()
+    s1 = 0.5 * ((W + W.T) ** 2).sum()
+    s2 = ((W.sum(axis=1) + W.sum(axis=0)) ** 2).sum()
+    expected = -1 / (n - 1)
+    variance = (n * n * s1 - n * s2 + 3 * s0 * s0) / ((n * n - 1) * s0 * s0) - expected ** 2
+    return n / s0 * (z @ W @ z) / (z @ z), expected, variance
+
+
+def test_moran_matches_dense_reference():
+    """I, esperança e z normal iguais aos da matriz densa"""
+    coords, values, _ = _grid()
+    W = knn_weights(coords, k=4)
+
+    result = moran(values, W, permutations=0)
+    observed, expected, variance = _dense_moran(values, W)
+
+    assert abs(result['I'] - observed) < 1e-12
+    assert result['expected'] == expected
+    assert abs(result['z_norm'] - (observed - expected) / np.sqrt(variance)) < 1e-9
+    assert 'p_sim' not in result
+
+
+def test_moran_permutations():
+    """Agrupamento é significativo, sem estrutura não é, e a média simulada fica em E[I]"""
+    coords, values, _ = _grid()
+    W = knn_weights(coords, k=4)
+
+    result = moran(values, W, permutations=999, n_jobs=1)
+    assert result['I'] > 0.3
+    assert result['p_sim'] == 1 / 1000
+    assert abs(result['mean_sim'] - result['expected']) < 0.01
+
+    # Sem estrutura espacial o p simulado não é significativo
+    shuffled = np.random.default_rng(11).permutation(values)
+    assert moran(shuffled, W, permutations=999, n_jobs=1)['p_sim'] > 0.05
+
+
+def test_moran_batches_are_reproducible(monkeypatch):
+    """Mesma semente, mesmos blocos: resultado idêntico em linha e no pool de processos"""
+    coords, values, _ = _grid()
+    W = knn_weights(coords, k=4)
+    monkeypatch.setattr(autocorrelation, 'PERMUTATION_BUDGET_BYTES', 16 * len(values) * 100)
+
+    inline = moran(values, W, permutations=499, n_jobs=1)
+    pooled = moran(values, W, permutations=499, n_jobs=2)
+    assert inline == pooled
+
+
+def test_lisa_matches_dense_reference():
+    """Defasagem, I local e quadrantes iguais aos calculados com a matriz densa"""
+    coords, values, _ = _grid()
+    W = knn_weights(coords, k=4)
+
+    result = lisa(values, W, permutations=0)
+
+    z = values - values.mean()
+    lag = W.toarray() @ z
+    np.testing.assert_allclose(result['lag'], lag + values.mean())
+    np.testing.assert_allclose(result['Ii'], z / ((z * z).sum() / len(z)) * lag)
+    quadrant = np.select([(z > 0) & (lag > 0), (z <= 0) & (lag > 0), (z <= 0) & (lag <= 0)], [1, 2, 3], 4)
+    np.testing.assert_array_equal(result['quadrant'], quadrant)
+
+
+def test_lisa_permutations_find_hot_spot(monkeypatch):
+    """O agrupamento plantado sai HH e significativo; blocos de linhas não mudam a inferência"""
+    coords, values, hot = _grid()
+    W = knn_weights(coords, k=4)
+
+    result = lisa(values, W, permutations=999, n_jobs=1)
+    assert ((result['p_sim'] >= 1 / 1000) & (result['p_sim'] <= 0.5)).all()
+
+    # Interior do agrupamento (todos os vizinhos também altos)
+    core = (coords[:, 0] <= 100) & (coords[:, 1] <= 100)
+    assert (result['quadrant'][core] == 1).all()
+    assert result['significant'][core].all()
+    assert result['significant'][~hot].mean() < 0.2
+
+    monkeypatch.setattr(autocorrelation, 'PERMUTATION_BUDGET_BYTES', 16 * 999 * 4 * 7)
+    batched = lisa(values, W, permutations=999, n_jobs=1)
+    assert batched['significant'][core].all()
+    assert np.abs(batched['p_sim'] - result['p_sim']).max() < 0.1
+
+
+def test_constant_attribute_is_rejected():
+    """Atributo constante gera ValueError em vez de I NaN com p simulado significativo"""
+    coords, _, _ = _grid()
+    W = knn_weights(coords, k=4)
+    values = np.full(len(coords), 2.0)
+
+    with pytest.raises(ValueError, match='não varia'):
+        moran(values, W, permutations=99, n_jobs=1)
+    with pytest.raises(ValueError, match='não varia'):
+        lisa(values, W, permutations=99, n_jobs=1)
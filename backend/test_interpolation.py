@@ -0,0 +1,105 @@
+"""
+Testes da interpolação (IDW e krigagem ordinária)
+
+Comparam o sistema de krigagem montado em lote com a solução densa de cada
+ponto, inclusive com vizinhos mascarados por max_distance e em vários blocos.
+"""
+
+import numpy as np
+from scipy.spatial import cKDTree
+from scipy.spatial.distance import cdist
+
+import interpolation
+from interpolation import idw, ordinary_kriging, VARIOGRAM_MODELS
+
+
+def _sample(n=60, seed=1):
+    """Amostras determinísticas num quadrado de 1 km com tendência e ruído"""
+    rng = np.random.default_rng(seed)
+    coords = rng.uniform(0, 1000, size=(n, 2))
+    values = 0.01 * coords[:, 0] + np.sin(coords[:, 1] / 150) + rng.normal(0, 0.1, n)
+    return coords, values
+
+
+def _dense_kriging(coords, values, point, model, sill, range_, nugget):
+    """Krigagem ordinária de um ponto pela solução direta do sistema completo"""
+    gamma = VARIOGRAM_MODELS[model]
+    n = len(coords)
+    A = np.ones((n + 1, n + 1))
+    A[:n, :n] = gamma(cdist(coords, coords), sill, range_, nugget)
+    A[n, n] = 0.0
+    b = np.ones(n + 1)
+    b[:n] = gamma(np.linalg.norm(coords - point, axis=1), sill, range_, nugget)
+    solution = np.linalg.solve(A, b)
+    return solution[:n] @ values, solution[:n] @ b[:n] + solution[n]
+
+
+def test_kriging_reproduces_samples():
+    """Sem efeito pepita, a krigagem é exata nas amostras (variância nula)"""
+    coords, values = _sample()
+    estimate, variance = ordinary_kriging(cKDTree(coords), values, coords[:10], sill=1.0, range_=400.0, k=12)
+    np.testing.assert_allclose(estimate, values[:10], atol=1e-6)
+    np.testing.assert_allclose(variance, 0.0, atol=1e-6)
+
+
+def test_kriging_matches_dense_solution():
+    """Sistema em lote igual à solução densa com os mesmos k vizinhos, para cada modelo"""
+    coords, values = _sample()
+    tree = cKDTree(coords)
+    points = np.random.default_rng(2).uniform(100, 900, size=(25, 2))
+
+    for model in VARIOGRAM_MODELS:
+        estimate, variance = ordinary_kriging(tree, values, points, model=model, sill=1.2, range_=500.0, nugget=0.1, k=8)
+        for p, point in enumerate(points):
+            _, neighbors = tree.query(point, k=8)
+            expected, expected_variance = _dense_kriging(coords[neighbors], values[neighbors], point, model, 1.2, 500.0, 0.1)
+            assert abs(estimate[p] - expected) < 1e-6
+            assert abs(variance[p] - max(expected_variance, 0.0)) < 1e-6
+
+
+def test_kriging_masks_neighbors_beyond_max_distance():
+    """Vizinhos além de max_distance não entram no sistema; sem vizinhos o resultado é NaN"""
+    coords, values = _sample()
+    tree = cKDTree(coords)
+    points = np.vstack([np.random.default_rng(3).uniform(100, 900, size=(20, 2)), [[5000.0, 5000.0]]])
+
+    estimate, variance = ordinary_kriging(tree, values, points, sill=1.0, range_=300.0, k=12, max_distance=150.0)
+
+    for p, point in enumerate(points[:-1]):
+        distances, neighbors = tree.query(point, k=12, distance_upper_bound=150.0)
+        neighbors = neighbors[np.isfinite(distances)]
+        if len(neighbors) == 0:
+            assert np.isnan(estimate[p])
+            continue
+        expected, expected_variance = _dense_kriging(coords[neighbors], values[neighbors], point, 'spherical', 1.0, 300.0, 0.0)
+        assert abs(estimate[p] - expected) < 1e-6
+        assert abs(variance[p] - max(expected_variance, 0.0)) < 1e-6
+
+    assert np.isnan(estimate[-1]) and np.isnan(variance[-1])
+
+
+def test_chunks_match_single_block(monkeypatch):
+    """Blocos paralelos produzem o mesmo resultado de um bloco único"""
+    coords, values = _sample()
+    tree = cKDTree(coords)
+    points = np.random.default_rng(4).uniform(0, 1000, size=(50, 2))
+
+    single = ordinary_kriging(tree, values, points, range_=400.0)
+    monkeypatch.setattr(interpolation, 'CHUNK_SIZE', 7)
+    chunked = ordinary_kriging(tree, values, points, range_=400.0)
+
+    np.testing.assert_allclose(chunked[0], single[0])
+    np.testing.assert_allclose(chunked[1], single[1])
+
+
+def test_idw_exact_and_weighted():
+    """IDW devolve o valor observado no próprio ponto e a média ponderada fora dele"""
+    coords = np.array([[0.0, 0.0], [10.0, 0.0], [0.0, 20.0]])
+    values = np.array([1.0, 3.0, 5.0])
+    tree = cKDTree(coords)
+
+    estimate = idw(tree, values, np.array([[10.0, 0.0], [5.0, 5.0]]), k=3, power=2.0)
+
+    distances = np.linalg.norm(coords - [5.0, 5.0], axis=1)
+    weights = 1 / distances ** 2
+    np.testing.assert_allclose(estimate, [3.0, weights @ values / weights.sum()])
@@ -0,0 +1,89 @@
+"""
+Testes do semivariograma empírico e do ajuste de modelos
+
+O variograma em blocos do KD-tree é comparado com o cálculo por força bruta
+sobre todos os pares de ~50 pontos.
+"""
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from interpolation import VARIOGRAM_MODELS
+from variogram import empirical_variogram, fit_variogram
+
+
+def _sample(n=50, seed=7):
+    """Pontos e valores determinísticos num quadrado de 1 km"""
+    rng = np.random.default_rng(seed)
+    coords = rng.uniform(0, 1000, size=(n, 2))
+    values = np.cos(coords[:, 0] / 200) + 0.002 * coords[:, 1] + rng.normal(0, 0.2, n)
+    return coords, values
+
+
+def _brute_force(coords, values, max_lag, n_lags, direction=None, tolerance=22.5):
+    """Contagens, distância média e semivariância por classe a partir de todos os pares i < j"""
+    i, j = np.triu_indices(len(coords), k=1)
+    dx, dy = coords[j, 0] - coords[i, 0], coords[j, 1] - coords[i, 1]
+    d = np.hypot(dx, dy)
+    keep = (d > 0) & (d <= max_lag)
+    if direction is not None:
+        diff = np.abs(np.degrees(np.arctan2(dx, dy)) % 180 - direction % 180)
+        keep &= np.minimum(diff, 180 - diff) <= tolerance
+
+    edges = np.linspace(0, max_lag, n_lags + 1)
+    lag = np.minimum(np.searchsorted(edges, d[keep], side='right') - 1, n_lags - 1)
+    sq = (values[i[keep]] - values[j[keep]]) ** 2
+
+    counts = np.bincount(lag, minlength=n_lags)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        lags = np.bincount(lag, weights=d[keep], minlength=n_lags) / counts
+        gamma = np.bincount(lag, weights=sq, minlength=n_lags) / (2 * counts)
+    return counts, lags, gamma
+
+
+def test_matches_brute_force():
+    """Mesmos pares, distâncias médias e semivariâncias do cálculo por força bruta"""
+    coords, values = _sample()
+    counts, lags, gamma = _brute_force(coords, values, 600.0, 12)
+
+    series = empirical_variogram(cKDTree(coords), values, max_lag=600.0, n_lags=12)['series'][0]
+
+    np.testing.assert_array_equal(series['counts'], counts)
+    np.testing.assert_allclose(series['lags'], lags, equal_nan=True)
+    np.testing.assert_allclose(series['gamma'], gamma, equal_nan=True)
+
+
+def test_chunking_does_not_change_pairs():
+    """Blocos de um ponto (orçamento mínimo) produzem o mesmo variograma de um bloco único"""
+    coords, values = _sample()
+    tree = cKDTree(coords)
+
+    single = empirical_variogram(tree, values, max_lag=600.0, n_lags=12)['series'][0]
+    chunked = empirical_variogram(tree, values, max_lag=600.0, n_lags=12, memory_budget_mb=1e-4)['series'][0]
+
+    np.testing.assert_array_equal(chunked['counts'], single['counts'])
+    np.testing.assert_allclose(chunked['gamma'], single['gamma'], equal_nan=True)
+
+
+def test_directional_matches_brute_force():
+    """Pares atribuídos à direção dentro da tolerância, como na força bruta"""
+    coords, values = _sample()
+    result = empirical_variogram(cKDTree(coords), values, max_lag=600.0, n_lags=6, directions=[0, 90], tolerance=30)
+
+    for series, direction in zip(result['series'], (0, 90)):
+        counts, lags, gamma = _brute_force(coords, values, 600.0, 6, direction, 30)
+        assert series['direction'] == direction
+        np.testing.assert_array_equal(series['counts'], counts)
+        np.testing.assert_allclose(series['gamma'], gamma, equal_nan=True)
+
+
+def test_fit_recovers_model_parameters():
+    """O ajuste recupera patamar, alcance e pepita de uma curva gerada pelo próprio modelo"""
+    lags = np.linspace(25, 975, 20)
+    counts = np.full(20, 100)
+
+    for model, func in VARIOGRAM_MODELS.items():
+        fit = fit_variogram(lags, func(lags, 2.0, 600.0, 0.3), counts, model)
+        assert fit['model'] == model
+        np.testing.assert_allclose([fit['sill'], fit['range_meters'], fit['nugget']], [2.0, 600.0, 0.3], rtol=1e-3, atol=1e-3)
+        assert fit['rmse'] < 1e-6
@@ -0,0 +1,201 @@
+import importlib
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+# Aquecimento em segundo plano na inicialização ('0' desliga: imports e cargas ficam para a primeira requisição)
+WARM_START = os.environ.get('WARM_START', '1').lower() not in ('0', 'false', 'no')
+
+# Parquet pré-carregados: lotes.parquet e imoveis.parquet (dataset padrão) ou <dataset>/lotes.parquet...
+PRELOAD_PATH = os.environ.get('PRELOAD_PATH', '/data/preload')
+
+# Módulos pesados (geopandas, shapely, pandas, scipy) importados pelo aquecimento e não na subida do servidor
+HEAVY_MODULES = ('spatial_engine', 'partitioned')
+
+# Camadas na ordem de carga (imóveis depois dos lotes, para a junção)
+LAYERS = ('lotes', 'imoveis')
+
+
+def preload_sources(path: str = PRELOAD_PATH, default: str = 'default') -> Dict[str, Dict[str, str]]:
+    """Arquivos Parquet a pré-carregar, por dataset e camada"""
+    sources: Dict[str, Dict[str, str]] = {}
+    if not os.path.isdir(path):
+        return sources
+    for entry in sorted(os.scandir(path), key=lambda entry: entry.name):
+        directory, name = (entry.path, entry.name) if entry.is_dir() else (path, default)
+        for layer in LAYERS:
+            file_path = os.path.join(directory, f'{layer}.parquet')
+            if os.path.isfile(file_path):
+                sources.setdefault(name, {})[layer] = file_path
+    return sources
+
+
+class WarmStart:
+    """
+    Carga inicial em segundo plano: imports pesados, snapshots e Parquet do
+    volume /data, índices e caches das rotas mais acessadas
+
+    O servidor aceita conexões antes disso; /health responde 'loading' com o
+    progresso até o aquecimento terminar, para o orquestrador só encaminhar
+    tráfego a instâncias prontas. Falhas de um dataset ficam em `erros` sem
+    impedir os demais.
+    """
+
+    def __init__(
+        self,
+        registry,
+        enabled: bool = WARM_START,
+        preload_path: str = PRELOAD_PATH
+    ):
+        self.registry = registry
+        self.warm_caches: Optional[Callable[[Any], None]] = None
+        self.enabled = enabled
+        self.preload_path = preload_path
+        self.status = 'loading' if enabled else 'ready'
+        self.phase: Optional[str] = None
+        self.current: Optional[str] = None
+        self.steps_done = 0
+        self.steps_total = 0
+        self.datasets: List[str] = []
+        self.errors: List[Dict[str, str]] = []
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self._begin = 0.0
+        self._seconds: Optional[float] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def start(self, warm_caches: Callable[[Any], None]):
+        """
+        Inicia o aquecimento numa thread daemon (uma vez por processo)
+
+        `warm_caches(engine)` pré-calcula os corpos das rotas com as mesmas
+        chaves de cache que elas usam.
+        """
+        with self._lock:
+            if not self.enabled or self._thread is not None:
+                return
+            self.warm_caches = warm_caches
+            self.started_at = datetime.now(timezone.utc)
+            self._begin = time.perf_counter()
+            self._thread = threading.Thread(target=self._run, name='warm-start', daemon=True)
+            self._thread.start()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Aguarda o fim do aquecimento; retorna se está pronto"""
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return self.status == 'ready'
+
+    def _step(self, phase: str, current: Optional[str]):
+        """Registra a etapa em andamento"""
+        with self._lock:
+            self.phase, self.current = phase, current
+
+    def _done(self):
+        """Conta uma etapa concluída"""
+        with self._lock:
+            self.steps_done += 1
+
+    def _fail(self, dataset: str, error: Exception):
+        """Registra a falha de um dataset sem interromper os demais"""
+        with self._lock:
+            self.errors.append({'dataset': dataset, 'etapa': self.current or self.phase, 'erro': str(error)})
+
+    def _plan(self) -> Tuple[List[str], Dict[str, Dict[str, str]]]:
+        """Snapshots a restaurar (mais recentes primeiro) e Parquet dos datasets sem snapshot"""
+        snapshots = self.registry.snapshot_names()
+        # Um snapshot é o estado mais recente do dataset (uploads posteriores ao Parquet)
+        sources = {name: layers for name, layers in preload_sources(self.preload_path).items() if name not in snapshots}
+        return snapshots, sources
+
+    def _run(self):
+        """Imports, cargas e aquecimento dos caches, nessa ordem"""
+        try:
+            self._step('imports', None)
+            for module in HEAVY_MODULES:
+                importlib.import_module(module)
+
+            snapshots, sources = self._plan()
+            with self._lock:
+                self.steps_done = 1
+                # Imports, cada snapshot e cada Parquet, e o aquecimento do cache de cada dataset
+                self.steps_total = 1 + 2 * len(snapshots) + sum(len(layers) + 1 for layers in sources.values())
+
+            loaded = []
+            for name in snapshots:
+                self._step('snapshots', name)
+                # Os demais ficam em disco e são recarregados no primeiro acesso
+                if self.registry.resident_bytes() >= self.registry.budget_bytes:
+                    self._done()
+                    continue
+                try:
+                    self.registry.get(name)
+                    loaded.append(name)
+                except Exception as e:
+                    self._fail(name, e)
+                self._done()
+
+            for name, layers in sources.items():
+                failed = False
+                for layer in LAYERS:
+                    if layer not in layers:
+                        continue
+                    self._step('parquet', f'{name}/{layer}')
+                    if not failed:
+                        try:
+                            # Cópia e troca sob o lock do dataset, como os uploads (que já podem chegar)
+                            self.registry.ingest(name, layer, layers[layer])
+                        except Exception as e:
+                            self._fail(name, e)
+                            failed = True
+                    self._done()
+                if not failed:
+                    loaded.append(name)
+
+            for name in snapshots + list(sources):
+                self._step('cache', name)
+                # Só os que continuam residentes (o orçamento pode ter descartado algum)
+                engine = self.registry.resident(name)
+                if engine is not None and name in loaded:
+                    try:
+                        self.warm_caches(engine)
+                    except Exception as e:
+                        self._fail(name, e)
+                self._done()
+
+            with self._lock:
+                self.datasets = loaded
+                self.status = 'ready'
+        except Exception as e:
+            with self._lock:
+                self.errors.append({'dataset': None, 'etapa': self.phase, 'erro': str(e)})
+                self.status = 'error'
+        finally:
+            with self._lock:
+                self.phase, self.current = None, None
+                self.finished_at = datetime.now(timezone.utc)
+                self._seconds = time.perf_counter() - self._begin
+
+    def describe(self) -> Dict[str, Any]:
+        """Estado para /health: loading, ready ou error, com o progresso das etapas"""
+        with self._lock:
+            if not self.enabled:
+                return {'status': self.status, 'habilitado': False}
+            return {
+                'status': self.status,
+                'habilitado': True,
+                'fase': self.phase,
+                'atual': self.current,
+                'etapas_concluidas': self.steps_done,
+                'etapas_total': self.steps_total,
+                'progresso': self.steps_done / self.steps_total if self.steps_total else 0.0,
+                'datasets': list(self.datasets),
+                'erros': list(self.errors),
+                'iniciado_em': self.started_at.isoformat() if self.started_at else None,
+                'concluido_em': self.finished_at.isoformat() if self.finished_at else None,
+                'duracao_s': self._seconds if self._seconds is not None else time.perf_counter() - self._begin
+            }
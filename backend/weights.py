@@ -0,0 +1,48 @@
+import numpy as np
+from scipy import sparse
+from scipy.spatial import cKDTree
+
+
+def row_standardize(W: sparse.csr_matrix) -> sparse.csr_matrix:
+    """Normaliza as linhas para soma 1 (linhas sem vizinhos permanecem zeradas)"""
+    row_sums = np.asarray(W.sum(axis=1)).ravel()
+    with np.errstate(divide='ignore'):
+        scale = np.where(row_sums > 0, 1.0 / row_sums, 0.0)
+    return sparse.diags(scale) @ W
+
+
+def knn_weights(coords: np.ndarray, k: int = 8) -> sparse.csr_matrix:
+    """Matriz de pesos dos k vizinhos mais próximos (CSR, padronizada por linha)"""
+    n = len(coords)
+    k = min(k, n - 1)
+    if k < 1:
+        return sparse.csr_matrix((n, n))
+
+    _, indices = cKDTree(coords).query(coords, k=k + 1)
+    indices = indices.reshape(n, k + 1)
+
+    # Remove o próprio ponto; com pontos coincidentes ele pode não aparecer, então descarta o último
+    rows = np.arange(n)
+    keep = indices != rows[:, None]
+    keep[keep.all(axis=1), -1] = False
+    cols = indices[keep].reshape(n, k)
+
+    W = sparse.csr_matrix(
+        (np.full(n * k, 1.0 / k), (np.repeat(rows, k), cols.ravel())),
+        shape=(n, n)
+    )
+    return W
+
+
+def distance_band_weights(coords: np.ndarray, threshold: float) -> sparse.csr_matrix:
+    """Matriz de pesos binária por banda de distância (CSR, padronizada por linha)"""
+    n = len(coords)
+    tree = cKDTree(coords)
+    pairs = tree.sparse_distance_matrix(tree, threshold, output_type='ndarray')
+    pairs = pairs[pairs['i'] != pairs['j']]
+
+    W = sparse.csr_matrix(
+        (np.ones(len(pairs)), (pairs['i'], pairs['j'])),
+        shape=(n, n)
+    )
+    return row_standardize(W)
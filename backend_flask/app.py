@@ -1,13 +1,25 @@
-from flask import Flask, request, jsonify, render_template
+from __future__ import annotations
+
+from flask import Flask, Response, request, jsonify, render_template, stream_with_context, abort, make_response, g, send_file
 from flask_cors import CORS
 from werkzeug.exceptions import BadRequest, InternalServerError
-import pandas as pd
 import tempfile
 import os
+import json
+import shutil
+import time
 from datetime import datetime
-from typing import Optional
+from typing import TYPE_CHECKING, Optional
+
+import metrics
+import profiling
+from datasets import DatasetRegistry, DEFAULT_DATASET
+from jobs import UploadJobs
+from warmup import WarmStart
 
-from spatial_engine import SpatialEngine
+# geopandas, shapely e scipy são importados pelo aquecimento, depois que o worker já aceita conexões
+if TYPE_CHECKING:
+    from spatial_engine import SpatialEngine
 
 # Inicializar Flask
 app = Flask(__name__)
@@ -15,8 +27,95 @@ app = Flask(__name__)
 # Configurar CORS
 CORS(app, resources={r"/*": {"origins": "*"}})
 
-# Motor de análise espacial (singleton)
-spatial_engine = SpatialEngine()
+# Datasets nomeados, cada um com seu motor de análise espacial
+datasets = DatasetRegistry()
+
+# Carga inicial em segundo plano (snapshots e Parquet do volume /data), iniciada no fim do módulo
+warm_start = WarmStart(datasets)
+
+# Uploads processados em segundo plano, acompanhados em /jobs/<id>
+uploads = UploadJobs(datasets)
+
+
+@app.before_request
+def _begin_timing():
+    """Inicia a medição das etapas da requisição"""
+    g.timings = metrics.begin_request()
+    g.timing_begin = time.perf_counter()
+
+
+@app.after_request
+def _server_timing(response):
+    """Tempo total e etapas da requisição no header Server-Timing e nas métricas de /metrics"""
+    if 'timing_begin' not in g:
+        return response
+    elapsed = time.perf_counter() - g.timing_begin
+
+    # Rota como template (ex.: /upload/partitioned/<layer>) para não multiplicar as séries
+    route = request.url_rule.rule if request.url_rule else 'desconhecida'
+    metrics.observe_request(request.method, route, response.status_code, elapsed)
+    if response.content_length is not None:
+        metrics.observe_size('response_bytes', response.content_length)
+
+    response.headers['Server-Timing'] = metrics.server_timing(g.timings, elapsed)
+    response.headers['Timing-Allow-Origin'] = '*'
+    return response
+
+
+@app.before_request
+def _begin_profile():
+    """Captura opcional do perfil da requisição (X-Profile ou ?profile=1, com X-Profile-Token)"""
+    if not profiling.requested(request.headers.get('X-Profile') or request.args.get('profile')):
+        return None
+    if not profiling.authorized(request.headers.get('X-Profile-Token')):
+        return jsonify({"detail": "Captura de perfil não autorizada"}), 403
+
+    g.profile = profiling.start()
+    if g.profile is None:
+        return jsonify({"detail": "Outra captura de perfil em andamento"}), 409
+    return None
+
+
+@app.after_request
+def _save_profile(response):
+    """Grava o perfil capturado e informa o id nos headers"""
+    capture = g.pop('profile', None)
+    if capture is None:
+        return response
+    capture.stop()
+
+    try:
+        profile_id = capture.save({
+            "metodo": request.method,
+            "caminho": request.path,
+            "query": request.query_string.decode('utf-8', 'replace'),
+            "status": response.status_code
+        })
+    except OSError as e:
+        response.headers['X-Profile-Error'] = str(e)
+    else:
+        response.headers['X-Profile-Id'] = profile_id
+        response.headers['X-Profile-Url'] = f'/debug/profiles/{profile_id}'
+    return response
+
+
+@app.teardown_request
+def _end_profile(error=None):
+    """Garante o fim da captura mesmo quando a resposta não chega ao after_request"""
+    capture = g.pop('profile', None)
+    if capture is not None:
+        capture.stop()
+
+
+def _engine(create: bool = False) -> SpatialEngine:
+    """Motor do dataset da requisição (parâmetro `dataset`); uploads criam o dataset"""
+    name = request.args.get('dataset', DEFAULT_DATASET)
+    try:
+        return datasets.get(name, create=create)
+    except KeyError:
+        abort(make_response(jsonify({"detail": f"Dataset '{name}' não encontrado"}), 404))
+    except ValueError as e:
+        abort(make_response(jsonify({"detail": str(e)}), 400))
 
 
 # ========================================
@@ -57,24 +156,75 @@ def api_root():
 
 @app.route("/health", methods=["GET"])
 def health():
-    """Health check detalhado"""
+    """Prontidão: 'loading' (503) durante o aquecimento, com o progresso, e 'ready' depois"""
+    warmup = warm_start.describe()
     return jsonify({
-        "status": "online",
+        "status": warmup["status"],
         "timestamp": datetime.now().isoformat(),
-        "version": "1.0.0"
-    })
+        "version": "1.0.0",
+        "warmup": warmup
+    }), 200 if warmup["status"] == "ready" else 503
 
 
-@app.route("/upload/lotes", methods=["POST"])
-def upload_lotes():
-    """
-    Upload de arquivo Parquet com dados de lotes de Vitória
+@app.route("/metrics", methods=["GET"])
+def get_metrics():
+    """Métricas no formato do Prometheus: tempos por etapa, tamanhos de resultado e requisições"""
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+
+@app.route("/debug/profiles", methods=["GET"])
+def get_profiles():
+    """Perfis capturados, do mais recente ao mais antigo"""
+    if not profiling.authorized(request.headers.get('X-Profile-Token')):
+        return jsonify({"detail": "Captura de perfil não autorizada"}), 403
+    return jsonify({"perfis": profiling.list_profiles()})
+
+
+@app.route("/debug/profiles/<profile_id>", methods=["GET"])
+def get_profile(profile_id):
+    """Perfil capturado: resumo das funções mais custosas, arquivo pstats ou pilhas collapsed"""
+    if not profiling.authorized(request.headers.get('X-Profile-Token')):
+        return jsonify({"detail": "Captura de perfil não autorizada"}), 403
+
+    format = request.args.get('format', 'json')
+    if format not in ('json', 'pstats', 'collapsed'):
+        return jsonify({"detail": "format deve ser 'json', 'pstats' ou 'collapsed'"}), 400
+    try:
+        if format == 'json':
+            return jsonify(profiling.load(profile_id))
+        mimetype = 'application/octet-stream' if format == 'pstats' else 'text/plain'
+        return send_file(
+            profiling.profile_file(profile_id, format), mimetype=mimetype,
+            as_attachment=True, download_name=f'{profile_id}.{format}'
+        )
+    except KeyError:
+        return jsonify({"detail": f"Perfil '{profile_id}' não encontrado"}), 404
+
+
+@app.route("/debug/memory", methods=["GET"])
+def get_memory():
+    """Memória por coluna, geometria, índice espacial e cache de cada dataset, RSS e alertas de orçamento"""
+    try:
+        return jsonify(datasets.memory_report())
+
+    except Exception as e:
+        return jsonify({"detail": f"Erro ao medir memória: {str(e)}"}), 500
+
+
+@app.route("/datasets", methods=["GET"])
+def get_datasets():
+    """Datasets nomeados: estado (memória ou disco), memória por camada e orçamento"""
+    try:
+        return jsonify(datasets.describe())
+
+    except Exception as e:
+        return jsonify({"detail": f"Erro ao listar datasets: {str(e)}"}), 500
+
+
+def _submit_upload(layer: str):
+    """Grava o arquivo e enfileira a carga; 202 com o job, acompanhado em /jobs/<id>"""
+    _engine(create=True)
 
-    Colunas esperadas: codLote, logradouro, numero, bairro, sigla_trat,
-    area_terreno, ca, to, limite_altura, afast_frontal, limite_embasamento,
-    gabarito, altura, geometry, inscricaoImobiliaria, tipoConstrucao,
-    numeroPavimentos, ocupacao
-    """
     if 'file' not in request.files:
         return jsonify({"detail": "Nenhum arquivo enviado"}), 400
 
@@ -87,30 +237,32 @@ def upload_lotes():
         return jsonify({"detail": "Arquivo deve ser .parquet"}), 400
 
     try:
-        # Salvar temporariamente
+        # Salvar temporariamente (removido pelo job ao final)
         with tempfile.NamedTemporaryFile(delete=False, suffix='.parquet') as tmp:
             file.save(tmp.name)
             tmp_path = tmp.name
 
-        # Carregar no motor espacial
-        count = spatial_engine.load_parquet_lotes(tmp_path)
+        job = uploads.submit(layer, request.args.get('dataset', DEFAULT_DATASET), tmp_path, file.filename)
+        return jsonify(job.describe()), 202, {"Location": f"/jobs/{job.id}"}
 
-        # Ler colunas do arquivo
-        df = pd.read_parquet(tmp_path)
-        columns = df.columns.tolist()
+    except Exception as e:
+        return jsonify({"detail": f"Erro ao processar arquivo: {str(e)}"}), 500
 
-        # Limpar arquivo temporário
-        os.unlink(tmp_path)
 
-        return jsonify({
-            "message": "Lotes carregados com sucesso",
-            "records_count": count,
-            "file_type": "lotes",
-            "columns": columns
-        })
+@app.route("/upload/lotes", methods=["POST"])
+def upload_lotes():
+    """
+    Upload de arquivo Parquet com dados de lotes de Vitória
 
-    except Exception as e:
-        return jsonify({"detail": f"Erro ao processar arquivo: {str(e)}"}), 500
+    Colunas esperadas: codLote, logradouro, numero, bairro, sigla_trat,
+    area_terreno, ca, to, limite_altura, afast_frontal, limite_embasamento,
+    gabarito, altura, geometry, inscricaoImobiliaria, tipoConstrucao,
+    numeroPavimentos, ocupacao
+
+    A carga roda em segundo plano; o resultado fica em /jobs/<id> e as
+    consultas usam os dados anteriores até ela terminar.
+    """
+    return _submit_upload("lotes")
 
 
 @app.route("/upload/imoveis", methods=["POST"])
@@ -121,43 +273,26 @@ def upload_imoveis():
     Colunas esperadas: Incorporador, Empreendimento, Bairro, Endereco, Cidade,
     Dormitorios, Metragem Privativa, Vagas, Preco Total, Status,
     Unidades Total, Unidades Vendidas, Estoque Atual
+
+    A carga roda em segundo plano; o resultado fica em /jobs/<id> e as
+    consultas usam os dados anteriores até ela terminar.
     """
-    if 'file' not in request.files:
-        return jsonify({"detail": "Nenhum arquivo enviado"}), 400
+    return _submit_upload("imoveis")
 
-    file = request.files['file']
 
-    if file.filename == '':
-        return jsonify({"detail": "Nenhum arquivo selecionado"}), 400
+@app.route("/jobs", methods=["GET"])
+def get_jobs():
+    """Jobs de upload, do mais recente ao mais antigo"""
+    return jsonify({"jobs": uploads.list_jobs()})
 
-    if not file.filename.endswith('.parquet'):
-        return jsonify({"detail": "Arquivo deve ser .parquet"}), 400
 
+@app.route("/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    """Estado do upload: fase, linhas, vazão, tempo por etapa, resultado ou erro"""
     try:
-        # Salvar temporariamente
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.parquet') as tmp:
-            file.save(tmp.name)
-            tmp_path = tmp.name
-
-        # Carregar no motor espacial
-        count = spatial_engine.load_parquet_imoveis(tmp_path)
-
-        # Ler colunas do arquivo
-        df = pd.read_parquet(tmp_path)
-        columns = df.columns.tolist()
-
-        # Limpar arquivo temporário
-        os.unlink(tmp_path)
-
-        return jsonify({
-            "message": "Imóveis carregados com sucesso",
-            "records_count": count,
-            "file_type": "imoveis",
-            "columns": columns
-        })
-
-    except Exception as e:
-        return jsonify({"detail": f"Erro ao processar arquivo: {str(e)}"}), 500
+        return jsonify(uploads.get(job_id))
+    except KeyError:
+        return jsonify({"detail": f"Job '{job_id}' não encontrado"}), 404
 
 
 @app.route("/analyze", methods=["POST"])
@@ -167,6 +302,8 @@ def analyze_area():
 
     Retorna lotes e imóveis dentro do raio especificado
     """
+    engine = _engine()
+
     try:
         data = request.get_json()
 
@@ -181,40 +318,310 @@ def analyze_area():
         if latitude is None or longitude is None:
             return jsonify({"detail": "latitude e longitude são obrigatórios"}), 400
 
-        result = spatial_engine.analyze_radius(
+        result = engine.analyze_radius(
             lat=latitude,
             lon=longitude,
             radius_meters=radius_meters,
-            filters=filters
+            filters=filters,
+            approximate=bool(data.get('approximate', False)),
+            refine=bool(data.get('refine', True))
+        )
+
+        with metrics.stage('encode'):
+            return jsonify(result)
+
+    except ValueError as e:
+        return jsonify({"detail": str(e)}), 400
+    except Exception as e:
+        return jsonify({"detail": f"Erro na análise: {str(e)}"}), 500
+
+
+def _sse(event: str, data: dict) -> str:
+    """Formata um evento Server-Sent Events"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.route("/analyze/stream", methods=["GET"])
+def analyze_stream():
+    """
+    Análise circular progressiva via Server-Sent Events
+
+    Emite `stats` imediatamente, depois `features` em blocos do mais próximo ao
+    mais distante e `done`; fechar a conexão interrompe a serialização
+    """
+    engine = _engine()
+
+    try:
+        latitude = request.args.get('latitude', type=float)
+        longitude = request.args.get('longitude', type=float)
+        filters = request.args.get('filters')
+
+        if latitude is None or longitude is None:
+            return jsonify({"detail": "latitude e longitude são obrigatórios"}), 400
+
+        events = engine.analyze_radius_stream(
+            lat=latitude,
+            lon=longitude,
+            radius_meters=request.args.get('radius_meters', 1000, type=float),
+            filters=json.loads(filters) if filters else None,
+            chunk_size=request.args.get('chunk_size', 200, type=int)
+        )
+
+    except ValueError as e:
+        return jsonify({"detail": str(e)}), 400
+
+    def generate():
+        # Desconexão do cliente fecha o gerador (GeneratorExit) e cancela o restante
+        try:
+            for event in events:
+                yield _sse(*event)
+        except Exception as e:
+            yield _sse('error', {'detail': f"Erro na análise: {str(e)}"})
+        finally:
+            events.close()
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.route("/analyze/polygon", methods=["POST"])
+def analyze_polygon():
+    """
+    Analisa uma área poligonal (perímetros de zoneamento, bairros, áreas desenhadas)
+
+    Retorna lotes e imóveis conforme o modo de match: intersects, within ou centroid
+    """
+    engine = _engine()
+
+    try:
+        data = request.get_json()
+
+        if not data or not data.get('geometry'):
+            return jsonify({"detail": "geometry é obrigatório"}), 400
+
+        result = engine.analyze_polygon(
+            geometry=data['geometry'],
+            filters=data.get('filters'),
+            match=data.get('match', 'intersects')
+        )
+
+        return jsonify(result)
+
+    except ValueError as e:
+        return jsonify({"detail": str(e)}), 400
+    except Exception as e:
+        return jsonify({"detail": f"Erro na análise: {str(e)}"}), 500
+
+@app.route("/analyze/rings", methods=["POST"])
+def analyze_rings():
+    """
+    Analisa anéis concêntricos ao redor de um ponto em uma única passada
+
+    Retorna estatísticas por anel e acumuladas até cada raio
+    """
+    engine = _engine()
+
+    try:
+        data = request.get_json()
+
+        if not data or 'latitude' not in data or 'longitude' not in data or not data.get('radii'):
+            return jsonify({"detail": "latitude, longitude e radii são obrigatórios"}), 400
+
+        result = engine.analyze_rings(
+            lat=float(data['latitude']),
+            lon=float(data['longitude']),
+            radii=data['radii'],
+            filters=data.get('filters'),
+            include_features=bool(data.get('include_features', False))
+        )
+
+        return jsonify(result)
+
+    except ValueError as e:
+        return jsonify({"detail": str(e)}), 400
+    except Exception as e:
+        return jsonify({"detail": f"Erro na análise: {str(e)}"}), 500
+
+@app.route("/nearest", methods=["POST"])
+def nearest():
+    """
+    Retorna os k lotes e imóveis mais próximos de um ponto
+
+    Busca em KD-tree sobre pontos projetados (centróides no caso de lotes),
+    com distâncias métricas em `distancia_metros`, em ordem crescente
+    """
+    engine = _engine()
+
+    try:
+        data = request.get_json()
+
+        if not data:
+            return jsonify({"detail": "Dados inválidos"}), 400
+
+        latitude = data.get('latitude')
+        longitude = data.get('longitude')
+
+        if latitude is None or longitude is None:
+            return jsonify({"detail": "latitude e longitude são obrigatórios"}), 400
+
+        result = engine.nearest(
+            lat=latitude,
+            lon=longitude,
+            k=data.get('k', 10),
+            filters=data.get('filters'),
+            layer=data.get('layer', 'all'),
+            max_distance=data.get('max_distance')
         )
+        return jsonify(result)
+
+    except ValueError as e:
+        return jsonify({"detail": str(e)}), 400
+    except Exception as e:
+        return jsonify({"detail": f"Erro na busca de vizinhos: {str(e)}"}), 500
+
+
+@app.route("/upload/partitioned/<layer>", methods=["POST"])
+def upload_partitioned(layer):
+    """
+    Grava um Parquet de lotes ou imóveis no armazenamento particionado
+
+    O arquivo é copiado em blocos para o disco e lido em lotes, sem carregar
+    tudo na memória; os dados em memória não são alterados.
+    """
+    engine = _engine()
+
+    if 'file' not in request.files:
+        return jsonify({"detail": "Nenhum arquivo enviado"}), 400
+
+    file = request.files['file']
+
+    if file.filename == '':
+        return jsonify({"detail": "Nenhum arquivo selecionado"}), 400
+
+    if not file.filename.endswith('.parquet'):
+        return jsonify({"detail": "Arquivo deve ser .parquet"}), 400
+
+    try:
+        with tempfile.NamedTemporaryFile(delete=False, suffix='.parquet') as tmp:
+            shutil.copyfileobj(file.stream, tmp)
+            tmp_path = tmp.name
+
+        try:
+            result = engine.ingest_partitioned(layer, tmp_path)
+        finally:
+            os.unlink(tmp_path)
 
         return jsonify(result)
 
+    except ValueError as e:
+        return jsonify({"detail": str(e)}), 400
+    except Exception as e:
+        return jsonify({"detail": f"Erro ao processar arquivo: {str(e)}"}), 500
+
+
+@app.route("/analyze/partitioned", methods=["POST"])
+def analyze_partitioned():
+    """
+    Analisa uma área circular lendo só as partições e row groups que ela toca
+
+    Usa o armazenamento particionado (fora da memória) em vez dos dados carregados
+    """
+    engine = _engine()
+
+    try:
+        data = request.get_json()
+
+        if not data or 'latitude' not in data or 'longitude' not in data:
+            return jsonify({"detail": "latitude e longitude são obrigatórios"}), 400
+
+        result = engine.analyze_partitioned(
+            lat=float(data['latitude']),
+            lon=float(data['longitude']),
+            radius_meters=float(data.get('radius_meters', 1000)),
+            filters=data.get('filters'),
+            include_features=bool(data.get('include_features', False))
+        )
+
+        return jsonify(result)
+
+    except ValueError as e:
+        return jsonify({"detail": str(e)}), 400
     except Exception as e:
         return jsonify({"detail": f"Erro na análise: {str(e)}"}), 500
 
 
+@app.route("/partitioned", methods=["GET"])
+def get_partitioned_status():
+    """Partições, arquivos, linhas e cache do armazenamento particionado"""
+    engine = _engine()
+
+    try:
+        return jsonify(engine.partitioned_status())
+
+    except Exception as e:
+        return jsonify({"detail": f"Erro ao consultar partições: {str(e)}"}), 500
+
+
+@app.route("/nearest/batch", methods=["POST"])
+def nearest_batch():
+    """Retorna os k lotes e imóveis mais próximos de cada ponto informado"""
+    engine = _engine()
+
+    try:
+        data = request.get_json()
+
+        if not data or not data.get('points'):
+            return jsonify({"detail": "points é obrigatório"}), 400
+
+        results = engine.nearest_batch(
+            points=data['points'],
+            k=data.get('k', 10),
+            filters=data.get('filters'),
+            layer=data.get('layer', 'all'),
+            max_distance=data.get('max_distance')
+        )
+        return jsonify({"results": results})
+
+    except ValueError as e:
+        return jsonify({"detail": str(e)}), 400
+    except Exception as e:
+        return jsonify({"detail": f"Erro na busca de vizinhos: {str(e)}"}), 500
+
+def _conditional_json(engine: SpatialEngine, key: tuple, builder) -> Response:
+    """JSON com ETag/Last-Modified da versão dos dados; 304 se o cliente já tem essa versão"""
+    etag = engine.etag(*key)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": engine.last_modified(),
+        "Cache-Control": "no-cache"
+    }
+    if engine.not_modified(
+        etag,
+        request.headers.get("If-None-Match"),
+        request.headers.get("If-Modified-Since")
+    ):
+        return Response(status=304, headers=headers)
+
+    return Response(engine.serialized(key, builder), mimetype="application/json", headers=headers)
+
+
 @app.route("/lotes/geojson", methods=["GET"])
 def get_lotes_geojson():
     """Retorna todos os lotes em formato GeoJSON"""
+    engine = _engine()
+
     try:
         bairro = request.args.get('bairro')
         limit = request.args.get('limit', 1000, type=int)
 
-        geojson = spatial_engine.get_all_lotes_geojson()
-
-        # Aplicar filtros se necessário
-        if bairro:
-            geojson['features'] = [
-                f for f in geojson['features']
-                if f['properties'].get('bairro') == bairro
-            ]
-
-        # Limitar resultados
-        if limit:
-            geojson['features'] = geojson['features'][:limit]
-
-        return jsonify(geojson)
+        return _conditional_json(
+            engine,
+            ("lotes/geojson", bairro, limit),
+            lambda: engine.get_all_lotes_geojson(bairro=bairro, limit=limit)
+        )
 
     except Exception as e:
         return jsonify({"detail": f"Erro ao buscar lotes: {str(e)}"}), 500
@@ -223,80 +630,293 @@ def get_lotes_geojson():
 @app.route("/imoveis/geojson", methods=["GET"])
 def get_imoveis_geojson():
     """Retorna todos os imóveis em formato GeoJSON"""
+    engine = _engine()
+
     try:
         bairro = request.args.get('bairro')
         limit = request.args.get('limit', 1000, type=int)
 
-        geojson = spatial_engine.get_all_imoveis_geojson()
+        return _conditional_json(
+            engine,
+            ("imoveis/geojson", bairro, limit),
+            lambda: engine.get_all_imoveis_geojson(bairro=bairro, limit=limit)
+        )
+
+    except Exception as e:
+        return jsonify({"detail": f"Erro ao buscar imóveis: {str(e)}"}), 500
+
 
-        # Aplicar filtros se necessário
-        if bairro:
-            geojson['features'] = [
-                f for f in geojson['features']
-                if f['properties'].get('bairro') == bairro
-            ]
+@app.route("/imoveis/clusters", methods=["GET"])
+def get_imoveis_clusters():
+    """Clusters de imóveis por zoom (features reais em zoom alto)"""
+    engine = _engine()
+
+    try:
+        bbox = request.args.get('bbox')
+        zoom = request.args.get('zoom', type=float)
 
-        # Limitar resultados
-        if limit:
-            geojson['features'] = geojson['features'][:limit]
+        if not bbox or zoom is None:
+            return jsonify({"detail": "bbox e zoom são obrigatórios"}), 400
 
-        return jsonify(geojson)
+        result = engine.imovel_clusters(
+            bbox=tuple(float(value) for value in bbox.split(',')),
+            zoom=zoom
+        )
+        return jsonify(result)
 
+    except ValueError as e:
+        return jsonify({"detail": str(e)}), 400
     except Exception as e:
-        return jsonify({"detail": f"Erro ao buscar imóveis: {str(e)}"}), 500
+        return jsonify({"detail": f"Erro ao buscar clusters: {str(e)}"}), 500
+
+
+def _bounds_body(engine: SpatialEngine) -> dict:
+    """Corpo da resposta de /bounds"""
+    bounds = engine.get_bounds()
+
+    if bounds is None:
+        return {
+            "message": "Nenhum dado carregado ainda",
+            "bounds": None
+        }
+
+    return {
+        "bounds": {
+            "minLng": bounds[0],
+            "minLat": bounds[1],
+            "maxLng": bounds[2],
+            "maxLat": bounds[3]
+        }
+    }
+
+
+def _stats_body(engine: SpatialEngine) -> dict:
+    """Corpo da resposta de /stats"""
+    stats = {
+        "lotes": {
+            "total": len(engine.lotes_gdf) if engine.lotes_gdf is not None else 0,
+            "com_geometria": len(engine.lotes_gdf[engine.lotes_gdf.geometry.notna()]) if engine.lotes_gdf is not None else 0
+        },
+        "imoveis": {
+            "total": len(engine.imoveis_gdf) if engine.imoveis_gdf is not None else 0,
+            "com_geometria": len(engine.imoveis_gdf[engine.imoveis_gdf.geometry.notna()]) if engine.imoveis_gdf is not None else 0
+        }
+    }
+
+    # Adicionar bairros únicos
+    if engine.lotes_gdf is not None and len(engine.lotes_gdf) > 0:
+        stats['lotes']['bairros_unicos'] = engine.lotes_gdf['bairro'].nunique() if 'bairro' in engine.lotes_gdf.columns else 0
+
+    if engine.imoveis_gdf is not None and len(engine.imoveis_gdf) > 0:
+        stats['imoveis']['bairros_unicos'] = engine.imoveis_gdf['bairro'].nunique() if 'bairro' in engine.imoveis_gdf.columns else 0
+
+    return stats
 
 
 @app.route("/bounds", methods=["GET"])
 def get_bounds():
     """Retorna os limites geográficos dos dados carregados"""
+    engine = _engine()
+
     try:
-        bounds = spatial_engine.get_bounds()
-
-        if bounds is None:
-            return jsonify({
-                "message": "Nenhum dado carregado ainda",
-                "bounds": None
-            })
-
-        return jsonify({
-            "bounds": {
-                "minLng": bounds[0],
-                "minLat": bounds[1],
-                "maxLng": bounds[2],
-                "maxLat": bounds[3]
-            }
-        })
+        return _conditional_json(engine, ("bounds",), lambda: _bounds_body(engine))
 
     except Exception as e:
         return jsonify({"detail": f"Erro ao buscar limites: {str(e)}"}), 500
 
 
+def _warm_caches(engine: SpatialEngine):
+    """Corpos de /bounds, /stats e da primeira página de /lotes e /imoveis (mesmas chaves das rotas)"""
+    engine.serialized(("bounds",), lambda: _bounds_body(engine))
+    engine.serialized(("stats",), lambda: _stats_body(engine))
+    engine.serialized(("lotes/geojson", None, 1000), lambda: engine.get_all_lotes_geojson(bairro=None, limit=1000))
+    engine.serialized(("imoveis/geojson", None, 1000), lambda: engine.get_all_imoveis_geojson(bairro=None, limit=1000))
+
+
 @app.route("/stats", methods=["GET"])
 def get_statistics():
     """Retorna estatísticas gerais dos dados carregados"""
+    engine = _engine()
+
     try:
-        stats = {
-            "lotes": {
-                "total": len(spatial_engine.lotes_gdf) if spatial_engine.lotes_gdf is not None else 0,
-                "com_geometria": len(spatial_engine.lotes_gdf[spatial_engine.lotes_gdf.geometry.notna()]) if spatial_engine.lotes_gdf is not None else 0
-            },
-            "imoveis": {
-                "total": len(spatial_engine.imoveis_gdf) if spatial_engine.imoveis_gdf is not None else 0,
-                "com_geometria": len(spatial_engine.imoveis_gdf[spatial_engine.imoveis_gdf.geometry.notna()]) if spatial_engine.imoveis_gdf is not None else 0
-            }
-        }
+        return _conditional_json(engine, ("stats",), lambda: _stats_body(engine))
 
-        # Adicionar bairros únicos
-        if spatial_engine.lotes_gdf is not None and len(spatial_engine.lotes_gdf) > 0:
-            stats['lotes']['bairros_unicos'] = spatial_engine.lotes_gdf['bairro'].nunique() if 'bairro' in spatial_engine.lotes_gdf.columns else 0
+    except Exception as e:
+        return jsonify({"detail": f"Erro ao calcular estatísticas: {str(e)}"}), 500
 
-        if spatial_engine.imoveis_gdf is not None and len(spatial_engine.imoveis_gdf) > 0:
-            stats['imoveis']['bairros_unicos'] = spatial_engine.imoveis_gdf['bairro'].nunique() if 'bairro' in spatial_engine.imoveis_gdf.columns else 0
 
-        return jsonify(stats)
+@app.route("/aggregate/grid", methods=["GET"])
+def aggregate_grid():
+    """Agrega lotes e imóveis em células para mapas de calor"""
+    engine = _engine()
 
+    try:
+        cell_size = request.args.get('cell_size', 500, type=float)
+        grid_type = request.args.get('grid_type', 'square')
+
+        result = engine.aggregate_grid(cell_size=cell_size, grid_type=grid_type)
+        return jsonify(result)
+
+    except ValueError as e:
+        return jsonify({"detail": str(e)}), 400
     except Exception as e:
-        return jsonify({"detail": f"Erro ao calcular estatísticas: {str(e)}"}), 500
+        return jsonify({"detail": f"Erro na agregação: {str(e)}"}), 500
+
+
+@app.route("/interpolate", methods=["POST"])
+def interpolate():
+    """
+    Estima preço por m² (ou outro atributo) por IDW ou krigagem ordinária
+
+    Sem `points`, retorna uma superfície em grade regular (em cache por versão
+    dos dados e parâmetros); com `points`, retorna estimativas nesses pontos
+    """
+    engine = _engine()
+
+    try:
+        data = request.get_json(silent=True) or {}
+
+        allowed = (
+            'method', 'attribute', 'cell_size', 'points', 'k', 'max_distance',
+            'power', 'model', 'sill', 'range_meters', 'nugget'
+        )
+        params = {key: value for key, value in data.items() if key in allowed}
+
+        points = params.get('points')
+        if points is not None and not (
+            isinstance(points, list)
+            and all(
+                isinstance(point, dict)
+                and all(
+                    isinstance(point.get(axis), (int, float)) and not isinstance(point.get(axis), bool)
+                    for axis in ('latitude', 'longitude')
+                )
+                for point in points
+            )
+        ):
+            return jsonify({"detail": "points deve ser uma lista de {latitude, longitude}"}), 400
+
+        result = engine.interpolate(**params)
+        return jsonify(result)
+
+    except ValueError as e:
+        return jsonify({"detail": str(e)}), 400
+    except Exception as e:
+        return jsonify({"detail": f"Erro na interpolação: {str(e)}"}), 500
+
+
+@app.route("/variogram", methods=["POST"])
+def variogram():
+    """
+    Semivariograma empírico de preço por m² (ou outro atributo)
+
+    Pares acumulados em blocos via KD-tree até max_lag, dentro de um orçamento
+    fixo de memória, com ajuste opcional de modelo esférico, exponencial ou gaussiano
+    """
+    engine = _engine()
+
+    try:
+        data = request.get_json(silent=True) or {}
+
+        allowed = (
+            'attribute', 'max_lag', 'n_lags', 'directions', 'tolerance', 'sample_fraction',
+            'max_points', 'model', 'memory_budget_mb', 'seed'
+        )
+        params = {key: value for key, value in data.items() if key in allowed}
+
+        result = engine.variogram(**params)
+        return jsonify(result)
+
+    except ValueError as e:
+        return jsonify({"detail": str(e)}), 400
+    except Exception as e:
+        return jsonify({"detail": f"Erro no variograma: {str(e)}"}), 500
+
+
+@app.route("/markov", methods=["POST"])
+def markov():
+    """
+    Análise de Markov espacial de classes de preço ou valor
+
+    Retorna a matriz de transição global, as matrizes condicionadas à classe
+    da defasagem espacial e as distribuições estacionárias
+    """
+    engine = _engine()
+
+    try:
+        data = request.get_json(silent=True) or {}
+
+        allowed = (
+            'layer', 'attribute', 'n_classes', 'weights', 'k', 'threshold',
+            'period_column', 'id_column'
+        )
+        params = {key: value for key, value in data.items() if key in allowed}
+
+        result = engine.markov(**params)
+        return jsonify(result)
+
+    except ValueError as e:
+        return jsonify({"detail": str(e)}), 400
+    except Exception as e:
+        return jsonify({"detail": f"Erro na análise de Markov: {str(e)}"}), 500
+
+
+@app.route("/autocorrelation", methods=["POST"])
+def autocorrelation():
+    """
+    I de Moran global e LISA (clusters HH/LL e outliers HL/LH)
+
+    Retorna a camada LISA em GeoJSON ou como stream Arrow (`format: "arrow"`)
+    """
+    engine = _engine()
+
+    try:
+        data = request.get_json(silent=True) or {}
+
+        allowed = (
+            'layer', 'attribute', 'weights', 'k', 'threshold',
+            'permutations', 'significance', 'seed'
+        )
+        params = {key: value for key, value in data.items() if key in allowed}
+        output = data.get('format', 'geojson')
+
+        if output == 'arrow':
+            content = engine.autocorrelation_arrow(**params)
+            return Response(content, mimetype="application/vnd.apache.arrow.stream")
+        if output != 'geojson':
+            raise ValueError("format deve ser 'geojson' ou 'arrow'")
+
+        return jsonify(engine.autocorrelation_geojson(**params))
+
+    except ValueError as e:
+        return jsonify({"detail": str(e)}), 400
+    except Exception as e:
+        return jsonify({"detail": f"Erro na autocorrelação: {str(e)}"}), 500
+
+
+@app.route("/cube", methods=["POST"])
+def cube():
+    """
+    Consulta ao cubo de imóveis por bairro, dormitórios, status e incorporador
+
+    Retorna imóveis, unidades, vendidas, estoque e preço médio por m² de cada
+    combinação das dimensões pedidas, a partir dos agregados materializados
+    """
+    engine = _engine()
+
+    try:
+        data = request.get_json(silent=True) or {}
+
+        result = engine.cube(
+            dimensions=data.get('dimensions', ['bairro']),
+            filters=data.get('filters')
+        )
+        return jsonify(result)
+
+    except ValueError as e:
+        return jsonify({"detail": str(e)}), 400
+    except Exception as e:
+        return jsonify({"detail": f"Erro no cubo: {str(e)}"}), 500
 
 
 @app.errorhandler(404)
@@ -309,5 +929,9 @@ def internal_error(e):
     return jsonify({"detail": "Erro interno do servidor"}), 500
 
 
+# Cada worker do gunicorn aquece o próprio processo (sem --preload, a thread não sobreviveria ao fork)
+warm_start.start(_warm_caches)
+
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=8000, debug=True)
@@ -0,0 +1,123 @@
+import numpy as np
+from typing import Any, Dict, List, Tuple
+
+
+# Faixa de zoom com clusters pré-calculados; acima de MAX_ZOOM retornam-se os pontos
+MIN_ZOOM = 0
+MAX_ZOOM = 16
+
+# Raio do cluster em pixels e tamanho do tile em pixels (mesmos padrões do supercluster)
+CLUSTER_RADIUS = 60
+TILE_EXTENT = 512
+
+
+def mercator(lon: np.ndarray, lat: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Coordenadas Web Mercator normalizadas em [0, 1] (y cresce para o sul)"""
+    lat = np.clip(np.asarray(lat, dtype=float), -85.05112878, 85.05112878)
+    sin = np.sin(np.radians(lat))
+    x = np.asarray(lon, dtype=float) / 360 + 0.5
+    y = 0.5 - 0.25 * np.log((1 + sin) / (1 - sin)) / np.pi
+    return x, y
+
+
+def inverse_mercator(x: np.ndarray, y: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Longitude e latitude a partir de coordenadas Web Mercator normalizadas"""
+    lon = (np.asarray(x) - 0.5) * 360
+    lat = np.degrees(2 * np.arctan(np.exp((0.5 - np.asarray(y)) * 2 * np.pi)) - np.pi / 2)
+    return lon, lat
+
+
+def build_cluster_index(
+    x: np.ndarray,
+    y: np.ndarray,
+    values: np.ndarray,
+    min_zoom: int = MIN_ZOOM,
+    max_zoom: int = MAX_ZOOM,
+    radius: float = CLUSTER_RADIUS,
+    extent: int = TILE_EXTENT
+) -> Dict[int, Dict[str, np.ndarray]]:
+    """
+    Índice hierárquico de clusters por zoom (agrupamento guloso em grade)
+
+    Cada nível agrupa os clusters do nível seguinte (mais detalhado) em
+    células de `radius` pixels, com centróide ponderado pela contagem, soma
+    dos valores para a média e o zoom em que o cluster se divide.
+    """
+    valid = np.isfinite(values)
+    level = {
+        'x': x,
+        'y': y,
+        'count': np.ones(len(x), dtype=np.int64),
+        'value_sum': np.where(valid, values, 0.0),
+        'value_n': valid.astype(np.int64),
+        'first': np.arange(len(x)),
+        'expansion_zoom': np.full(len(x), max_zoom + 1)
+    }
+
+    index = {}
+    for zoom in range(max_zoom, min_zoom - 1, -1):
+        cell = radius / (extent * 2 ** zoom)
+        i = np.floor(level['x'] / cell).astype(np.int64)
+        j = np.floor(level['y'] / cell).astype(np.int64)
+        if len(i) == 0:
+            index[zoom] = level
+            continue
+        span = int(j.max() - j.min()) + 1
+        _, parent = np.unique((i - i.min()) * span + (j - j.min()), return_inverse=True)
+        n = int(parent.max()) + 1
+
+        count = np.bincount(parent, weights=level['count'], minlength=n)
+        children = np.bincount(parent, minlength=n)
+        any_child = np.zeros(n, dtype=np.int64)
+        any_child[parent] = np.arange(len(parent))
+
+        # Cluster com um único filho só se divide quando o filho se divide
+        expansion = np.where(children > 1, zoom + 1, level['expansion_zoom'][any_child])
+
+        level = {
+            'x': np.bincount(parent, weights=level['x'] * level['count'], minlength=n) / count,
+            'y': np.bincount(parent, weights=level['y'] * level['count'], minlength=n) / count,
+            'count': count.astype(np.int64),
+            'value_sum': np.bincount(parent, weights=level['value_sum'], minlength=n),
+            'value_n': np.bincount(parent, weights=level['value_n'], minlength=n).astype(np.int64),
+            'first': level['first'][any_child],
+            'expansion_zoom': expansion
+        }
+        index[zoom] = level
+
+    return index
+
+
+def query_clusters(
+    level: Dict[str, np.ndarray],
+    bbox: Tuple[float, float, float, float]
+) -> np.ndarray:
+    """Índices dos clusters do nível cujo centróide está dentro do bbox (lon/lat)"""
+    min_x, max_y = mercator(np.array([bbox[0]]), np.array([bbox[1]]))
+    max_x, min_y = mercator(np.array([bbox[2]]), np.array([bbox[3]]))
+    inside = (
+        (level['x'] >= min_x[0]) & (level['x'] <= max_x[0]) &
+        (level['y'] >= min_y[0]) & (level['y'] <= max_y[0])
+    )
+    return np.flatnonzero(inside)
+
+
+def cluster_features(level: Dict[str, np.ndarray], ids: np.ndarray, zoom: int) -> List[Dict[str, Any]]:
+    """Features GeoJSON dos clusters (contagem, média do valor e zoom de expansão)"""
+    lon, lat = inverse_mercator(level['x'][ids], level['y'][ids])
+    features = []
+    for k, cluster in enumerate(ids):
+        n = level['value_n'][cluster]
+        features.append({
+            'type': 'Feature',
+            'properties': {
+                'cluster': True,
+                'cluster_id': int(cluster),
+                'zoom': zoom,
+                'point_count': int(level['count'][cluster]),
+                'preco_m2_medio': float(level['value_sum'][cluster] / n) if n else None,
+                'expansion_zoom': int(level['expansion_zoom'][cluster])
+            },
+            'geometry': {'type': 'Point', 'coordinates': [float(lon[k]), float(lat[k])]}
+        })
+    return features
@@ -0,0 +1,311 @@
+from __future__ import annotations
+
+import os
+import re
+import resource
+import shutil
+import sys
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+import metrics
+
+if TYPE_CHECKING:
+    from spatial_engine import SpatialEngine
+
+
+# Dataset usado quando a requisição não informa `dataset`
+DEFAULT_DATASET = 'default'
+
+# Orçamento de memória somado dos datasets residentes
+MEMORY_BUDGET_BYTES = int(os.environ.get('MEMORY_BUDGET_MB', '4096')) * 1024 * 1024
+
+# Diretório dos snapshots dos datasets descarregados da memória (volume /data do docker-compose)
+DATASET_SNAPSHOT_PATH = os.environ.get('DATASET_SNAPSHOT_PATH', '/data/datasets')
+
+# Nomes aceitos (também usados como nomes de diretório)
+DATASET_NAME = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+# Fração do orçamento a partir da qual /debug/memory emite alertas
+MEMORY_WARNING_RATIO = float(os.environ.get('MEMORY_WARNING_RATIO', '0.8'))
+
+
+def process_memory() -> Dict[str, Optional[int]]:
+    """RSS atual e pico do processo (/proc no Linux; fora dele, só o pico via getrusage)"""
+    usage: Dict[str, Optional[int]] = {'rss_bytes': None, 'pico_rss_bytes': None}
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    usage['rss_bytes'] = int(line.split()[1]) * 1024
+                elif line.startswith('VmHWM:'):
+                    usage['pico_rss_bytes'] = int(line.split()[1]) * 1024
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        usage['pico_rss_bytes'] = peak if sys.platform == 'darwin' else peak * 1024
+    return usage
+
+
+class DatasetRegistry:
+    """
+    Datasets nomeados (um SpatialEngine cada) sob um orçamento de memória
+
+    Quando a memória somada dos datasets residentes passa do orçamento, os
+    menos usados recentemente são gravados em snapshot (Arrow IPC) e
+    descartados; o próximo acesso os recarrega do snapshot, que é mantido
+    enquanto a versão não muda (descartar de novo não regrava nada). O
+    dataset em uso na requisição nunca é descartado.
+
+    O lock global protege só o registro; gravação e recarga de snapshots
+    rodam sob o lock de cada dataset, sem bloquear os demais.
+    """
+
+    def __init__(
+        self,
+        budget_bytes: int = MEMORY_BUDGET_BYTES,
+        snapshot_path: str = DATASET_SNAPSHOT_PATH,
+        store_path: Optional[str] = None
+    ):
+        self.budget_bytes = budget_bytes
+        self.snapshot_path = snapshot_path
+        self.store_path = store_path
+        self._resident: OrderedDict[str, SpatialEngine] = OrderedDict()
+        self._last_access: Dict[str, float] = {}
+        self._evictions: Dict[str, int] = {}
+        self._reloads: Dict[str, int] = {}
+        self._errors: Dict[str, str] = {}
+        self._lock = threading.RLock()
+        # Gravação, recarga e troca do motor de cada dataset (I/O fora do lock global)
+        self._locks: Dict[str, threading.Lock] = {}
+        # Uma carga por vez em cada dataset (a segunda partiria dos dados anteriores à primeira)
+        self._writers: Dict[str, threading.Lock] = {}
+        # Um descarte por vez (dois em paralelo descartariam datasets a mais)
+        self._evicting = threading.Lock()
+
+    def _snapshot_dir(self, name: str) -> str:
+        """Diretório do snapshot do dataset"""
+        return os.path.join(self.snapshot_path, name)
+
+    def _has_snapshot(self, name: str) -> bool:
+        """Se há snapshot completo do dataset em disco"""
+        return os.path.exists(os.path.join(self._snapshot_dir(name), 'snapshot.json'))
+
+    def _dataset_lock(self, name: str) -> threading.Lock:
+        """Lock de snapshot e troca do motor do dataset"""
+        with self._lock:
+            return self._locks.setdefault(name, threading.Lock())
+
+    def _new_engine(self, name: str) -> SpatialEngine:
+        """Motor vazio com armazenamento particionado próprio do dataset"""
+        # Import tardio: geopandas, shapely e scipy ficam fora da subida do servidor (ver warmup)
+        from partitioned import PARTITIONED_DATA_PATH
+        from spatial_engine import SpatialEngine
+
+        return SpatialEngine(store_path=os.path.join(self.store_path or PARTITIONED_DATA_PATH, name))
+
+    def snapshot_names(self) -> List[str]:
+        """Datasets com snapshot em disco, do mais recente ao mais antigo"""
+        if not os.path.isdir(self.snapshot_path):
+            return []
+        names = [name for name in os.listdir(self.snapshot_path) if self._has_snapshot(name)]
+        return sorted(
+            names,
+            key=lambda name: os.path.getmtime(os.path.join(self._snapshot_dir(name), 'snapshot.json')),
+            reverse=True
+        )
+
+    def resident(self, name: str) -> Optional[SpatialEngine]:
+        """Motor do dataset se estiver em memória (sem recarregar nem contar como acesso)"""
+        with self._lock:
+            return self._resident.get(name)
+
+    def resident_bytes(self) -> int:
+        """Memória somada dos datasets residentes"""
+        with self._lock:
+            return sum(engine.memory_usage()['total'] for engine in self._resident.values())
+
+    def get(self, name: Optional[str] = None, create: bool = False) -> SpatialEngine:
+        """
+        Motor do dataset, recarregado do snapshot se tiver sido descartado
+
+        Datasets inexistentes geram KeyError, a menos que `create` seja True
+        (uploads) ou seja o dataset padrão; nomes inválidos geram ValueError.
+        """
+        name = name or DEFAULT_DATASET
+        if not DATASET_NAME.match(name):
+            raise ValueError("dataset deve ter de 1 a 64 letras, números, '_' ou '-'")
+
+        with self._lock:
+            engine = self._resident.get(name)
+
+        if engine is None:
+            # Recarga sob o lock do dataset: requisições a outros datasets seguem normalmente
+            with self._dataset_lock(name):
+                with self._lock:
+                    engine = self._resident.get(name)
+                if engine is None:
+                    if self._has_snapshot(name):
+                        engine = self._new_engine(name)
+                        engine.load_snapshot(self._snapshot_dir(name))
+                        reloaded = True
+                    elif create or name == DEFAULT_DATASET:
+                        engine = self._new_engine(name)
+                        reloaded = False
+                    else:
+                        raise KeyError(name)
+                    with self._lock:
+                        self._resident[name] = engine
+                        if reloaded:
+                            self._reloads[name] = self._reloads.get(name, 0) + 1
+
+        with self._lock:
+            if self._resident.get(name) is engine:
+                self._resident.move_to_end(name)
+            self._last_access[name] = time.time()
+        self._enforce_budget(keep=name)
+        return engine
+
+    def _enforce_budget(self, keep: str):
+        """
+        Descarta para disco os datasets menos usados até caber no orçamento
+
+        Datasets com recarga, descarte ou troca em andamento são pulados, e
+        outra chamada em curso faz o trabalho; a próxima requisição reavalia.
+        """
+        if not self._evicting.acquire(blocking=False):
+            return
+        try:
+            with self._lock:
+                usage = {name: engine.memory_usage()['total'] for name, engine in self._resident.items()}
+            total = sum(usage.values())
+
+            for name in usage:
+                if total <= self.budget_bytes:
+                    break
+                lock = self._dataset_lock(name)
+                if name == keep or not lock.acquire(blocking=False):
+                    continue
+                try:
+                    with self._lock:
+                        engine = self._resident.get(name)
+                    if engine is None:
+                        continue
+                    try:
+                        # Snapshot da mesma versão (recarregado e não alterado) é reaproveitado
+                        if not engine.snapshot_matches(self._snapshot_dir(name)):
+                            engine.save_snapshot(self._snapshot_dir(name))
+                    except OSError as e:
+                        # Sem disco gravável o dataset permanece em memória
+                        with self._lock:
+                            self._errors[name] = str(e)
+                        continue
+                    with self._lock:
+                        self._errors.pop(name, None)
+                        del self._resident[name]
+                        self._evictions[name] = self._evictions.get(name, 0) + 1
+                    total -= usage[name]
+                finally:
+                    lock.release()
+        finally:
+            self._evicting.release()
+
+    def ingest(self, name: str, layer: str, file_path: str) -> SpatialEngine:
+        """
+        Carrega um Parquet de `layer` numa cópia do motor e a troca pelo motor em uso
+
+        As consultas continuam nos dados anteriores até a troca. Retorna o
+        motor novo (contagem e resumo da geocodificação estão nele).
+        """
+        if layer not in ('lotes', 'imoveis'):
+            raise ValueError("Camada deve ser 'lotes' ou 'imoveis'")
+
+        with self._lock:
+            writer = self._writers.setdefault(name, threading.Lock())
+        with writer:
+            staged = self.get(name, create=True).staging_copy(layer)
+            getattr(staged, f'load_parquet_{layer}')(file_path)
+
+            with metrics.stage('swap'), self._dataset_lock(name):
+                with self._lock:
+                    self._resident[name] = staged
+                    self._resident.move_to_end(name)
+                    self._last_access[name] = time.time()
+                # O snapshot (do motor anterior, residente ou descartado durante a carga) ficou obsoleto
+                shutil.rmtree(self._snapshot_dir(name), ignore_errors=True)
+        self._enforce_budget(keep=name)
+        return staged
+
+    def memory_report(self) -> Dict[str, Any]:
+        """Memória detalhada dos datasets residentes e do processo, com alertas de orçamento"""
+        with self._lock:
+            engines = dict(self._resident)
+        # Medição fora do lock: em camadas grandes leva centenas de ms
+        datasets = {name: engine.memory_report() for name, engine in sorted(engines.items())}
+        resident = sum(report['total_bytes'] for report in datasets.values())
+        process = process_memory()
+        threshold = self.budget_bytes * MEMORY_WARNING_RATIO
+
+        alerts = []
+        if resident >= threshold:
+            alerts.append(
+                f'Datasets residentes usam {resident / self.budget_bytes:.0%} do orçamento de memória; '
+                'os menos usados serão descartados para disco'
+            )
+        if process['rss_bytes'] is not None and process['rss_bytes'] >= threshold:
+            alerts.append(f"RSS do processo em {process['rss_bytes'] / self.budget_bytes:.0%} do orçamento de memória")
+
+        return {
+            'orcamento_bytes': self.budget_bytes,
+            'residente_bytes': resident,
+            'uso_orcamento': resident / self.budget_bytes,
+            'processo': {
+                **process,
+                # Interpretador, bibliotecas, buffers de requisição e eventuais vazamentos
+                'fora_dos_datasets_bytes': process['rss_bytes'] - resident if process['rss_bytes'] is not None else None
+            },
+            'alertas': alerts,
+            'datasets': datasets
+        }
+
+    def describe(self) -> Dict[str, Any]:
+        """Estado, memória e contadores de cada dataset, residente ou em disco"""
+        with self._lock:
+            names = set(self._resident) | set(self._evictions)
+            if os.path.isdir(self.snapshot_path):
+                names |= {name for name in os.listdir(self.snapshot_path) if self._has_snapshot(name)}
+
+            datasets = {}
+            for name in sorted(names):
+                engine = self._resident.get(name)
+                entry: Dict[str, Any] = {
+                    'estado': 'memoria' if engine is not None else 'disco' if self._has_snapshot(name) else 'removido',
+                    'ultimo_acesso': datetime.fromtimestamp(self._last_access[name], timezone.utc).isoformat()
+                    if name in self._last_access else None,
+                    'descartes': self._evictions.get(name, 0),
+                    'recargas': self._reloads.get(name, 0)
+                }
+                if engine is not None:
+                    entry['versao'] = engine.version
+                    entry['lotes'] = len(engine.lotes_gdf) if engine.lotes_gdf is not None else 0
+                    entry['imoveis'] = len(engine.imoveis_gdf) if engine.imoveis_gdf is not None else 0
+                    entry['memoria_bytes'] = engine.memory_usage()
+                elif self._has_snapshot(name):
+                    directory = self._snapshot_dir(name)
+                    entry['snapshot_bytes'] = sum(
+                        os.path.getsize(os.path.join(directory, file)) for file in os.listdir(directory)
+                    )
+                if name in self._errors:
+                    entry['erro'] = self._errors[name]
+                datasets[name] = entry
+
+            resident = sum(
+                entry['memoria_bytes']['total'] for entry in datasets.values() if 'memoria_bytes' in entry
+            )
+            return {
+                'orcamento_bytes': self.budget_bytes,
+                'residente_bytes': resident,
+                'datasets': datasets
+            }
@@ -0,0 +1,223 @@
+import numpy as np
+import os
+import pandas as pd
+import uuid
+from typing import Any, Dict, Tuple
+
+
+# Cache persistente de endereços já geocodificados (volume /data do docker-compose)
+GEOCODE_CACHE_PATH = os.environ.get('GEOCODE_CACHE_PATH', '/data/geocode_cache.parquet')
+
+# Conjuntos de lotes (assinaturas) mantidos no cache; os mais antigos saem primeiro
+GEOCODE_CACHE_SIGNATURES = int(os.environ.get('GEOCODE_CACHE_SIGNATURES', '8'))
+
+# Versão das regras de casamento; entradas gravadas por outra versão são descartadas
+CACHE_VERSION = 2
+
+# Similaridade mínima (Jaccard de trigramas) para aceitar um logradouro aproximado
+FUZZY_THRESHOLD = 0.5
+
+# Abreviações comuns em endereços, expandidas na normalização
+ABBREVIATIONS = {
+    'R': 'RUA', 'AV': 'AVENIDA', 'AVEN': 'AVENIDA', 'TV': 'TRAVESSA', 'TRAV': 'TRAVESSA',
+    'AL': 'ALAMEDA', 'PC': 'PRACA', 'PCA': 'PRACA', 'EST': 'ESTRADA', 'ROD': 'RODOVIA',
+    'LD': 'LADEIRA', 'ESC': 'ESCADARIA', 'DR': 'DOUTOR', 'PROF': 'PROFESSOR',
+    'STA': 'SANTA', 'STO': 'SANTO', 'SRA': 'SENHORA', 'GAL': 'GENERAL', 'GEN': 'GENERAL',
+    'CEL': 'CORONEL', 'ENG': 'ENGENHEIRO', 'PRES': 'PRESIDENTE', 'VER': 'VEREADOR',
+    'DES': 'DESEMBARGADOR', 'MAL': 'MARECHAL', 'CAP': 'CAPITAO', 'TEN': 'TENENTE',
+}
+
+
+def normalize_text(values: pd.Series) -> pd.Series:
+    """Texto sem acentos, em maiúsculas, sem pontuação e com abreviações expandidas"""
+    codes, uniques = pd.factorize(values.fillna('').astype(str))
+    text = (
+        pd.Series(uniques, dtype=object)
+        .str.normalize('NFKD')
+        .str.encode('ascii', 'ignore')
+        .str.decode('ascii')
+        .str.upper()
+        .str.replace(r'[^A-Z0-9 ]', ' ', regex=True)
+        .str.split()
+        .map(lambda tokens: ' '.join(ABBREVIATIONS.get(token, token) for token in tokens))
+    )
+    return pd.Series(text.to_numpy()[codes] if len(codes) else [], index=values.index, dtype=object)
+
+
+def normalize_number(values: pd.Series) -> pd.Series:
+    """Número predial como texto sem zeros à esquerda ('' quando ausente)"""
+    digits = values.fillna('').astype(str).str.extract(r'(\d+)', expand=False)
+    return digits.fillna('').str.lstrip('0')
+
+
+def split_address(values: pd.Series) -> Tuple[pd.Series, pd.Series]:
+    """Separa logradouro e número de endereços como 'Rua das Flores, 105 - apto 201'"""
+    raw = values.fillna('').astype(str)
+
+    # Número após a primeira vírgula; sem vírgula, o último número do texto
+    after_comma = raw.str.extract(r',\s*(?:n[º°o]?\.?\s*)?(\d+)', expand=False)
+    last_number = raw.str.extract(r'(\d+)\D*$', expand=False)
+    number = after_comma.fillna(last_number).fillna('')
+
+    has_comma = raw.str.contains(',', regex=False)
+    street = raw.str.split(',', n=1).str[0].where(
+        has_comma,
+        raw.str.replace(r'\s*(\d+)\D*$', '', regex=True)
+    )
+    return normalize_text(street), number.str.lstrip('0')
+
+
+def _trigrams(text: str) -> set:
+    """Trigramas do texto com bordas marcadas por espaços"""
+    padded = f'  {text} '
+    return {padded[k:k + 3] for k in range(len(padded) - 2)}
+
+
+def build_address_index(logradouro: pd.Series, numero: pd.Series, bairro: pd.Series) -> Dict[str, Any]:
+    """Índices hash (logradouro + número + bairro) e de trigramas dos logradouros dos lotes"""
+    frame = pd.DataFrame({
+        'street': normalize_text(logradouro).to_numpy(),
+        'number': normalize_number(numero).to_numpy(),
+        'bairro': normalize_text(bairro).to_numpy(),
+        'position': np.arange(len(logradouro))
+    })
+
+    full = frame.drop_duplicates(['street', 'number', 'bairro'])
+    partial = frame.drop_duplicates(['street', 'number'])
+
+    streets = frame['street'].unique()
+    streets = streets[streets != '']
+    trigram_ids: Dict[str, list] = {}
+    sizes = np.empty(len(streets), dtype=np.int64)
+    for street_id, street in enumerate(streets):
+        grams = _trigrams(street)
+        sizes[street_id] = len(grams)
+        for gram in grams:
+            trigram_ids.setdefault(gram, []).append(street_id)
+
+    # Números por logradouro e bairro, para o lote de número mais próximo
+    numbered = frame[frame['number'] != '']
+    by_street = {
+        key: (group['number'].astype(np.int64).to_numpy(), group['position'].to_numpy())
+        for key, group in numbered.groupby(['street', 'bairro'], sort=False)
+    }
+
+    return {
+        'exact': dict(zip(zip(full['street'], full['number'], full['bairro']), full['position'])),
+        'street_number': dict(zip(zip(partial['street'], partial['number']), partial['position'])),
+        'by_street': by_street,
+        'streets': streets,
+        'street_ids': {street: street_id for street_id, street in enumerate(streets)},
+        'street_sizes': sizes,
+        'trigrams': {gram: np.array(ids, dtype=np.int64) for gram, ids in trigram_ids.items()}
+    }
+
+
+def fuzzy_street(index: Dict[str, Any], street: str) -> Tuple[str, float]:
+    """Logradouro do índice mais parecido (Jaccard de trigramas) e a similaridade"""
+    grams = _trigrams(street)
+    hits = [index['trigrams'][gram] for gram in grams if gram in index['trigrams']]
+    if not hits:
+        return '', 0.0
+    shared = np.bincount(np.concatenate(hits), minlength=len(index['streets']))
+    similarity = shared / (len(grams) + index['street_sizes'] - shared)
+    best = int(similarity.argmax())
+    return index['streets'][best], float(similarity[best])
+
+
+def geocode_address(
+    index: Dict[str, Any],
+    street: str,
+    number: str,
+    bairro: str
+) -> Tuple[int, str]:
+    """
+    Posição do lote correspondente a um endereço normalizado e o tipo de match
+
+    Ordem: exato (logradouro + número + bairro), logradouro + número em outro
+    bairro ('logradouro'), logradouro aproximado por trigramas ('fuzzy') e, por
+    fim, o lote de número mais próximo na mesma rua e bairro ('aproximado').
+    Sem número predial não há como escolher o lote da rua. Retorna
+    (-1, 'nao_encontrado') sem correspondência.
+    """
+    if not street or not number:
+        return -1, 'nao_encontrado'
+
+    candidates = [(street, 'exato')]
+    if street not in index['street_ids']:
+        match, similarity = fuzzy_street(index, street)
+        if similarity >= FUZZY_THRESHOLD:
+            candidates.append((match, 'fuzzy'))
+
+    for candidate, kind in candidates:
+        position = index['exact'].get((candidate, number, bairro))
+        if position is not None:
+            return int(position), kind
+        # O bairro informado não confere: o lote pode estar em outra rua homônima
+        position = index['street_number'].get((candidate, number))
+        if position is not None:
+            return int(position), 'logradouro' if kind == 'exato' else kind
+
+        numbers, positions = index['by_street'].get((candidate, bairro), (None, None))
+        if numbers is not None:
+            return int(positions[np.abs(numbers - int(number)).argmin()]), 'aproximado'
+
+    return -1, 'nao_encontrado'
+
+
+def _read_cache(path: str) -> pd.DataFrame:
+    """Entradas do cache gravadas pela versão atual (vazio se ausente ou ilegível)"""
+    if not path or not os.path.exists(path):
+        return pd.DataFrame(columns=['key', 'lon', 'lat', 'match', 'signature', 'version'])
+    try:
+        frame = pd.read_parquet(path)
+    except (OSError, ValueError):
+        return pd.DataFrame(columns=['key', 'lon', 'lat', 'match', 'signature', 'version'])
+    if 'version' not in frame.columns:
+        return frame.iloc[:0].assign(version=pd.Series(dtype=np.int64))
+    return frame[frame['version'] == CACHE_VERSION]
+
+
+def load_cache(path: str, signature: str) -> Dict[str, Tuple[float, float, str]]:
+    """Cache de endereços para o conjunto de lotes atual (vazio se ausente ou de outros lotes)"""
+    frame = _read_cache(path)
+    frame = frame[frame['signature'] == signature]
+    return dict(zip(frame['key'], zip(frame['lon'], frame['lat'], frame['match'])))
+
+
+def save_cache(path: str, signature: str, cache: Dict[str, Tuple[float, float, str]]) -> bool:
+    """
+    Grava o cache em Parquet; retorna False se o diretório não for gravável
+
+    As entradas de outros conjuntos de lotes (outras assinaturas) são
+    preservadas, até GEOCODE_CACHE_SIGNATURES conjuntos. A gravação vai para
+    um arquivo temporário e substitui o anterior com os.replace, de modo que
+    leitores nunca veem um Parquet pela metade.
+    """
+    if not path:
+        return False
+    lon, lat, match = zip(*cache.values()) if cache else ((), (), ())
+    frame = pd.DataFrame({
+        'key': list(cache.keys()),
+        'lon': np.asarray(lon, dtype=float),
+        'lat': np.asarray(lat, dtype=float),
+        'match': list(match),
+        'signature': signature,
+        'version': CACHE_VERSION
+    })
+
+    others = _read_cache(path)
+    others = others[others['signature'] != signature]
+    # Assinaturas em ordem de gravação: a atual vai para o fim
+    kept = pd.unique(others['signature'])[-(GEOCODE_CACHE_SIGNATURES - 1):] if GEOCODE_CACHE_SIGNATURES > 1 else []
+    frame = pd.concat([others[others['signature'].isin(kept)], frame], ignore_index=True)
+
+    tmp = f'{path}.{uuid.uuid4().hex}.tmp'
+    try:
+        frame.to_parquet(tmp, index=False)
+        os.replace(tmp, path)
+    except OSError:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        return False
+    return True
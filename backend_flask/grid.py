@@ -0,0 +1,66 @@
+import numpy as np
+from typing import Tuple
+
+
+SQRT3 = np.sqrt(3.0)
+
+
+def bin_square(x: np.ndarray, y: np.ndarray, size: float) -> Tuple[np.ndarray, np.ndarray]:
+    """Índices (i, j) da célula quadrada de lado `size` que contém cada ponto"""
+    return (
+        np.floor(np.asarray(x) / size).astype(np.int64),
+        np.floor(np.asarray(y) / size).astype(np.int64)
+    )
+
+
+def bin_hex(x: np.ndarray, y: np.ndarray, size: float) -> Tuple[np.ndarray, np.ndarray]:
+    """Coordenadas axiais (q, r) do hexágono (pointy-top, lado `size`) que contém cada ponto"""
+    x = np.asarray(x) / size
+    y = np.asarray(y) / size
+
+    # Coordenadas fracionárias em sistema cúbico
+    fq = SQRT3 / 3 * x - y / 3
+    fr = 2 / 3 * y
+    fs = -fq - fr
+
+    # Arredondamento cúbico: corrige o eixo com maior erro
+    q, r, s = np.round(fq), np.round(fr), np.round(fs)
+    dq, dr, ds = np.abs(q - fq), np.abs(r - fr), np.abs(s - fs)
+
+    fix_q = (dq > dr) & (dq > ds)
+    fix_r = ~fix_q & (dr > ds)
+    q = np.where(fix_q, -r - s, q)
+    r = np.where(fix_r, -q - s, r)
+
+    return q.astype(np.int64), r.astype(np.int64)
+
+
+def square_centers(i: np.ndarray, j: np.ndarray, size: float) -> Tuple[np.ndarray, np.ndarray]:
+    """Centro (em metros) das células quadradas"""
+    return (np.asarray(i) + 0.5) * size, (np.asarray(j) + 0.5) * size
+
+
+def hex_centers(q: np.ndarray, r: np.ndarray, size: float) -> Tuple[np.ndarray, np.ndarray]:
+    """Centro (em metros) dos hexágonos"""
+    q = np.asarray(q)
+    r = np.asarray(r)
+    return size * SQRT3 * (q + r / 2), size * 1.5 * r
+
+
+def square_polygons(i: np.ndarray, j: np.ndarray, size: float) -> np.ndarray:
+    """Vértices (n, 5, 2) dos quadrados em metros, anel fechado"""
+    x0 = np.asarray(i, dtype=float) * size
+    y0 = np.asarray(j, dtype=float) * size
+    dx = np.array([0, 1, 1, 0, 0]) * size
+    dy = np.array([0, 0, 1, 1, 0]) * size
+    return np.stack([x0[:, None] + dx, y0[:, None] + dy], axis=-1)
+
+
+def hex_polygons(q: np.ndarray, r: np.ndarray, size: float) -> np.ndarray:
+    """Vértices (n, 7, 2) dos hexágonos em metros, anel fechado"""
+    cx, cy = hex_centers(q, r, size)
+    angles = np.radians(30 + 60 * np.arange(7))
+    return np.stack([
+        cx[:, None] + size * np.cos(angles),
+        cy[:, None] + size * np.sin(angles)
+    ], axis=-1)
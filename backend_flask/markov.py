@@ -0,0 +1,82 @@
+import numpy as np
+from scipy import sparse
+from typing import Any, Dict, List, Optional
+
+
+def quantile_breaks(values: np.ndarray, n_classes: int) -> np.ndarray:
+    """Limites internos de classes por quantis (n_classes - 1 valores)"""
+    return np.quantile(values, np.linspace(0, 1, n_classes + 1)[1:-1])
+
+
+def classify(values: np.ndarray, breaks: np.ndarray) -> np.ndarray:
+    """Classe (0..len(breaks)) de cada valor"""
+    return np.searchsorted(breaks, values, side='right')
+
+
+def steady_state(P: np.ndarray) -> np.ndarray:
+    """Distribuição estacionária da cadeia (autovetor à esquerda de autovalor 1)"""
+    P = P.copy()
+
+    # Estados nunca observados como origem tornam-se absorventes
+    empty = P.sum(axis=1) == 0
+    P[empty, empty] = 1.0
+
+    eigenvalues, eigenvectors = np.linalg.eig(P.T)
+    vector = np.real(eigenvectors[:, np.argmin(np.abs(eigenvalues - 1))])
+    vector = np.abs(vector)
+    return vector / vector.sum()
+
+
+def transition_matrix(
+    origin: np.ndarray,
+    destination: np.ndarray,
+    n_classes: int,
+    weights: Optional[np.ndarray] = None
+) -> Dict[str, Any]:
+    """Contagens, probabilidades e estado estacionário de transições entre classes"""
+    counts = np.bincount(
+        origin * n_classes + destination,
+        weights=weights,
+        minlength=n_classes * n_classes
+    ).reshape(n_classes, n_classes)
+
+    row_sums = counts.sum(axis=1, keepdims=True)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        probabilities = np.where(row_sums > 0, counts / row_sums, 0.0)
+
+    return {
+        'n': float(counts.sum()),
+        'counts': counts.tolist(),
+        'probabilities': probabilities.tolist(),
+        'steady_state': steady_state(probabilities).tolist()
+    }
+
+
+def spatial_markov(
+    origin: np.ndarray,
+    destination: np.ndarray,
+    lag_class: np.ndarray,
+    n_classes: int,
+    weights: Optional[np.ndarray] = None
+) -> Dict[str, Any]:
+    """Matriz de transição global e matrizes condicionadas à classe da defasagem espacial"""
+    conditional: List[Dict[str, Any]] = []
+    for lag in range(n_classes):
+        mask = lag_class == lag
+        matrix = transition_matrix(
+            origin[mask], destination[mask], n_classes,
+            weights[mask] if weights is not None else None
+        )
+        matrix['lag_class'] = lag
+        conditional.append(matrix)
+
+    return {
+        'transitions': transition_matrix(origin, destination, n_classes, weights),
+        'conditional': conditional
+    }
+
+
+def neighbor_transitions(W: sparse.csr_matrix, classes: np.ndarray, lag_class: np.ndarray, n_classes: int) -> Dict[str, Any]:
+    """Cadeia espacial: transição da classe de cada unidade para as classes dos vizinhos (pesos de W)"""
+    coo = W.tocoo()
+    return spatial_markov(classes[coo.row], classes[coo.col], lag_class[coo.row], n_classes, weights=coo.data)
@@ -0,0 +1,142 @@
+import numpy as np
+from scipy.optimize import curve_fit
+from scipy.spatial import cKDTree
+from typing import Any, Dict, List, Optional
+
+from interpolation import VARIOGRAM_MODELS
+
+
+# Bytes estimados por par de pontos em memória durante o processamento de um bloco
+BYTES_PER_PAIR = 64
+
+
+def _pair_chunk_size(tree: cKDTree, max_lag: float, memory_budget_mb: float, rng: np.random.Generator) -> int:
+    """Tamanho do bloco de pontos que mantém os pares dentro do orçamento de memória"""
+    sample = tree.data[rng.choice(tree.n, size=min(256, tree.n), replace=False)]
+    neighbors_per_point = max(tree.count_neighbors(cKDTree(sample), max_lag) / len(sample), 1.0)
+    budget_pairs = memory_budget_mb * 1024 * 1024 / BYTES_PER_PAIR
+    return int(max(1, min(tree.n, budget_pairs // neighbors_per_point)))
+
+
+def _direction_index(dx: np.ndarray, dy: np.ndarray, directions: np.ndarray, tolerance: float) -> np.ndarray:
+    """Índice da direção (azimute, graus) de cada par; -1 fora da tolerância"""
+    azimuth = np.degrees(np.arctan2(dx, dy)) % 180
+    diff = np.abs(azimuth[:, None] - directions[None, :])
+    diff = np.minimum(diff, 180 - diff)
+    nearest = diff.argmin(axis=1)
+    return np.where(diff[np.arange(len(diff)), nearest] <= tolerance, nearest, -1)
+
+
+def empirical_variogram(
+    tree: cKDTree,
+    values: np.ndarray,
+    max_lag: float,
+    n_lags: int = 15,
+    directions: Optional[List[float]] = None,
+    tolerance: float = 22.5,
+    sample_fraction: float = 1.0,
+    memory_budget_mb: float = 64,
+    seed: int = 0
+) -> Dict[str, Any]:
+    """
+    Semivariograma empírico por classes de distância até max_lag
+
+    Os pares são obtidos do KD-tree bloco a bloco (consultas por raio até
+    max_lag), com blocos dimensionados para caber em memory_budget_mb, e
+    acumulados em somas por classe. sample_fraction < 1 sorteia pares.
+    """
+    rng = np.random.default_rng(seed)
+    dirs = np.asarray(directions if directions else [], dtype=float) % 180
+    n_dirs = max(len(dirs), 1)
+
+    edges = np.linspace(0, max_lag, n_lags + 1)
+    counts = np.zeros((n_dirs, n_lags))
+    dist_sum = np.zeros((n_dirs, n_lags))
+    sq_sum = np.zeros((n_dirs, n_lags))
+
+    coords = tree.data
+    chunk = _pair_chunk_size(tree, max_lag, memory_budget_mb, rng)
+
+    for start in range(0, tree.n, chunk):
+        stop = min(start + chunk, tree.n)
+        pairs = cKDTree(coords[start:stop]).sparse_distance_matrix(tree, max_lag, output_type='ndarray')
+
+        # Cada par uma única vez (j > i) e sem distância nula
+        i = pairs['i'] + start
+        j = pairs['j']
+        d = pairs['v']
+        keep = (j > i) & (d > 0)
+        if sample_fraction < 1:
+            keep &= rng.random(len(keep)) < sample_fraction
+        i, j, d = i[keep], j[keep], d[keep]
+        if len(d) == 0:
+            continue
+
+        lag = np.minimum(np.searchsorted(edges, d, side='right') - 1, n_lags - 1)
+        if len(dirs):
+            direction = _direction_index(coords[j, 0] - coords[i, 0], coords[j, 1] - coords[i, 1], dirs, tolerance)
+            inside = direction >= 0
+            lag, direction, i, j, d = lag[inside], direction[inside], i[inside], j[inside], d[inside]
+        else:
+            direction = np.zeros(len(d), dtype=np.int64)
+
+        flat = direction * n_lags + lag
+        size = n_dirs * n_lags
+        counts += np.bincount(flat, minlength=size).reshape(n_dirs, n_lags)
+        dist_sum += np.bincount(flat, weights=d, minlength=size).reshape(n_dirs, n_lags)
+        sq_sum += np.bincount(flat, weights=(values[i] - values[j]) ** 2, minlength=size).reshape(n_dirs, n_lags)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        lags = np.where(counts > 0, dist_sum / counts, np.nan)
+        gamma = np.where(counts > 0, sq_sum / (2 * counts), np.nan)
+
+    series = []
+    for k in range(n_dirs):
+        series.append({
+            'direction': float(dirs[k]) if len(dirs) else None,
+            'lags': lags[k],
+            'gamma': gamma[k],
+            'counts': counts[k].astype(np.int64)
+        })
+
+    return {'max_lag': max_lag, 'n_lags': n_lags, 'tolerance': tolerance if len(dirs) else None, 'series': series}
+
+
+def fit_variogram(lags: np.ndarray, gamma: np.ndarray, counts: np.ndarray, model: str) -> Optional[Dict[str, float]]:
+    """Ajusta um modelo de semivariograma por mínimos quadrados ponderados pelo nº de pares"""
+    valid = np.isfinite(lags) & np.isfinite(gamma) & (counts > 0)
+    if valid.sum() < 3:
+        return None
+
+    h, g, n = lags[valid], gamma[valid], counts[valid]
+    func = VARIOGRAM_MODELS[model]
+    sill0 = float(np.max(g))
+
+    try:
+        params, _ = curve_fit(
+            lambda x, sill, range_, nugget: func(x, sill, range_, nugget),
+            h, g,
+            p0=[sill0, float(np.max(h)) / 2, 0.0],
+            sigma=1 / np.sqrt(n),
+            bounds=([0, 1e-6, 0], [np.inf, np.inf, np.inf]),
+            maxfev=5000
+        )
+    except (RuntimeError, ValueError):
+        return None
+
+    sill, range_, nugget = (float(p) for p in params)
+    residual = func(h, sill, range_, nugget) - g
+    return {
+        'model': model,
+        'sill': max(sill, nugget),
+        'range_meters': range_,
+        'nugget': nugget,
+        'rmse': float(np.sqrt(np.average(residual ** 2, weights=n)))
+    }
+
+
+def fit_best_variogram(lags: np.ndarray, gamma: np.ndarray, counts: np.ndarray) -> Optional[Dict[str, float]]:
+    """Ajusta todos os modelos disponíveis e retorna o de menor erro"""
+    fits = [fit_variogram(lags, gamma, counts, model) for model in VARIOGRAM_MODELS]
+    fits = [fit for fit in fits if fit is not None]
+    return min(fits, key=lambda fit: fit['rmse']) if fits else None
@@ -0,0 +1,93 @@
+"""
+Compara dois resultados de run.py e aponta regressões
+
+Casos são pareados por (escala, caso, parâmetros); a razão é entre as medianas
+(ou os bytes, no caso de memória). Sai com código 1 se algum caso piorou além
+do limite.
+
+Uso:
+    python benchmarks/compare.py base.json atual.json --threshold 0.2
+"""
+
+import argparse
+import json
+import sys
+from typing import Any, Dict, List, Tuple
+
+
+def _key(entry: Dict[str, Any]) -> Tuple:
+    """Identificação do caso independente da ordem dos parâmetros"""
+    return entry['scale'], entry['case'], json.dumps(entry['params'], sort_keys=True, ensure_ascii=False)
+
+
+def _metrics(entry: Dict[str, Any]) -> Dict[str, float]:
+    """Valores comparáveis do caso: mediana em segundos ou bytes de memória"""
+    if 'seconds' in entry:
+        return {'median_s': entry['seconds']['median']}
+    return {f'{name}_bytes': value for name, value in entry.get('bytes', {}).items()}
+
+
+def compare(
+    baseline: Dict[str, Any],
+    current: Dict[str, Any],
+    threshold: float,
+    min_seconds: float
+) -> List[Dict[str, Any]]:
+    """Linhas da comparação com a razão atual/base e a marcação de regressão"""
+    base = {_key(entry): entry for entry in baseline['results']}
+    rows = []
+    for entry in current['results']:
+        previous = base.get(_key(entry))
+        if previous is None:
+            continue
+        before, after = _metrics(previous), _metrics(entry)
+        for metric, value in after.items():
+            if not before.get(metric):
+                continue
+            ratio = value / before[metric]
+            # Tempos muito curtos variam demais para indicar regressão
+            noisy = metric == 'median_s' and before[metric] < min_seconds
+            rows.append({
+                'scale': entry['scale'],
+                'case': entry['case'],
+                'params': entry['params'],
+                'metric': metric,
+                'base': before[metric],
+                'atual': value,
+                'razao': ratio,
+                'regressao': ratio > 1 + threshold and not noisy,
+            })
+    return rows
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description='Compara dois resultados do benchmark')
+    parser.add_argument('baseline', help='JSON de referência')
+    parser.add_argument('current', help='JSON da execução atual')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Piora relativa tolerada (0.2 = 20%%)')
+    parser.add_argument('--min-seconds', type=float, default=0.001, help='Medianas abaixo disso não contam como regressão')
+    args = parser.parse_args(argv)
+
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)
+    with open(args.current, encoding='utf-8') as f:
+        current = json.load(f)
+
+    if baseline['meta'].get('backend') != current['meta'].get('backend'):
+        print('aviso: backends diferentes nas duas execuções', file=sys.stderr)
+
+    rows = compare(baseline, current, args.threshold, args.min_seconds)
+    for row in rows:
+        params = ' '.join(f'{key}={value}' for key, value in row['params'].items())
+        print(
+            f"{'REGRESSÃO' if row['regressao'] else 'ok':<10} {row['scale']:>9} {row['case']:<26} "
+            f"{params:<45} {row['metric']:<16} {row['base']:>12.6g} -> {row['atual']:>12.6g} ({row['razao']:.2f}x)"
+        )
+
+    regressions = sum(row['regressao'] for row in rows)
+    print(f'{len(rows)} comparações, {regressions} regressões (limite {args.threshold:.0%})')
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,414 @@
+"""
+Teste de carga HTTP dos backends FastAPI e Flask
+
+Sobe o app escolhido localmente (uvicorn ou gunicorn, com N workers), carrega
+o dataset sintético pelos endpoints de upload e reproduz uma mistura de
+requisições em estágios de concorrência crescente. Para cada estágio e tipo de
+requisição registra vazão, erros, p50/p95/p99 e histograma de latência, e
+aponta a maior vazão sustentável dentro do SLO.
+
+Uso:
+    python benchmarks/loadtest.py --backend fastapi flask --workers 2 --stages 4:30 16:30 32:30 --output carga.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Tuple
+
+import httpx
+import numpy as np
+import pandas as pd
+import shapely
+
+from run import BACKENDS, _git_commit, _versions
+from synthetic import BAIRROS, write_dataset
+
+
+# Tipos de requisição aceitos na mistura (métodos de Workload)
+REQUESTS = ('analyze', 'lotes', 'imoveis', 'stats', 'bounds', 'upload')
+
+# Mistura padrão de requisições (pesos relativos)
+DEFAULT_MIX = 'analyze=5,lotes=3,imoveis=1,stats=1,bounds=1,upload=0.05'
+
+# Estágios padrão (concorrência:segundos)
+DEFAULT_STAGES = ('1:20', '4:30', '16:30', '32:30')
+
+# Raios sorteados nas requisições de /analyze (metros)
+DEFAULT_RADII = (100, 250, 500)
+
+# Valores de limit sorteados nos endpoints GeoJSON
+GEOJSON_LIMITS = (100, 500, 1000)
+
+# Limites dos buckets do histograma de latência (ms)
+HISTOGRAM_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+# Dataset que recebe os uploads durante a carga (o dataset medido fica estável)
+UPLOAD_DATASET = 'carga-upload'
+
+# Erros tolerados em um estágio para considerá-lo sustentável
+MAX_ERROR_RATE = 0.01
+
+
+def _log(message: str):
+    """Progresso em stderr"""
+    print(message, file=sys.stderr, flush=True)
+
+
+def parse_mix(text: str) -> Dict[str, float]:
+    """'analyze=5,lotes=3' -> {'analyze': 5.0, 'lotes': 3.0}"""
+    mix = {}
+    for item in text.split(','):
+        name, _, weight = item.partition('=')
+        name = name.strip()
+        if name not in REQUESTS:
+            raise ValueError(f"Requisição desconhecida na mistura: {name} (use {', '.join(REQUESTS)})")
+        mix[name] = float(weight or 1)
+    return {name: weight for name, weight in mix.items() if weight > 0}
+
+
+def parse_stage(text: str) -> Tuple[int, float]:
+    """'16:30' -> (16 usuários simultâneos, 30 segundos)"""
+    concurrency, _, seconds = text.partition(':')
+    return int(concurrency), float(seconds)
+
+
+class Workload:
+    """Gera as requisições da mistura a partir do dataset sintético"""
+
+    def __init__(self, paths: Dict[str, str], radii: List[float], seed: int):
+        self.rng = random.Random(seed)
+        self.radii = list(radii)
+        self.bairros = list(BAIRROS)
+
+        # Centros de /analyze: centroides de uma amostra fixa de lotes
+        geometry = pd.read_parquet(paths['lotes'], columns=['geometry'])['geometry'].to_numpy()
+        picks = np.random.default_rng(seed).choice(len(geometry), size=min(200, len(geometry)), replace=False)
+        centroids = shapely.centroid(shapely.from_geojson(geometry[picks]))
+        self.centers = list(zip(shapely.get_y(centroids).tolist(), shapely.get_x(centroids).tolist()))
+
+        with open(paths['imoveis'], 'rb') as f:
+            self.upload_body = f.read()
+
+    def analyze(self) -> Dict[str, Any]:
+        """POST /analyze em um centro e raio sorteados"""
+        lat, lon = self.rng.choice(self.centers)
+        return {
+            'method': 'POST', 'url': '/analyze',
+            'json': {'latitude': lat, 'longitude': lon, 'radius_meters': self.rng.choice(self.radii)}
+        }
+
+    def _geojson(self, path: str) -> Dict[str, Any]:
+        """GET de um endpoint GeoJSON com limit sorteado e, na metade das vezes, um bairro"""
+        params = {'limit': self.rng.choice(GEOJSON_LIMITS)}
+        if self.rng.random() < 0.5:
+            params['bairro'] = self.rng.choice(self.bairros)
+        return {'method': 'GET', 'url': path, 'params': params}
+
+    def lotes(self) -> Dict[str, Any]:
+        """GET /lotes/geojson"""
+        return self._geojson('/lotes/geojson')
+
+    def imoveis(self) -> Dict[str, Any]:
+        """GET /imoveis/geojson"""
+        return self._geojson('/imoveis/geojson')
+
+    def stats(self) -> Dict[str, Any]:
+        """GET /stats"""
+        return {'method': 'GET', 'url': '/stats'}
+
+    def bounds(self) -> Dict[str, Any]:
+        """GET /bounds"""
+        return {'method': 'GET', 'url': '/bounds'}
+
+    def upload(self) -> Dict[str, Any]:
+        """POST /upload/imoveis no dataset de uploads (mede o aceite; a carga segue no pool de jobs)"""
+        return {
+            'method': 'POST', 'url': '/upload/imoveis', 'params': {'dataset': UPLOAD_DATASET},
+            'files': {'file': ('imoveis.parquet', self.upload_body, 'application/octet-stream')}
+        }
+
+
+def _server_command(backend: str, port: int, workers: int) -> List[str]:
+    """Comando do servidor, o mesmo dos Dockerfiles com host, porta e workers ajustados"""
+    if backend == 'fastapi':
+        return [
+            sys.executable, '-m', 'uvicorn', 'main:app', '--host', '127.0.0.1', '--port', str(port),
+            '--workers', str(workers), '--log-level', 'warning'
+        ]
+    return [
+        sys.executable, '-m', 'gunicorn', '--bind', f'127.0.0.1:{port}', '--workers', str(workers),
+        '--timeout', '120', '--log-level', 'warning', 'app:app'
+    ]
+
+
+def start_server(backend: str, port: int, workers: int, workdir: str, timeout: float = 120) -> subprocess.Popen:
+    """Sobe o servidor com dados em `workdir` e espera /health responder"""
+    env = dict(
+        os.environ,
+        GEOCODE_CACHE_PATH='',
+        DATASET_SNAPSHOT_PATH=os.path.join(workdir, 'datasets'),
+        PARTITIONED_DATA_PATH=os.path.join(workdir, 'partitioned'),
+        PRELOAD_PATH=os.path.join(workdir, 'preload'),
+        JOBS_PATH=os.path.join(workdir, 'jobs')
+    )
+    log = open(os.path.join(workdir, f'{backend}.log'), 'wb')
+    process = subprocess.Popen(
+        _server_command(backend, port, workers), cwd=BACKENDS[backend], env=env, stdout=log, stderr=subprocess.STDOUT
+    )
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            with open(log.name, encoding='utf-8', errors='replace') as f:
+                raise RuntimeError(f'{backend} encerrou na inicialização:\n{f.read()[-2000:]}')
+        try:
+            if httpx.get(f'http://127.0.0.1:{port}/health', timeout=1).status_code == 200:
+                return process
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.25)
+
+    stop_server(process)
+    raise RuntimeError(f'{backend} não respondeu /health em {timeout:.0f}s')
+
+
+def stop_server(process: subprocess.Popen):
+    """Encerra o servidor (SIGTERM e, se preciso, SIGKILL)"""
+    process.terminate()
+    try:
+        process.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def _wait_job(client: httpx.Client, job_id: str, timeout: float = 600):
+    """Aguarda o job de upload terminar (o estado é compartilhado entre workers em JOBS_PATH)"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = client.get(f'/jobs/{job_id}').json()
+        if job['estado'] == 'concluido':
+            return
+        if job['estado'] == 'erro':
+            raise RuntimeError(f"Upload falhou: {job['erro']}")
+        time.sleep(0.1)
+    raise RuntimeError(f'Upload {job_id} não terminou em {timeout:.0f}s')
+
+
+def seed(base_url: str, paths: Dict[str, str], workers: int) -> int:
+    """
+    Carrega lotes e imóveis pelos endpoints de upload em todos os workers
+
+    Cada worker mantém seus datasets na própria memória e o balanceamento é por
+    conexão, então os uploads (em conexões novas) se repetem até que todas as
+    sondagens de /stats encontrem as duas camadas. Retorna o número de rodadas.
+    """
+    with httpx.Client(base_url=base_url, timeout=600, headers={'Connection': 'close'}) as client:
+        for rounds in range(1, 10 * workers + 1):
+            for layer in ('lotes', 'imoveis'):
+                with open(paths[layer], 'rb') as f:
+                    response = client.post(
+                        f'/upload/{layer}', files={'file': (f'{layer}.parquet', f, 'application/octet-stream')}
+                    )
+                response.raise_for_status()
+                _wait_job(client, response.json()['id'])
+
+            probes = [client.get('/stats').json() for _ in range(4 * workers)]
+            if all(probe['lotes']['total'] and probe['imoveis']['total'] for probe in probes):
+                return rounds
+    raise RuntimeError('Não foi possível carregar os dados em todos os workers')
+
+
+async def _user(
+    client: httpx.AsyncClient,
+    workload: Workload,
+    mix: Dict[str, float],
+    deadline: float,
+    samples: List[Tuple[str, int, float]]
+):
+    """Usuário em malha fechada: uma requisição por vez até o fim do estágio"""
+    names, weights = list(mix), list(mix.values())
+    while time.perf_counter() < deadline:
+        name = workload.rng.choices(names, weights)[0]
+        request = getattr(workload, name)()
+        begin = time.perf_counter()
+        try:
+            status = (await client.request(**request)).status_code
+        except httpx.HTTPError:
+            status = 0
+        samples.append((name, status, time.perf_counter() - begin))
+
+
+async def run_stage(
+    base_url: str,
+    workload: Workload,
+    mix: Dict[str, float],
+    concurrency: int,
+    seconds: float,
+    timeout: float
+) -> Tuple[List[Tuple[str, int, float]], float]:
+    """Amostras (requisição, status, segundos) de um estágio e sua duração real"""
+    samples: List[Tuple[str, int, float]] = []
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        begin = time.perf_counter()
+        deadline = begin + seconds
+        await asyncio.gather(*(_user(client, workload, mix, deadline, samples) for _ in range(concurrency)))
+        return samples, time.perf_counter() - begin
+
+
+def _histogram(latencies_ms: np.ndarray) -> Dict[str, int]:
+    """Contagem por bucket de latência (limite superior inclusivo)"""
+    edges = np.asarray(HISTOGRAM_BUCKETS_MS, dtype=float)
+    counts = np.bincount(np.searchsorted(edges, latencies_ms, side='left'), minlength=len(edges) + 1)
+    labels = [f'<={edge:g}' for edge in edges] + [f'>{edges[-1]:g}']
+    return dict(zip(labels, counts.tolist()))
+
+
+def _summarize(samples: List[Tuple[str, int, float]], elapsed: float) -> Dict[str, Any]:
+    """Vazão, erros, percentis e histograma de um conjunto de amostras"""
+    if not samples:
+        return {'requisicoes': 0, 'erros': 0, 'rps': 0.0}
+    status = np.array([sample[1] for sample in samples])
+    latencies_ms = np.array([sample[2] for sample in samples]) * 1000
+    errors = int(((status == 0) | (status >= 400)).sum())
+    return {
+        'requisicoes': len(samples),
+        'erros': errors,
+        'taxa_erros': errors / len(samples),
+        'rps': len(samples) / elapsed,
+        'latencia_ms': {
+            'p50': float(np.percentile(latencies_ms, 50)),
+            'p95': float(np.percentile(latencies_ms, 95)),
+            'p99': float(np.percentile(latencies_ms, 99)),
+            'media': float(latencies_ms.mean()),
+            'max': float(latencies_ms.max()),
+        },
+        'status': {str(code): int(count) for code, count in zip(*np.unique(status, return_counts=True))},
+        'histograma_ms': _histogram(latencies_ms),
+    }
+
+
+def run_backend(args: argparse.Namespace, backend: str, paths: Dict[str, str], mix: Dict[str, float]) -> Dict[str, Any]:
+    """Sobe (ou usa) o servidor, carrega os dados e executa todos os estágios"""
+    process = None
+    base_url = args.url
+    if base_url is None:
+        base_url = f'http://127.0.0.1:{args.port}'
+        process = start_server(backend, args.port, args.workers, tempfile.mkdtemp(prefix=f'geo-carga-{backend}-'))
+
+    try:
+        begin = time.perf_counter()
+        rounds = seed(base_url, paths, args.workers) if not args.no_seed else 0
+        _log(f'[{backend}] dados carregados em {time.perf_counter() - begin:.1f}s ({rounds} rodada(s))')
+
+        workload = Workload(paths, args.radii, args.seed)
+        stages = []
+        for concurrency, seconds in args.stages:
+            samples, elapsed = asyncio.run(
+                run_stage(base_url, workload, mix, concurrency, seconds, args.timeout)
+            )
+            stage = {'concorrencia': concurrency, 'segundos': elapsed, **_summarize(samples, elapsed)}
+            stage['por_requisicao'] = {
+                name: _summarize([sample for sample in samples if sample[0] == name], elapsed) for name in mix
+            }
+            stages.append(stage)
+            latency = stage.get('latencia_ms', {})
+            _log(
+                f"[{backend}] {concurrency:>4} usuários: {stage['rps']:8.1f} req/s, "
+                f"p50 {latency.get('p50', 0):8.1f} ms, p95 {latency.get('p95', 0):8.1f} ms, "
+                f"p99 {latency.get('p99', 0):8.1f} ms, erros {stage['erros']}"
+            )
+    finally:
+        if process is not None:
+            stop_server(process)
+
+    # Maior vazão entre os estágios dentro do SLO de p95 e da taxa de erros
+    sustainable = [
+        stage for stage in stages
+        if stage['requisicoes'] and stage['taxa_erros'] <= MAX_ERROR_RATE and stage['latencia_ms']['p95'] <= args.slo_ms
+    ]
+    best = max(sustainable, key=lambda stage: stage['rps'], default=None)
+    return {
+        'workers': args.workers,
+        'rodadas_carga': rounds,
+        'estagios': stages,
+        'rps_sustentavel': {
+            'rps': best['rps'], 'concorrencia': best['concorrencia'], 'p95_ms': best['latencia_ms']['p95']
+        } if best else None,
+    }
+
+
+def parse_args(argv: List[str] = None) -> argparse.Namespace:
+    """Opções da linha de comando"""
+    parser = argparse.ArgumentParser(description='Teste de carga HTTP dos backends')
+    parser.add_argument('--backend', choices=sorted(BACKENDS), nargs='+', default=['fastapi'])
+    parser.add_argument('--workers', type=int, default=2, help='Workers do uvicorn/gunicorn')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--url', help='Servidor já em execução (não sobe nenhum backend)')
+    parser.add_argument('--no-seed', action='store_true', help='Não carrega os dados sintéticos')
+    parser.add_argument('--scale', type=int, default=10_000, help='Quantidade de lotes do dataset')
+    parser.add_argument('--imoveis-ratio', type=float, default=0.1, help='Imóveis por lote')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix(DEFAULT_MIX), help=f'Pesos (padrão: {DEFAULT_MIX})')
+    parser.add_argument('--stages', type=parse_stage, nargs='+', default=[parse_stage(s) for s in DEFAULT_STAGES],
+                        help='Estágios concorrência:segundos')
+    parser.add_argument('--radii', type=float, nargs='+', default=list(DEFAULT_RADII), help='Raios de /analyze (m)')
+    parser.add_argument('--slo-ms', type=float, default=1000.0, help='p95 máximo de um estágio sustentável')
+    parser.add_argument('--timeout', type=float, default=120.0, help='Timeout por requisição (s)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'geo-benchmarks'))
+    parser.add_argument('--output', help='Arquivo JSON de saída (padrão: stdout)')
+    args = parser.parse_args(argv)
+    if args.url and len(args.backend) > 1:
+        parser.error('--url aceita um único --backend')
+    return args
+
+
+def main(argv: List[str] = None):
+    args = parse_args(argv)
+    paths = write_dataset(args.data_dir, args.scale, max(1, int(args.scale * args.imoveis_ratio)), args.seed)
+
+    backends = {backend: run_backend(args, backend, paths, args.mix) for backend in args.backend}
+
+    if len(backends) > 1:
+        for backend, result in backends.items():
+            best = result['rps_sustentavel']
+            _log(
+                f'{backend}: ' + (f"{best['rps']:.1f} req/s sustentáveis com {best['concorrencia']} usuários"
+                                  if best else f'nenhum estágio dentro do SLO de {args.slo_ms:g} ms')
+            )
+
+    report = {
+        'meta': {
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'git_commit': _git_commit(),
+            'cpu_count': os.cpu_count(),
+            'packages': _versions(),
+            'params': {
+                'workers': args.workers, 'scale': args.scale, 'imoveis_ratio': args.imoveis_ratio,
+                'mix': args.mix, 'stages': args.stages, 'radii': args.radii, 'slo_ms': args.slo_ms,
+                'seed': args.seed, 'url': args.url
+            },
+        },
+        'backends': backends,
+    }
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        _log(f'resultado gravado em {args.output}')
+    else:
+        json.dump(report, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,311 @@
+"""
+Benchmark reprodutível dos caminhos críticos do backend
+
+Para cada escala gera (ou reaproveita) lotes e imóveis sintéticos de Vitória e
+mede, em um processo próprio, a carga dos Parquet, analyze_radius em vários
+raios, a conversão para GeoJSON, as estatísticas, get_bounds e os endpoints
+GeoJSON chamados em processo (sem rede). O resultado é um JSON comparável
+entre execuções com compare.py.
+
+Uso:
+    python benchmarks/run.py --backend fastapi --sizes 10000 100000 --output resultados.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from importlib import metadata
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+import shapely
+
+from synthetic import write_dataset
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Diretório de cada backend (importados como módulos planos, como no Docker)
+BACKENDS = {
+    'fastapi': os.path.join(ROOT, 'backend'),
+    'flask': os.path.join(ROOT, 'backend_flask'),
+}
+
+# Pacotes cujas versões entram nos metadados do resultado
+PACKAGES = ('numpy', 'pandas', 'geopandas', 'shapely', 'pyarrow', 'scipy', 'fastapi', 'flask')
+
+# Escalas padrão (quantidade de lotes)
+DEFAULT_SIZES = (10_000, 100_000, 1_000_000)
+
+# Raios padrão de analyze_radius (metros)
+DEFAULT_RADII = (250, 500, 1000)
+
+
+def _log(message: str):
+    """Progresso em stderr (stdout fica livre para o resultado)"""
+    print(message, file=sys.stderr, flush=True)
+
+
+def _summary(times: List[float]) -> Dict[str, float]:
+    """Mínimo, mediana, p95, média e máximo em segundos"""
+    values = np.asarray(times, dtype=float)
+    return {
+        'min': float(values.min()),
+        'median': float(np.median(values)),
+        'p95': float(np.percentile(values, 95)),
+        'mean': float(values.mean()),
+        'max': float(values.max()),
+    }
+
+
+def measure(fn: Callable[[int], Any], repeat: int, budget_seconds: float, warmup: int = 0):
+    """
+    Executa fn(i) até `repeat` vezes, parando antes se o tempo total passar do orçamento
+
+    Retorna os tempos de cada execução e o resultado da última.
+    """
+    for i in range(warmup):
+        fn(i)
+    times = []
+    result = None
+    start = time.perf_counter()
+    for i in range(repeat):
+        begin = time.perf_counter()
+        result = fn(i)
+        times.append(time.perf_counter() - begin)
+        if time.perf_counter() - start > budget_seconds:
+            break
+    return times, result
+
+
+def _import_backend(backend: str, workdir: str):
+    """Importa o app do backend com caches e snapshots apontando para `workdir`"""
+    os.environ['GEOCODE_CACHE_PATH'] = ''
+    os.environ['DATASET_SNAPSHOT_PATH'] = os.path.join(workdir, 'datasets')
+    os.environ['PARTITIONED_DATA_PATH'] = os.path.join(workdir, 'partitioned')
+    # Sem aquecimento em segundo plano: as cargas são medidas pelos próprios casos
+    os.environ['WARM_START'] = '0'
+    sys.path.insert(0, BACKENDS[backend])
+
+    if backend == 'fastapi':
+        from fastapi.testclient import TestClient
+        import main
+        return main, TestClient(main.app)
+
+    import app
+    return app, app.app.test_client()
+
+
+def run_scale(args: argparse.Namespace, scale: int) -> List[Dict[str, Any]]:
+    """Todas as medições de uma escala (executado em processo próprio)"""
+    n_imoveis = max(1, int(scale * args.imoveis_ratio))
+    begin = time.perf_counter()
+    paths = write_dataset(args.data_dir, scale, n_imoveis, args.seed)
+    _log(f'[{scale}] dados prontos em {time.perf_counter() - begin:.1f}s')
+
+    workdir = tempfile.mkdtemp(prefix='geo-bench-')
+    module, client = _import_backend(args.backend, workdir)
+    engine = module.datasets.get()
+    rng = np.random.default_rng(args.seed)
+    results = []
+
+    def record(case: str, times: List[float], params: Dict[str, Any] = None, **extra):
+        results.append({
+            'scale': scale,
+            'imoveis': n_imoveis,
+            'case': case,
+            'params': params or {},
+            'runs': len(times),
+            'seconds': _summary(times),
+            'extra': extra,
+        })
+        _log(f'[{scale}] {case} {params or ""}: mediana {results[-1]["seconds"]["median"] * 1000:.1f} ms')
+
+    # Carga: cada repetição substitui a camada inteira (imóveis sobre os lotes carregados)
+    times, rows = measure(lambda i: engine.load_parquet_lotes(paths['lotes']), args.repeat, args.budget)
+    record('load_parquet_lotes', times, linhas=rows)
+    times, rows = measure(lambda i: engine.load_parquet_imoveis(paths['imoveis']), args.repeat, args.budget)
+    record('load_parquet_imoveis', times, linhas=rows)
+
+    # Centros sorteados entre os centroides dos lotes (os mesmos para todos os raios)
+    picks = rng.choice(len(engine.lotes_gdf), size=args.points, replace=False)
+    centroids = shapely.centroid(engine.lotes_gdf.geometry.values[picks])
+    centers = list(zip(shapely.get_y(centroids).tolist(), shapely.get_x(centroids).tolist()))
+
+    for radius in args.radii:
+        found = []
+
+        def analyze(i: int, radius=radius):
+            lat, lon = centers[i % len(centers)]
+            result = engine.analyze_radius(lat, lon, radius)
+            found.append((result['lotes_encontrados'], result['imoveis_encontrados']))
+            return result
+
+        times, _ = measure(analyze, args.repeat * len(centers), args.budget)
+        record(
+            'analyze_radius', times, {'radius_meters': radius},
+            lotes_encontrados_medio=float(np.mean([f[0] for f in found])),
+            imoveis_encontrados_medio=float(np.mean([f[1] for f in found]))
+        )
+
+    # Conversão e estatísticas sobre uma amostra fixa (custo por feature)
+    sample = {
+        'lotes': engine.lotes_gdf.head(args.sample),
+        'imoveis': engine.imoveis_gdf.head(args.sample),
+    }
+    features = {}
+    for layer, gdf in sample.items():
+        times, features[layer] = measure(lambda i, gdf=gdf: engine._geodataframe_to_geojson(gdf), args.repeat, args.budget)
+        record(
+            '_geodataframe_to_geojson', times, {'layer': layer, 'rows': len(gdf)},
+            segundos_por_feature=float(np.median(times)) / max(len(gdf), 1)
+        )
+
+    times, _ = measure(
+        lambda i: engine._calculate_statistics(features['lotes'], features['imoveis']), args.repeat, args.budget
+    )
+    record('_calculate_statistics', times, {'lotes': len(features['lotes']), 'imoveis': len(features['imoveis'])})
+
+    times, _ = measure(lambda i: engine.get_bounds(), args.repeat, args.budget)
+    record('get_bounds', times)
+
+    # Endpoints em processo: corpo montado (cache limpo), corpo em cache e 304
+    endpoints = [
+        f'/lotes/geojson?limit={args.limit}',
+        f'/imoveis/geojson?limit={args.limit}',
+        '/bounds',
+        '/stats',
+    ]
+    for path in endpoints:
+        def cold(i: int, path=path):
+            engine._cache.clear()
+            return client.get(path)
+
+        times, response = measure(cold, args.repeat, args.budget, warmup=1)
+        if response.status_code != 200:
+            raise RuntimeError(f'{path}: HTTP {response.status_code}')
+        record('endpoint', times, {'path': path, 'cache': 'frio'}, bytes=int(response.headers['Content-Length']))
+
+        times, _ = measure(lambda i, path=path: client.get(path), args.repeat, args.budget, warmup=1)
+        record('endpoint', times, {'path': path, 'cache': 'quente'})
+
+        etag = {'If-None-Match': response.headers['ETag']}
+        times, response = measure(lambda i, path=path: client.get(path, headers=etag), args.repeat, args.budget)
+        if response.status_code != 304:
+            raise RuntimeError(f'{path}: esperado 304, recebido HTTP {response.status_code}')
+        record('endpoint', times, {'path': path, 'cache': '304'})
+
+    memory = engine.memory_usage()
+    results.append({
+        'scale': scale,
+        'imoveis': n_imoveis,
+        'case': 'memoria',
+        'params': {},
+        'runs': 1,
+        'bytes': {
+            'engine': memory['total'],
+            'pico_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        },
+    })
+    return results
+
+
+def _git_commit() -> str:
+    """Commit do repositório (vazio fora de um checkout git)"""
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def _versions() -> Dict[str, str]:
+    """Versões instaladas dos pacotes relevantes"""
+    versions = {}
+    for package in PACKAGES:
+        try:
+            versions[package] = metadata.version(package)
+        except metadata.PackageNotFoundError:
+            versions[package] = None
+    return versions
+
+
+def parse_args(argv: List[str] = None) -> argparse.Namespace:
+    """Opções da linha de comando"""
+    parser = argparse.ArgumentParser(description='Benchmark dos caminhos críticos do backend')
+    parser.add_argument('--backend', choices=sorted(BACKENDS), default='fastapi')
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES), help='Quantidades de lotes')
+    parser.add_argument('--imoveis-ratio', type=float, default=0.1, help='Imóveis por lote')
+    parser.add_argument('--radii', type=float, nargs='+', default=list(DEFAULT_RADII), help='Raios de analyze_radius (m)')
+    parser.add_argument('--points', type=int, default=5, help='Centros sorteados para analyze_radius')
+    parser.add_argument('--sample', type=int, default=1000, help='Linhas da amostra de _geodataframe_to_geojson')
+    parser.add_argument('--limit', type=int, default=1000, help='Parâmetro limit dos endpoints GeoJSON')
+    parser.add_argument('--repeat', type=int, default=5, help='Repetições por caso')
+    parser.add_argument('--budget', type=float, default=60.0, help='Tempo máximo por caso (s)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'geo-benchmarks'))
+    parser.add_argument('--output', help='Arquivo JSON de saída (padrão: stdout)')
+    parser.add_argument('--scale', type=int, help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv: List[str] = None):
+    args = parse_args(argv)
+
+    # Processo filho: uma escala, resultado no arquivo indicado pelo pai
+    if args.scale is not None:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(run_scale(args, args.scale), f)
+        return
+
+    # Cada escala em processo próprio: memória limpa e pico de RSS por escala
+    results = []
+    forwarded = list(argv if argv is not None else sys.argv[1:])
+    if '--output' in forwarded:
+        position = forwarded.index('--output')
+        del forwarded[position:position + 2]
+    for scale in args.sizes:
+        with tempfile.NamedTemporaryFile(suffix='.json') as partial:
+            subprocess.run(
+                [sys.executable, os.path.abspath(__file__), *forwarded,
+                 '--scale', str(scale), '--output', partial.name],
+                check=True
+            )
+            with open(partial.name, encoding='utf-8') as f:
+                results.extend(json.load(f))
+
+    report = {
+        'meta': {
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'backend': args.backend,
+            'git_commit': _git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'packages': _versions(),
+            'params': {
+                key: value for key, value in vars(args).items() if key not in ('output', 'scale', 'data_dir')
+            },
+        },
+        'results': results,
+    }
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        _log(f'resultado gravado em {args.output}')
+    else:
+        json.dump(report, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
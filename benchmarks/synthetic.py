@@ -0,0 +1,183 @@
+"""
+Gerador de dados sintéticos com o esquema real de lotes e imóveis de Vitória
+
+Os lotes são retângulos rotacionados ao longo de ruas de cada bairro, com os
+centros distribuídos em torno das coordenadas aproximadas dos bairros; os
+imóveis são pontos dentro de lotes sorteados, com endereço do próprio lote.
+A mesma semente gera sempre os mesmos arquivos.
+"""
+
+import os
+from typing import Dict, Tuple
+
+import numpy as np
+import pandas as pd
+import shapely
+
+
+# Bairros: (latitude, longitude, peso relativo na quantidade de lotes)
+BAIRROS = {
+    'Centro': (-20.3195, -40.3378, 1.0),
+    'Santo Antônio': (-20.3160, -40.3480, 0.8),
+    'Jucutuquara': (-20.3080, -40.3220, 0.6),
+    'Maruípe': (-20.3000, -40.3250, 0.8),
+    'Bento Ferreira': (-20.3090, -40.3130, 0.7),
+    'Santa Lúcia': (-20.2950, -40.2990, 0.5),
+    'Praia do Suá': (-20.3120, -40.2990, 0.5),
+    'Enseada do Suá': (-20.3140, -40.2930, 0.4),
+    'Praia do Canto': (-20.2975, -40.2950, 1.0),
+    'Santa Helena': (-20.3000, -40.3050, 0.4),
+    'Mata da Praia': (-20.2770, -40.2900, 0.7),
+    'Jardim da Penha': (-20.2830, -40.2950, 1.2),
+    'República': (-20.2700, -40.2980, 0.5),
+    'Goiabeiras': (-20.2720, -40.3060, 0.6),
+    'Jardim Camburi': (-20.2640, -40.2660, 1.5),
+}
+
+# Dispersão dos lotes em torno do centro do bairro (metros)
+BAIRRO_SPREAD_METERS = 450.0
+
+# Logradouros sintéticos por bairro
+STREETS_PER_BAIRRO = 40
+
+# Tratamentos urbanísticos: (sigla, ca, to, limite_altura)
+TRATAMENTOS = [
+    ('ZOC 1', 1.2, 0.6, 12.0),
+    ('ZOC 2', 2.0, 0.5, 24.0),
+    ('ZOC 3', 3.0, 0.5, 45.0),
+    ('ZOP 1', 1.0, 0.6, 9.0),
+    ('ZEIS 1', 1.5, 0.7, 9.0),
+    ('ZPA 2', 0.3, 0.2, 6.0),
+]
+
+INCORPORADORES = [
+    'Construtora Litoral', 'Morar Incorporações', 'Grand Construtora', 'Vitória Empreendimentos',
+    'Ilha Engenharia', 'Capixaba Incorporadora', 'Atlântico Construções', 'Serra Azul Incorporações',
+]
+STATUS = ['Lançamento', 'Em Construção', 'Pronto']
+OCUPACOES = ['Residencial', 'Comercial', 'Misto', 'Institucional', 'Vago']
+TIPOS_CONSTRUCAO = ['Casa', 'Apartamento', 'Loja', 'Galpão', 'Sala']
+
+METERS_PER_DEGREE = 111320.0
+
+
+def _offsets_to_degrees(dx: np.ndarray, dy: np.ndarray, lat: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Deslocamentos em metros convertidos para graus de longitude e latitude"""
+    return dx / (METERS_PER_DEGREE * np.cos(np.radians(lat))), dy / METERS_PER_DEGREE
+
+
+def generate_lotes(n: int, seed: int = 0) -> pd.DataFrame:
+    """Lotes com as colunas do cadastro de Vitória e geometria GeoJSON (texto)"""
+    rng = np.random.default_rng(seed)
+    names = list(BAIRROS)
+    centers = np.array([BAIRROS[name][:2] for name in names])
+    weights = np.array([BAIRROS[name][2] for name in names])
+
+    bairro_id = rng.choice(len(names), size=n, p=weights / weights.sum())
+    street_id = rng.integers(0, STREETS_PER_BAIRRO, n)
+
+    # Centros dos lotes: gaussiana em torno do bairro, ruas como faixas paralelas
+    dx = rng.normal(0, BAIRRO_SPREAD_METERS, n)
+    dy = (street_id - STREETS_PER_BAIRRO / 2) * (2 * BAIRRO_SPREAD_METERS / STREETS_PER_BAIRRO) + rng.normal(0, 8, n)
+    angle = np.radians(bairro_id * 17 % 90)
+    rx = dx * np.cos(angle) - dy * np.sin(angle)
+    ry = dx * np.sin(angle) + dy * np.cos(angle)
+    lat = centers[bairro_id, 0]
+    dlon, dlat = _offsets_to_degrees(rx, ry, lat)
+    center_lon = centers[bairro_id, 1] + dlon
+    center_lat = lat + dlat
+
+    # Retângulo testada x profundidade, alinhado à rua
+    testada = rng.uniform(10, 20, n)
+    profundidade = rng.uniform(20, 40, n)
+    corners = np.array([[-0.5, -0.5], [0.5, -0.5], [0.5, 0.5], [-0.5, 0.5], [-0.5, -0.5]])
+    cx = corners[:, 0][None, :] * testada[:, None]
+    cy = corners[:, 1][None, :] * profundidade[:, None]
+    px = cx * np.cos(angle)[:, None] - cy * np.sin(angle)[:, None]
+    py = cx * np.sin(angle)[:, None] + cy * np.cos(angle)[:, None]
+    plon, plat = _offsets_to_degrees(px, py, center_lat[:, None])
+    coords = np.stack([center_lon[:, None] + plon, center_lat[:, None] + plat], axis=-1)
+    geometry = shapely.to_geojson(shapely.polygons(coords))
+
+    # Números crescentes ao longo da rua (pela posição em dx)
+    numero = np.clip(np.round((dx + 3 * BAIRRO_SPREAD_METERS) / 3), 1, None).astype(np.int64)
+
+    tratamento = rng.integers(0, len(TRATAMENTOS), n)
+    siglas, ca, to, altura_max = (np.array(values) for values in zip(*TRATAMENTOS))
+    pavimentos = rng.integers(1, 16, n)
+    bairro = np.array(names, dtype=object)[bairro_id]
+
+    return pd.DataFrame({
+        'codLote': np.char.add('L', np.arange(n).astype(str)).astype(object),
+        'logradouro': [f'Rua {street + 1} de {name}' for street, name in zip(street_id, bairro)],
+        'numero': numero.astype(str).astype(object),
+        'bairro': bairro,
+        'sigla_trat': siglas[tratamento].astype(object),
+        'area_terreno': np.round(testada * profundidade, 2),
+        'ca': ca[tratamento],
+        'to': to[tratamento],
+        'limite_altura': altura_max[tratamento],
+        'afast_frontal': rng.choice([0.0, 3.0, 5.0], n),
+        'limite_embasamento': rng.choice([0.0, 7.5, 10.0], n),
+        'gabarito': (np.floor(altura_max[tratamento] / 3).astype(np.int64)).astype(str).astype(object),
+        'altura': np.round(pavimentos * 3.0, 1),
+        'geometry': geometry.astype(object),
+        'inscricaoImobiliaria': np.char.zfill(np.arange(n).astype(str), 9).astype(object),
+        'tipoConstrucao': rng.choice(TIPOS_CONSTRUCAO, n).astype(object),
+        'numeroPavimentos': pavimentos,
+        'ocupacao': rng.choice(OCUPACOES, n).astype(object),
+    })
+
+
+def generate_imoveis(n: int, lotes: pd.DataFrame, seed: int = 0) -> pd.DataFrame:
+    """Imóveis (pontos no centroide de lotes sorteados) com as colunas do cadastro de lançamentos"""
+    rng = np.random.default_rng(seed + 1)
+    index = rng.integers(0, len(lotes), n)
+    centroids = shapely.centroid(shapely.from_geojson(lotes['geometry'].to_numpy()[index]))
+
+    dormitorios = rng.integers(1, 5, n)
+    metragem = np.round(rng.uniform(25, 60, n) * dormitorios, 2)
+    preco_m2 = rng.lognormal(np.log(9000), 0.3, n)
+    unidades = rng.integers(8, 200, n)
+    vendidas = np.floor(unidades * rng.uniform(0, 1, n)).astype(np.int64)
+
+    return pd.DataFrame({
+        'Incorporador': rng.choice(INCORPORADORES, n).astype(object),
+        'Empreendimento': np.char.add('Residencial ', np.arange(n).astype(str)).astype(object),
+        'Bairro': lotes['bairro'].to_numpy()[index],
+        'Endereco': (lotes['logradouro'].to_numpy()[index] + ', ' + lotes['numero'].to_numpy()[index]),
+        'Cidade': 'Vitória',
+        'Dormitorios': dormitorios,
+        'Metragem Privativa': metragem,
+        'Vagas': rng.integers(0, 4, n),
+        'Preco Total': np.round(metragem * preco_m2, 2),
+        'Status': rng.choice(STATUS, n).astype(object),
+        'Unidades Total': unidades,
+        'Unidades Vendidas': vendidas,
+        'Estoque Atual': unidades - vendidas,
+        'geometry': shapely.to_geojson(centroids).astype(object),
+    })
+
+
+def write_dataset(directory: str, n_lotes: int, n_imoveis: int, seed: int = 0) -> Dict[str, str]:
+    """
+    Grava lotes.parquet e imoveis.parquet em `directory`/<escala>-<semente>
+
+    Arquivos já gerados com os mesmos parâmetros são reaproveitados.
+    """
+    target = os.path.join(directory, f'{n_lotes}-{n_imoveis}-{seed}')
+    paths = {
+        'lotes': os.path.join(target, 'lotes.parquet'),
+        'imoveis': os.path.join(target, 'imoveis.parquet'),
+    }
+    if all(os.path.exists(path) for path in paths.values()):
+        return paths
+
+    os.makedirs(target, exist_ok=True)
+    lotes = generate_lotes(n_lotes, seed)
+    imoveis = generate_imoveis(n_imoveis, lotes, seed)
+    for layer, frame in (('lotes', lotes), ('imoveis', imoveis)):
+        staging = paths[layer] + '.tmp'
+        frame.to_parquet(staging, index=False)
+        os.replace(staging, paths[layer])
+    return paths
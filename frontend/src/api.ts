@@ -9,11 +9,21 @@ const api = axios.create({
   },
 });
 
+// Dataset enviado em todas as requisições (parâmetro `dataset`; padrão 'default' no backend)
+let currentDataset: string | undefined;
+
+export const setDataset = (name?: string) => {
+  currentDataset = name;
+  api.defaults.params = name ? { dataset: name } : {};
+};
+
 export interface AnalysisRequest {
   latitude: number;
   longitude: number;
   radius_meters: number;
   filters?: Record<string, any>;
+  approximate?: boolean;
+  refine?: boolean;
 }
 
 export interface AnalysisResponse {
@@ -27,6 +37,7 @@ export interface AnalysisResponse {
   };
   lotes: GeoJSONFeature[];
   imoveis: GeoJSONFeature[];
+  aproximacao?: Record<string, any>;
 }
 
 export interface GeoJSONFeature {
@@ -45,6 +56,7 @@ export interface UploadResponse {
   records_count: number;
   file_type: string;
   columns: string[];
+  geocoding?: Record<string, number> | null;
 }
 
 export interface Stats {
@@ -71,24 +83,179 @@ export interface Bounds {
 }
 
 // API Calls
-export const uploadLotes = async (file: File): Promise<UploadResponse> => {
+export interface DatasetInfo {
+  estado: 'memoria' | 'disco' | 'removido';
+  ultimo_acesso: string | null;
+  descartes: number;
+  recargas: number;
+  versao?: number;
+  lotes?: number;
+  imoveis?: number;
+  memoria_bytes?: { lotes: number; imoveis: number; juncao: number; cache: number; total: number };
+  snapshot_bytes?: number;
+  erro?: string;
+}
+
+export const getDatasets = async (): Promise<{
+  orcamento_bytes: number;
+  residente_bytes: number;
+  datasets: Record<string, DatasetInfo>;
+}> => {
+  const response = await api.get('/datasets');
+  return response.data;
+};
+
+export interface UploadJob {
+  id: string;
+  camada: 'lotes' | 'imoveis';
+  dataset: string;
+  arquivo: string;
+  estado: 'na_fila' | 'executando' | 'concluido' | 'erro';
+  fase: string | null;
+  linhas: number | null;
+  linhas_processadas: number;
+  bytes: number;
+  linhas_por_segundo: number | null;
+  mb_por_segundo: number | null;
+  etapas_s: Record<string, number>;
+  resultado: UploadResponse | null;
+  erro: string | null;
+  criado_em: string;
+  iniciado_em: string | null;
+  concluido_em: string | null;
+  duracao_s: number | null;
+}
+
+export const getJob = async (id: string): Promise<UploadJob> => {
+  const response = await api.get(`/jobs/${id}`);
+  return response.data;
+};
+
+// Uploads retornam um job (202); o resultado chega quando a carga em segundo plano termina
+const uploadAndWait = async (
+  layer: 'lotes' | 'imoveis',
+  file: File,
+  onProgress?: (job: UploadJob) => void
+): Promise<UploadResponse> => {
   const formData = new FormData();
   formData.append('file', file);
 
-  const response = await api.post('/upload/lotes', formData, {
+  const response = await api.post(`/upload/${layer}`, formData, {
     headers: {
       'Content-Type': 'multipart/form-data',
     },
   });
 
+  let job: UploadJob = response.data;
+  while (job.estado === 'na_fila' || job.estado === 'executando') {
+    onProgress?.(job);
+    await new Promise((resolve) => setTimeout(resolve, 500));
+    job = await getJob(job.id);
+  }
+  if (job.estado === 'erro' || !job.resultado) {
+    throw new Error(job.erro || 'Falha no processamento do arquivo');
+  }
+  return job.resultado;
+};
+
+export const uploadLotes = (file: File, onProgress?: (job: UploadJob) => void): Promise<UploadResponse> =>
+  uploadAndWait('lotes', file, onProgress);
+
+export const uploadImoveis = (file: File, onProgress?: (job: UploadJob) => void): Promise<UploadResponse> =>
+  uploadAndWait('imoveis', file, onProgress);
+
+export const analyzeArea = async (request: AnalysisRequest): Promise<AnalysisResponse> => {
+  const response = await api.post('/analyze', request);
   return response.data;
 };
 
-export const uploadImoveis = async (file: File): Promise<UploadResponse> => {
+export interface PolygonAnalysisRequest {
+  geometry: any;
+  filters?: Record<string, any>;
+  match?: 'intersects' | 'within' | 'centroid';
+}
+
+export interface PolygonAnalysisResponse extends Omit<AnalysisResponse, 'point' | 'radius_meters'> {
+  geometry: any;
+  match: string;
+  area_m2: number;
+}
+
+export const analyzePolygon = async (request: PolygonAnalysisRequest): Promise<PolygonAnalysisResponse> => {
+  const response = await api.post('/analyze/polygon', request);
+  return response.data;
+};
+
+export interface RingsAnalysisRequest {
+  latitude: number;
+  longitude: number;
+  radii: number[];
+  filters?: Record<string, any>;
+  include_features?: boolean;
+}
+
+export interface RingSummary {
+  lotes_encontrados: number;
+  imoveis_encontrados: number;
+  estatisticas: AnalysisResponse['estatisticas'];
+}
+
+export interface RingsAnalysisResponse {
+  point: { latitude: number; longitude: number };
+  radii: number[];
+  rings: (RingSummary & { radius_inner: number; radius_outer: number })[];
+  cumulative: (RingSummary & { radius_meters: number })[];
+  lotes?: GeoJSONFeature[];
+  imoveis?: GeoJSONFeature[];
+}
+
+export const analyzeRings = async (request: RingsAnalysisRequest): Promise<RingsAnalysisResponse> => {
+  const response = await api.post('/analyze/rings', request);
+  return response.data;
+};
+
+export interface PartitionedAnalysisRequest {
+  latitude: number;
+  longitude: number;
+  radius_meters?: number;
+  filters?: Record<string, any>;
+  include_features?: boolean;
+}
+
+export interface PartitionIO {
+  particoes: number;
+  particoes_ignoradas: number;
+  arquivos: number;
+  row_groups_lidos: number;
+  row_groups_ignorados: number;
+  row_groups_cache: number;
+  linhas_lidas: number;
+}
+
+export interface PartitionedAnalysisResponse extends RingSummary {
+  point: { latitude: number; longitude: number };
+  radius_meters: number;
+  particoes: { lotes: PartitionIO; imoveis: PartitionIO };
+  lotes?: GeoJSONFeature[];
+  imoveis?: GeoJSONFeature[];
+}
+
+export interface PartitionedIngestResponse {
+  layer: 'lotes' | 'imoveis';
+  linhas: number;
+  gravadas: number;
+  sem_geometria: number;
+  geocodificacao: Record<string, number> | null;
+}
+
+export const uploadPartitioned = async (
+  layer: 'lotes' | 'imoveis',
+  file: File
+): Promise<PartitionedIngestResponse> => {
   const formData = new FormData();
   formData.append('file', file);
 
-  const response = await api.post('/upload/imoveis', formData, {
+  const response = await api.post(`/upload/partitioned/${layer}`, formData, {
     headers: {
       'Content-Type': 'multipart/form-data',
     },
@@ -97,8 +264,71 @@ export const uploadImoveis = async (file: File): Promise<UploadResponse> => {
   return response.data;
 };
 
-export const analyzeArea = async (request: AnalysisRequest): Promise<AnalysisResponse> => {
-  const response = await api.post('/analyze', request);
+export const analyzePartitioned = async (request: PartitionedAnalysisRequest): Promise<PartitionedAnalysisResponse> => {
+  const response = await api.post('/analyze/partitioned', request);
+  return response.data;
+};
+
+export const getPartitionedStatus = async (): Promise<Record<string, any>> => {
+  const response = await api.get('/partitioned');
+  return response.data;
+};
+
+export interface AnalysisStreamHandlers {
+  onStats: (stats: Omit<AnalysisResponse, 'lotes' | 'imoveis'>) => void;
+  onFeatures: (chunk: { offset: number; lotes: GeoJSONFeature[]; imoveis: GeoJSONFeature[] }) => void;
+  onDone?: () => void;
+  onError?: (detail: string) => void;
+}
+
+// Retorna uma função que cancela o streaming
+export const streamAnalysis = (
+  request: AnalysisRequest & { chunk_size?: number },
+  handlers: AnalysisStreamHandlers
+): (() => void) => {
+  const params = new URLSearchParams({
+    latitude: request.latitude.toString(),
+    longitude: request.longitude.toString(),
+    radius_meters: request.radius_meters.toString(),
+  });
+  if (request.filters) params.append('filters', JSON.stringify(request.filters));
+  if (request.chunk_size) params.append('chunk_size', request.chunk_size.toString());
+  if (currentDataset) params.append('dataset', currentDataset);
+
+  const source = new EventSource(`${API_BASE_URL}/analyze/stream?${params.toString()}`);
+  source.addEventListener('stats', (event) => handlers.onStats(JSON.parse((event as MessageEvent).data)));
+  source.addEventListener('features', (event) => handlers.onFeatures(JSON.parse((event as MessageEvent).data)));
+  source.addEventListener('done', () => {
+    source.close();
+    handlers.onDone?.();
+  });
+  source.addEventListener('error', (event) => {
+    const data = (event as MessageEvent).data;
+    source.close();
+    handlers.onError?.(data ? JSON.parse(data).detail : 'Conexão interrompida');
+  });
+
+  return () => source.close();
+};
+
+export interface NearestRequest {
+  latitude: number;
+  longitude: number;
+  k?: number;
+  filters?: Record<string, any>;
+  layer?: 'all' | 'lotes' | 'imoveis';
+  max_distance?: number;
+}
+
+export interface NearestResponse {
+  point: { latitude: number; longitude: number };
+  k: number;
+  lotes: GeoJSONFeature[];
+  imoveis: GeoJSONFeature[];
+}
+
+export const getNearest = async (request: NearestRequest): Promise<NearestResponse> => {
+  const response = await api.post('/nearest', request);
   return response.data;
 };
 
@@ -120,6 +350,15 @@ export const getImoveisGeoJSON = async (bairro?: string, limit?: number): Promis
   return response.data;
 };
 
+export const getImoveisClusters = async (
+  bbox: [number, number, number, number],
+  zoom: number
+): Promise<GeoJSONCollection & { zoom: number }> => {
+  const params = new URLSearchParams({ bbox: bbox.join(','), zoom: zoom.toString() });
+  const response = await api.get(`/imoveis/clusters?${params.toString()}`);
+  return response.data;
+};
+
 export const getBounds = async (): Promise<Bounds> => {
   const response = await api.get('/bounds');
   return response.data;
@@ -130,6 +369,117 @@ export const getStats = async (): Promise<Stats> => {
   return response.data;
 };
 
+export const getGridAggregate = async (
+  cellSize: number = 500,
+  gridType: 'square' | 'hex' = 'square'
+): Promise<GeoJSONCollection> => {
+  const params = new URLSearchParams();
+  params.append('cell_size', cellSize.toString());
+  params.append('grid_type', gridType);
+
+  const response = await api.get(`/aggregate/grid?${params.toString()}`);
+  return response.data;
+};
+
+export interface InterpolationRequest {
+  method?: 'idw' | 'kriging';
+  attribute?: string;
+  cell_size?: number;
+  points?: { latitude: number; longitude: number }[];
+  k?: number;
+  max_distance?: number;
+  power?: number;
+  model?: 'spherical' | 'exponential' | 'gaussian';
+  sill?: number;
+  range_meters?: number;
+  nugget?: number;
+}
+
+export const interpolate = async (request: InterpolationRequest): Promise<Record<string, any>> => {
+  const response = await api.post('/interpolate', request);
+  return response.data;
+};
+
+export interface VariogramRequest {
+  attribute?: string;
+  max_lag?: number;
+  n_lags?: number;
+  directions?: number[];
+  tolerance?: number;
+  sample_fraction?: number;
+  max_points?: number;
+  model?: 'auto' | 'spherical' | 'exponential' | 'gaussian' | null;
+  memory_budget_mb?: number;
+  seed?: number;
+}
+
+export const getVariogram = async (request: VariogramRequest): Promise<Record<string, any>> => {
+  const response = await api.post('/variogram', request);
+  return response.data;
+};
+
+export interface MarkovRequest {
+  layer?: 'imoveis' | 'lotes';
+  attribute?: string;
+  n_classes?: number;
+  weights?: 'knn' | 'distance';
+  k?: number;
+  threshold?: number;
+  period_column?: string;
+  id_column?: string;
+}
+
+export const getMarkov = async (request: MarkovRequest): Promise<Record<string, any>> => {
+  const response = await api.post('/markov', request);
+  return response.data;
+};
+
+export interface AutocorrelationRequest {
+  layer?: 'imoveis' | 'lotes';
+  attribute?: string;
+  weights?: 'knn' | 'distance';
+  k?: number;
+  threshold?: number;
+  permutations?: number;
+  significance?: number;
+  seed?: number;
+}
+
+export const getAutocorrelation = async (request: AutocorrelationRequest): Promise<GeoJSONCollection & Record<string, any>> => {
+  const response = await api.post('/autocorrelation', { ...request, format: 'geojson' });
+  return response.data;
+};
+
+export type CubeDimension = 'bairro' | 'dormitorios' | 'status' | 'incorporador';
+
+export interface CubeRequest {
+  dimensions?: CubeDimension[];
+  filters?: Partial<Record<CubeDimension, any>>;
+}
+
+export interface CubeRow {
+  imoveis: number;
+  unidades: number;
+  vendidas: number;
+  estoque: number;
+  preco_m2_medio: number | null;
+  vendas_pct: number | null;
+  [dimension: string]: any;
+}
+
+export interface CubeResponse {
+  version: number;
+  dimensions: CubeDimension[];
+  filters: Record<string, any>;
+  total: CubeRow;
+  rows: CubeRow[];
+}
+
+export const getCube = async (request: CubeRequest = {}): Promise<CubeResponse> => {
+  const response = await api.post('/cube', request);
+  return response.data;
+};
+
 export const healthCheck = async (): Promise<{ status: string; timestamp: string; version: string }> => {
   const response = await api.get('/health');
   return response.data;